@@ -2,12 +2,42 @@
 This module acts as the only interface point between other apps and the database backend for the content.
 It exposes several convenience functions for accessing content
 """
+import io
+import itertools
+import uuid
+from collections import OrderedDict
 from functools import wraps
 
+from django.conf import settings
 from django.core.files import File as DjFile
+from django.db import IntegrityError, connections, transaction
 from django.db.models import Q
 from kolibri.content import models as KolibriContent
-from kolibri.content.utils import validate
+from kolibri.content.utils import (
+    aggregates, channel_export, channel_import, graph, identity_map,
+    search as content_search, tree, validate
+)
+from kolibri.content.utils.channels import channel_databases
+
+# sqlite's default limit on the number of parameters of a query
+SQLITE_MAX_VARIABLES = 999
+
+BULK_BATCH_SIZE = 500
+
+# the fields of the nodes of get_subtree, enough to draw an outline of a channel
+SUBTREE_FIELDS = ('content_id', 'title', 'kind', 'available')
+
+# the fields of ContentMetadata that get_subtree can be asked for besides those
+SUBTREE_FIELD_CHOICES = SUBTREE_FIELDS + ('description', 'slug', 'total_file_size', 'sort_order', 'license_owner')
+
+# the most levels get_subtree reads below a node, unless CONTENT_SUBTREE_MAX_DEPTH says otherwise
+DEFAULT_SUBTREE_MAX_DEPTH = 10
+
+# the fields of the children navigation_children lists, what a topic page draws for each of them
+NAVIGATION_FIELDS = ('content_id', 'title', 'kind', 'available', 'sort_order')
+
+# the qualities get_best_files picks from when not told otherwise, best first
+QUALITY_PREFERENCE = ('high', 'normal', 'low')
 
 """ContentDB API methods"""
 
@@ -22,19 +52,44 @@ def can_get_content_with_id(func):
         content1 = kwargs.get('content1')
         content2 = kwargs.get('content2')
 
-        if isinstance(content, KolibriContent.ContentMetadata) or \
-                (isinstance(content1, KolibriContent.ContentMetadata) and isinstance(content2, KolibriContent.ContentMetadata)):
-            pass
-        elif validate.is_valid_uuid(content):
-            kwargs['content'] = KolibriContent.ContentMetadata.objects.using(channel_id).get(content_id=content)
-        elif validate.is_valid_uuid(content1) and validate.is_valid_uuid(content2):
-            kwargs['content1'] = KolibriContent.ContentMetadata.objects.using(channel_id).get(content_id=content1)
-            kwargs['content2'] = KolibriContent.ContentMetadata.objects.using(channel_id).get(content_id=content2)
-        else:
-            raise TypeError("must provide a ContentMetadata object or a UUID content_id")
-        return func(channel_id=channel_id, **kwargs)
+        with identity_map.content_identity_map() as contents:
+            if isinstance(content, KolibriContent.ContentMetadata) or \
+                    (isinstance(content1, KolibriContent.ContentMetadata) and isinstance(content2, KolibriContent.ContentMetadata)):
+                pass
+            elif validate.is_valid_uuid(content):
+                kwargs['content'] = _get_content(contents, channel_id, content)
+            elif validate.is_valid_uuid(content1) and validate.is_valid_uuid(content2):
+                kwargs['content1'] = _get_content(contents, channel_id, content1)
+                kwargs['content2'] = _get_content(contents, channel_id, content2)
+            else:
+                raise TypeError("must provide a ContentMetadata object or a UUID content_id")
+            return func(channel_id=channel_id, **kwargs)
     return wrapper
 
+def _get_content(contents, channel_id, content_id):
+    # resolve a content id through the active identity map, so each node is loaded once per request
+    return contents.get(channel_id, content_id, lambda: KolibriContent.ContentMetadata.objects.using(channel_id).get(content_id=content_id))
+
+def _from_tree(channel_id, content, answer):
+    """
+    Answer a navigation question from the in-memory tree of the channel, if ``CONTENT_TREE_CACHE`` is set,
+    with a single lookup by id of the ContentMetadata in the answer, or none at all if the answer is empty.
+
+    :param answer: function taking the ChannelTree and returning ContentMetadata ids
+    :return: QuerySet of ContentMetadata in tree order, or None if the question has to be answered by the database
+    """
+    if not tree.is_enabled():
+        return None
+    channel_tree = tree.channel_tree(channel_id)
+    if content.id not in channel_tree:
+        return None
+    ids = answer(channel_tree)
+    if not ids:
+        return KolibriContent.ContentMetadata.objects.using(channel_id).none()
+    if len(ids) > SQLITE_MAX_VARIABLES:
+        return None
+    return KolibriContent.ContentMetadata.objects.using(channel_id).filter(id__in=ids).order_by('tree_id', 'lft')
+
 def get_content_with_id(channel_id=None, content=None):
     """
     Get arbitrary sets of ContentMetadata objects based on content id(s).
@@ -48,6 +103,29 @@ def get_content_with_id(channel_id=None, content=None):
     else:
         return KolibriContent.ContentMetadata.objects.using(channel_id).filter(content_id=content)
 
+def get_contents_in_order(channel_id=None, contents=None):
+    """
+    Get many ContentMetadata objects by content id at once, in the order of the content ids, with one query
+    per chunk of content ids as long as sqlite's limit on query parameters allows.
+    Content ids given more than once are only returned the first time, and those that don't exist are left out.
+
+    :param channel_id: str
+    :param contents: iterable of str or uuid
+    :return: list of ContentMetadata
+    :raises TypeError: if a content id is not a UUID
+    """
+    content_ids = []
+    for content in contents:
+        if not validate.is_valid_uuid(str(content)):
+            raise TypeError("must provide UUID content_ids")
+        content_ids.append(str(uuid.UUID(str(content))))
+    content_ids = list(OrderedDict.fromkeys(content_ids))
+    found = {}
+    for chunk in _chunks(content_ids, SQLITE_MAX_VARIABLES):
+        for content in get_content_with_id(channel_id=channel_id, content=chunk):
+            found[str(content.content_id)] = content
+    return [found[content_id] for content_id in content_ids if content_id in found]
+
 @can_get_content_with_id
 def get_ancestor_topics(channel_id=None, content=None, **kwargs):
     """"
@@ -57,7 +135,45 @@ def get_ancestor_topics(channel_id=None, content=None, **kwargs):
     :param content: ContentMetadata or str
     :return: QuerySet of ContentMetadata
     """
-    return content.get_ancestors().filter(kind="topic").using(channel_id)
+    found = _from_tree(channel_id, content, lambda channel_tree: channel_tree.ancestors(content.id, kind="topic"))
+    return found if found is not None else content.get_ancestors().filter(kind="topic").using(channel_id)
+
+def get_ancestor_topics_bulk(channel_id=None, contents=None):
+    """
+    Get the ancestor topics of many contents at once, with a range join over the tree columns per chunk of content
+    ids as long as sqlite's limit on query parameters allows.
+    Ancestors shared by several contents are the same ContentMetadata object in every chain they appear in.
+
+    :param channel_id: str
+    :param contents: list of str (content ids)
+    :return: dict of content id to the list of its ancestor topics (ContentMetadata), from the root down
+    :raises TypeError: if a content id is not a UUID
+    """
+    if not all(validate.is_valid_uuid(str(content)) for content in contents):
+        raise TypeError("must provide a list of UUID content_ids")
+    if not contents:
+        return {}
+    alias = channel_databases.get_alias(channel_id)
+    content_id_field = KolibriContent.ContentMetadata._meta.get_field('content_id')
+    params = [content_id_field.get_db_prep_value(content, connections[alias]) for content in contents]
+    chains = {}
+    shared = {}
+    # one of the query parameters is the kind
+    for chunk in _chunks(params, SQLITE_MAX_VARIABLES - 1):
+        ancestors = KolibriContent.ContentMetadata.objects.raw(
+            'SELECT ancestor.*, node.content_id AS descendant_content_id '
+            'FROM {table} node JOIN {table} ancestor '
+            'ON ancestor.tree_id = node.tree_id AND ancestor.lft < node.lft AND ancestor.rght > node.rght '
+            'WHERE ancestor.kind = %s AND node.content_id IN ({placeholders}) '
+            'ORDER BY node.content_id, ancestor.lft'.format(
+                table=KolibriContent.ContentMetadata._meta.db_table, placeholders=', '.join(['%s'] * len(chunk))),
+            ['topic'] + chunk,
+            using=alias,
+        )
+        for ancestor in ancestors:
+            descendant = str(content_id_field.to_python(ancestor.descendant_content_id))
+            chains.setdefault(descendant, []).append(shared.setdefault(ancestor.pk, ancestor))
+    return dict((str(content), chains.get(str(content), [])) for content in contents)
 
 @can_get_content_with_id
 def immediate_children(channel_id=None, content=None, **kwargs):
@@ -68,7 +184,60 @@ def immediate_children(channel_id=None, content=None, **kwargs):
     :param content: ContentMetadata or str
     :return: QuerySet of ContentMetadata
     """
-    return content.get_children().using(channel_id)
+    found = _from_tree(channel_id, content, lambda channel_tree: channel_tree.children(content.id))
+    return found if found is not None else content.get_children().using(channel_id)
+
+@can_get_content_with_id
+def navigation_children(channel_id=None, content=None, **kwargs):
+    """
+    Get the immediate children of a ContentMetadata as plain dicts of the navigation fields and their number of
+    descendants, read with a single query and without building ContentMetadata instances. The number of descendants
+    comes from the MPTT columns of each child, a node spanning two lft/rght values per descendant.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :return: list of dict
+    """
+    children = KolibriContent.ContentMetadata.objects.using(channel_id).filter(parent=content).order_by('lft')
+    rows = list(children.values('lft', 'rght', *NAVIGATION_FIELDS))
+    for row in rows:
+        row['descendant_count'] = (row.pop('rght') - row.pop('lft') - 1) // 2
+    return rows
+
+@can_get_content_with_id
+def get_subtree(channel_id=None, content=None, depth=1, kind=None, fields=SUBTREE_FIELDS, **kwargs):
+    """
+    Get a ContentMetadata and its descendants down to depth levels below it as nested dicts, with a single query
+    over the MPTT range of the node. Every node has the given fields and its "children" in tree order, except the nodes
+    on the last level that have descendants, whose "children" are None as they haven't been loaded.
+    With kind="topic" only the topics are included, and "children" lists the subtopics. As only topics have children,
+    the subtopics of every topic above the last level are all there, and [] means the topic has none.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :param depth: int, number of levels below the node, capped by ``CONTENT_SUBTREE_MAX_DEPTH``
+    :param kind: str, "topic" to only include the topics, or None
+    :param fields: iterable of names of ContentMetadata fields
+    :return: dict
+    :raises ValueError: if kind is neither "topic" nor None
+    """
+    if kind not in (None, 'topic'):
+        raise ValueError("a subtree can only be restricted to topics, not to '%s'" % kind)
+    depth = min(depth, getattr(settings, 'CONTENT_SUBTREE_MAX_DEPTH', DEFAULT_SUBTREE_MAX_DEPTH))
+    last_level = content.level + depth
+    rows = KolibriContent.ContentMetadata.objects.using(channel_id).filter(
+        tree_id=content.tree_id, lft__gte=content.lft, rght__lte=content.rght, level__lte=last_level)
+    if kind is not None:
+        rows = rows.filter(Q(kind=kind) | Q(pk=content.pk))
+    nodes = {}
+    for row in rows.order_by('lft').values('id', 'parent_id', 'lft', 'rght', 'level', *fields):
+        pk, parent_id, lft, rght, level = [row.pop(key) for key in ('id', 'parent_id', 'lft', 'rght', 'level')]
+        row['children'] = None if level == last_level and rght > lft + 1 else []
+        nodes[pk] = row
+        # the parent of a topic is a topic too, unless the channel has content under a non-topic
+        if pk != content.pk and parent_id in nodes:
+            nodes[parent_id]['children'].append(row)
+    return nodes[content.pk]
 
 @can_get_content_with_id
 def leaves(channel_id=None, content=None, **kwargs):
@@ -79,7 +248,8 @@ def leaves(channel_id=None, content=None, **kwargs):
     :param content: ContentMetadata or str
     :return: QuerySet of ContentMetadata
     """
-    return content.get_leafnodes().using(channel_id)
+    found = _from_tree(channel_id, content, lambda channel_tree: channel_tree.leaves(content.id))
+    return found if found is not None else content.get_leafnodes().using(channel_id)
 
 @can_get_content_with_id
 def get_all_formats(channel_id=None, content=None, **kwargs):
@@ -132,6 +302,79 @@ def get_files_for_quality(channel_id=None, content=None, format_quality=None, **
     the_formats = get_possible_formats(channel_id=channel_id, content=content).filter(quality=format_quality)
     return KolibriContent.File.objects.using(channel_id).filter(format__in=the_formats)
 
+def _best_files(files, qualities, mimetypes):
+    """
+    Pick the best file of each content among files, which must have their format, mimetype and content selected.
+
+    :return: OrderedDict of content id to File, in the order the contents first appear in files
+    """
+    best = OrderedDict()
+    ranks = {}
+    for the_file in files:
+        the_format = the_file.format
+        content_id = str(the_format.contentmetadata.content_id)
+        rank = (
+            qualities.index(the_format.quality),
+            mimetypes.index(the_format.mimetype.machine_name) if mimetypes else 0,
+            the_file.pk,
+        )
+        if content_id not in ranks or rank < ranks[content_id]:
+            best[content_id] = the_file
+            ranks[content_id] = rank
+    return best
+
+def _available_files(channel_id, qualities, mimetypes):
+    files = KolibriContent.File.objects.using(channel_id).filter(available=True, format__quality__in=qualities)
+    if mimetypes:
+        files = files.filter(format__mimetype__machine_name__in=mimetypes)
+    return files.select_related('format__contentmetadata', 'format__mimetype')
+
+def get_best_files(channel_id=None, contents=None, qualities=QUALITY_PREFERENCE, mimetypes=None):
+    """
+    Get the best available file of each of many contents, with one query joining the files to their formats,
+    mimetypes and contents, instead of trying one quality after another per content.
+    A file of a quality earlier in qualities is better, then a file of a mimetype earlier in mimetypes.
+
+    :param channel_id: str
+    :param contents: iterable of str or uuid (content ids)
+    :param qualities: sequence of str, e.g. ("high", "normal", "low")
+    :param mimetypes: sequence of str (machine names), or None to accept any mimetype
+    :return: OrderedDict of content id to File, or None if the content has no available file, in the order of contents
+    :raises TypeError: if a content id is not a UUID
+    """
+    content_ids = []
+    for content in contents:
+        if not validate.is_valid_uuid(str(content)):
+            raise TypeError("must provide UUID content_ids")
+        content_ids.append(str(uuid.UUID(str(content))))
+    content_ids = list(OrderedDict.fromkeys(content_ids))
+    found = {}
+    # the other query parameters are the qualities, the mimetypes and available
+    chunk_size = SQLITE_MAX_VARIABLES - len(qualities) - len(mimetypes or ()) - 1
+    for chunk in _chunks(content_ids, chunk_size):
+        files = _available_files(channel_id, qualities, mimetypes).filter(format__contentmetadata__content_id__in=chunk)
+        found.update(_best_files(files, qualities, mimetypes))
+    return OrderedDict((content_id, found.get(content_id)) for content_id in content_ids)
+
+@can_get_content_with_id
+def get_best_files_for_topic(channel_id=None, content=None, qualities=QUALITY_PREFERENCE, mimetypes=None, **kwargs):
+    """
+    Get the best available file of each content under a topic, like get_best_files, with one range query over the
+    descendants of the topic.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :param qualities: sequence of str, e.g. ("high", "normal", "low")
+    :param mimetypes: sequence of str (machine names), or None to accept any mimetype
+    :return: OrderedDict of content id to File, in tree order, leaving out the contents with no available file
+    """
+    files = _available_files(channel_id, qualities, mimetypes).filter(
+        format__contentmetadata__tree_id=content.tree_id,
+        format__contentmetadata__lft__gte=content.lft,
+        format__contentmetadata__rght__lte=content.rght,
+    ).order_by('format__contentmetadata__lft')
+    return _best_files(files, qualities, mimetypes)
+
 @can_get_content_with_id
 def get_missing_files(channel_id=None, content=None, **kwargs):
     """
@@ -147,6 +390,25 @@ def get_missing_files(channel_id=None, content=None, **kwargs):
     else:
         return KolibriContent.File.objects.using(channel_id).filter(available=False, format__contentmetadata=content)
 
+@can_get_content_with_id
+def get_content_summary(channel_id=None, content=None, **kwargs):
+    """
+    Get the precomputed totals of the content and its descendants: number of descendants of each kind,
+    number of files and missing files, total size and available size.
+    Channel databases that haven't been upgraded to have the summaries get the totals of the content computed
+    from its subtree instead.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :return: ContentSummary
+    """
+    if aggregates.has_summary_table(channel_id):
+        try:
+            return KolibriContent.ContentSummary.objects.using(channel_id).get(contentmetadata=content)
+        except KolibriContent.ContentSummary.DoesNotExist:
+            pass
+    return aggregates.compute_summary(channel_id, content.pk)
+
 @can_get_content_with_id
 def get_all_prerequisites(channel_id=None, content=None, **kwargs):
     """
@@ -158,6 +420,72 @@ def get_all_prerequisites(channel_id=None, content=None, **kwargs):
     """
     return KolibriContent.ContentMetadata.objects.using(channel_id).filter(prerequisite=content)
 
+def _in_bulk(channel_id, ids):
+    """
+    Get the ContentMetadata objects with the given ids by id, with one query per chunk of ids
+    as long as sqlite's limit on query parameters allows.
+    """
+    by_id = {}
+    for chunk in _chunks(list(ids), SQLITE_MAX_VARIABLES):
+        by_id.update(KolibriContent.ContentMetadata.objects.using(channel_id).in_bulk(chunk))
+    return by_id
+
+def _in_order(channel_id, ids):
+    """
+    Get the ContentMetadata objects with the given ids, in the order of the ids.
+    """
+    by_id = _in_bulk(channel_id, ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+def _in_tree_order(channel_id, ids):
+    """
+    Get the ContentMetadata objects with the given ids, in tree order.
+    """
+    return sorted(_in_bulk(channel_id, ids).values(), key=lambda content: (content.tree_id, content.lft))
+
+@can_get_content_with_id
+def get_transitive_prerequisites(channel_id=None, content=None, **kwargs):
+    """
+    Get contents that are the direct or indirect prerequisites of this content.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :return: list of ContentMetadata, in tree order
+    """
+    return _in_tree_order(channel_id, graph.prerequisite_graph(channel_id).all_prerequisites(content.id))
+
+@can_get_content_with_id
+def get_transitive_dependents(channel_id=None, content=None, **kwargs):
+    """
+    Get contents that have this content as a direct or indirect prerequisite.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :return: list of ContentMetadata, in tree order
+    """
+    return _in_tree_order(channel_id, graph.prerequisite_graph(channel_id).all_dependents(content.id))
+
+@can_get_content_with_id
+def get_learning_order(channel_id=None, content=None, **kwargs):
+    """
+    Get all the prerequisites of this content in an order they can be learned in, followed by the content itself.
+
+    :param channel_id: str
+    :param content: ContentMetadata or str
+    :return: list of ContentMetadata
+    :raises PrerequisiteCycleError: if the prerequisites of the content form a closed loop
+    """
+    return _in_order(channel_id, graph.prerequisite_graph(channel_id).learning_order([content.id]))
+
+def get_prerequisite_cycle(channel_id=None):
+    """
+    Find prerequisite relationships of a channel that form a closed loop, e.g. in imported channel databases.
+
+    :param channel_id: str
+    :return: list of ContentMetadata, each one a prerequisite of the next and the last one of the first, empty if there is no loop
+    """
+    return _in_order(channel_id, graph.prerequisite_graph(channel_id).find_cycle()[::-1])
+
 @can_get_content_with_id
 def get_all_related(channel_id=None, content=None, **kwargs):
     """
@@ -165,9 +493,9 @@ def get_all_related(channel_id=None, content=None, **kwargs):
 
     :param channel_id: str
     :param content: ContentMetadata or str
-    :return: QuerySet of ContentMetadata
+    :return: list of ContentMetadata, in tree order
     """
-    return KolibriContent.ContentMetadata.objects.using(channel_id).filter(Q(relate_to=content) | Q(is_related=content))
+    return _in_tree_order(channel_id, graph.related_graph(channel_id).get(content.id, []))
 
 @can_get_content_with_id
 def set_prerequisite(channel_id=None, content1=None, content2=None, **kwargs):
@@ -178,7 +506,7 @@ def set_prerequisite(channel_id=None, content1=None, content2=None, **kwargs):
     :param content1: ContentMetadata or str
     :param content2: ContentMetadata or str
     """
-    KolibriContent.PrerequisiteContentRelationship.objects.using(channel_id).create(
+    KolibriContent.PrerequisiteContentRelationship.objects.using(channel_databases.writable_alias(channel_id)).create(
         contentmetadata_1=content1, contentmetadata_2=content2)
 
 @can_get_content_with_id
@@ -190,9 +518,115 @@ def set_is_related(channel_id=None, content1=None, content2=None, **kwargs):
     :param content1: ContentMetadata or str
     :param content2: ContentMetadata or str
     """
-    KolibriContent.RelatedContentRelationship.objects.using(channel_id).create(
+    KolibriContent.RelatedContentRelationship.objects.using(channel_databases.writable_alias(channel_id)).create(
         contentmetadata_1=content1, contentmetadata_2=content2)
 
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _content_pks(channel_id, content_ids):
+    """
+    Get the ids of the ContentMetadata with the given content ids,
+    with as few queries as sqlite's limit on query parameters allows.
+
+    :return: dict of content id to ContentMetadata id
+    """
+    pks = {}
+    for chunk in _chunks(sorted(content_ids), SQLITE_MAX_VARIABLES):
+        for content_id, pk in KolibriContent.ContentMetadata.objects.using(channel_id).filter(content_id__in=chunk).values_list('content_id', 'id'):
+            pks[str(content_id)] = pk
+    missing = set(content_ids).difference(pks)
+    if missing:
+        raise KolibriContent.ContentMetadata.DoesNotExist("No content with content_id %s" % ', '.join(sorted(missing)))
+    return pks
+
+def _resolve_pairs(channel_id, pairs):
+    """
+    Turn (content1, content2) pairs of ContentMetadata objects or content ids into pairs of ContentMetadata ids.
+    """
+    pairs = [tuple(
+        content if isinstance(content, KolibriContent.ContentMetadata) else str(uuid.UUID(str(content)))
+        for content in pair
+    ) for pair in pairs if _validate_pair(pair)]
+    pks = _content_pks(channel_id, set(content for pair in pairs for content in pair if not isinstance(content, KolibriContent.ContentMetadata)))
+    resolved = []
+    for pair in pairs:
+        content1, content2 = [content.pk if isinstance(content, KolibriContent.ContentMetadata) else pks[content] for content in pair]
+        if content1 == content2:
+            raise IntegrityError('Cannot self reference: %s' % pair[0])
+        resolved.append((content1, content2))
+    return resolved
+
+def _validate_pair(pair):
+    """
+    Check that pair is a pair of ContentMetadata objects or content ids.
+
+    :param pair: tuple or list
+    :return: True
+    :raises TypeError: if it isn't
+    """
+    if len(pair) != 2:
+        raise TypeError("must provide pairs of contents")
+    for content in pair:
+        if not isinstance(content, KolibriContent.ContentMetadata) and not validate.is_valid_uuid(str(content)):
+            raise TypeError("must provide a ContentMetadata object or a UUID content_id")
+    return True
+
+def set_prerequisites_bulk(channel_id=None, pairs=None):
+    """
+    Set many prerequisite relationships at once, content1 of each pair becoming a prerequisite of its content2.
+    The pairs are checked all together against the prerequisite graph of the channel, and written in one transaction,
+    so either all of them are set or none is. Relationships that are already set are skipped.
+
+    :param channel_id: str
+    :param pairs: iterable of (content1, content2), each a ContentMetadata or str
+    :return: int, the number of relationships created
+    :raises IntegrityError: if a pair references the same content twice, or the relationships would form a closed loop
+    """
+    existing = graph.prerequisite_graph(channel_id)
+    new_edges = [edge for edge in OrderedDict.fromkeys(_resolve_pairs(channel_id, pairs)) if not existing.is_prerequisite(*edge)]
+    cycle = graph.PrerequisiteGraph(itertools.chain(existing.edges(), new_edges)).find_cycle()
+    if cycle:
+        raise graph.PrerequisiteCycleError(cycle)
+    alias = channel_databases.writable_alias(channel_id)
+    with transaction.atomic(using=alias):
+        KolibriContent.PrerequisiteContentRelationship.objects.using(alias).bulk_create(
+            [KolibriContent.PrerequisiteContentRelationship(contentmetadata_1_id=content1, contentmetadata_2_id=content2)
+             for content1, content2 in new_edges],
+            batch_size=BULK_BATCH_SIZE,
+        )
+    # bulk_create doesn't send the post_save signals the graph and the channel version rely on
+    graph.invalidate_prerequisite_graph(channel_id)
+    channel_databases.mark_changed(channel_id)
+    return len(new_edges)
+
+def set_is_related_bulk(channel_id=None, pairs=None):
+    """
+    Set many is related relationships at once, in one transaction.
+    Pairs that are already related, either way round, are skipped.
+
+    :param channel_id: str
+    :param pairs: iterable of (content1, content2), each a ContentMetadata or str
+    :return: int, the number of relationships created
+    :raises IntegrityError: if a pair references the same content twice
+    """
+    related = graph.related_graph(channel_id)
+    new_pairs = OrderedDict()
+    for content1, content2 in _resolve_pairs(channel_id, pairs):
+        if content2 not in related.get(content1, ()):
+            new_pairs.setdefault((min(content1, content2), max(content1, content2)), (content1, content2))
+    alias = channel_databases.writable_alias(channel_id)
+    with transaction.atomic(using=alias):
+        KolibriContent.RelatedContentRelationship.objects.using(alias).bulk_create(
+            [KolibriContent.RelatedContentRelationship(contentmetadata_1_id=content1, contentmetadata_2_id=content2)
+             for content1, content2 in new_pairs.values()],
+            batch_size=BULK_BATCH_SIZE,
+        )
+    graph.invalidate_related_graph(channel_id)
+    channel_databases.mark_changed(channel_id)
+    return len(new_pairs)
+
 @can_get_content_with_id
 def children_of_kind(channel_id=None, content=None, kind=None, **kwargs):
     """
@@ -204,12 +638,27 @@ def children_of_kind(channel_id=None, content=None, kind=None, **kwargs):
     :param kind: str
     :return: QuerySet of ContentMetadata
     """
-    return content.get_descendants(include_self=False).filter(kind=kind).using(channel_id)
+    found = _from_tree(channel_id, content, lambda channel_tree: channel_tree.descendants(content.id, kind=kind))
+    return found if found is not None else content.get_descendants(include_self=False).filter(kind=kind).using(channel_id)
+
+def search(query=None, channel_ids=None, kinds=None, limit=content_search.DEFAULT_SEARCH_LIMIT):
+    """
+    Search the content of several channels at once, searching each channel database in parallel.
+    Channels that take longer than the search time budget are left out, and listed under "incomplete".
+
+    :param query: str
+    :param channel_ids: list of str, defaults to all the subscribed channels
+    :param kinds: list of str, only return content of these kinds
+    :param limit: int
+    :return: dict with the list of ranked "results" and the list of "incomplete" channel ids
+    """
+    return content_search.search(query or '', channel_ids=channel_ids, kinds=kinds, limit=limit)
 
 def update_content_copy(file_object=None, content_copy=None):
     """
     Update the File object you pass in with the content copy
     You can pass None on content_copy to remove the associated file on disk.
+    The File object is saved through the writable connection of its channel database.
 
     :param file_object: File
     :param content_copy: str
@@ -221,4 +670,28 @@ def update_content_copy(file_object=None, content_copy=None):
     else:
         file_object.content_copy = None
 
-    file_object.save()
+    using = file_object._state.db
+    if using:
+        using = channel_databases.writable_alias(using)
+    file_object.save(using=using)
+
+def import_channel(channel_id=None, path=None):
+    """
+    Import a channel export file, either a fixture or JSON lines, into the empty channel database of channel_id.
+
+    :param channel_id: str
+    :param path: str
+    :return: dict of model label to the number of rows imported
+    """
+    with io.open(path, encoding='utf-8') as export:
+        return channel_import.import_channel(channel_id, channel_import.read_channel_export(export))
+
+def export_channel(channel_id=None):
+    """
+    Export the content of a channel as a fixture that import_channel can read back, one piece of text at a time.
+
+    :param channel_id: str
+    :return: generator of str
+    """
+    # validate the channel now rather than once the export is being read
+    return channel_export.stream_channel_export(channel_databases.get_alias(channel_id))
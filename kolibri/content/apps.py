@@ -0,0 +1,37 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.apps import AppConfig
+
+
+class KolibriContentConfig(AppConfig):
+    name = 'kolibri.content'
+    label = 'content'
+    verbose_name = 'Kolibri Content'
+
+    def ready(self):
+        from django.db.models.signals import (
+            m2m_changed, post_delete, post_save
+        )
+        from kolibri.content.models import (
+            ContentMetadata, PrerequisiteContentRelationship,
+            RelatedContentRelationship
+        )
+        from kolibri.content.utils.channel_import import channel_models
+        from kolibri.content.utils.channels import (
+            channel_changed, channel_db_validated
+        )
+        from kolibri.content.utils.graph import (
+            prerequisites_changed, related_changed
+        )
+        from kolibri.content.utils.search import search_index_outdated
+        from kolibri.content.utils.warmup import start_warm_up
+        channel_db_validated.connect(search_index_outdated)
+        post_save.connect(prerequisites_changed, sender=PrerequisiteContentRelationship)
+        post_delete.connect(prerequisites_changed, sender=PrerequisiteContentRelationship)
+        post_save.connect(related_changed, sender=RelatedContentRelationship)
+        post_delete.connect(related_changed, sender=RelatedContentRelationship)
+        for model in channel_models():
+            post_save.connect(channel_changed, sender=model)
+            post_delete.connect(channel_changed, sender=model)
+        m2m_changed.connect(channel_changed, sender=ContentMetadata.tags.through)
+        start_warm_up()
@@ -0,0 +1,20 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from kolibri.content import api
+
+
+class Command(BaseCommand):
+    help = 'Imports a channel export (a fixture or JSON lines) into the channel database of a channel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channel_id')
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        try:
+            counts = api.import_channel(channel_id=options['channel_id'], path=options['path'])
+        except (IOError, ValueError) as e:
+            raise CommandError(str(e))
+        for label, count in sorted(counts.items()):
+            self.stdout.write('%s: %d' % (label, count))
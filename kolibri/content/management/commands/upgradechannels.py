@@ -0,0 +1,23 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from kolibri.content.utils.channel_import import upgrade_channel
+from kolibri.content.utils.channels import channel_databases
+from kolibri.content.utils.warmup import discover_channel_aliases
+
+
+class Command(BaseCommand):
+    help = 'Adds the indexes, full-text index and content summaries that channel databases created by older versions miss'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channel_ids', nargs='*', help='the channels to upgrade, all of them if none are given')
+
+    def handle(self, *args, **options):
+        if not channel_databases.upgrades_in_place:
+            raise CommandError('Channel databases are read-only (CONTENT_DB_READ_ONLY or CONTENT_DB_IMMUTABLE), not upgrading them in place')
+        for channel_id in options['channel_ids'] or discover_channel_aliases():
+            try:
+                upgrade_channel(channel_databases.get_alias(channel_id))
+            except KeyError as e:
+                raise CommandError(str(e))
+            self.stdout.write('Upgraded %s' % channel_id)
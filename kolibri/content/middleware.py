@@ -0,0 +1,17 @@
+from kolibri.content.utils.identity_map import (
+    activate_identity_map, deactivate_identity_map
+)
+
+
+class ContentIdentityMapMiddleware(object):
+    """
+    Keeps a content identity map active for the whole of every request,
+    see ``kolibri.content.utils.identity_map``.
+    """
+
+    def process_request(self, request):
+        activate_identity_map()
+
+    def process_response(self, request, response):
+        deactivate_identity_map()
+        return response
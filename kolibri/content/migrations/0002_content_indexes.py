@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-16 20:19
+from __future__ import unicode_literals
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contentmetadata',
+            name='content_id',
+            field=models.UUIDField(db_index=True, default=uuid.uuid4, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='contentmetadata',
+            name='kind',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.AlterIndexTogether(
+            name='contentmetadata',
+            index_together=set([('tree_id', 'lft')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-16 20:24
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0002_content_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentSummary',
+            fields=[
+                ('contentmetadata', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='content.ContentMetadata')),
+                ('kind_counts', models.TextField(default='{}')),
+                ('file_count', models.IntegerField(default=0)),
+                ('missing_file_count', models.IntegerField(default=0)),
+                ('total_file_size', models.BigIntegerField(default=0)),
+                ('available_file_size', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+# indexes on expressions need sqlite 3.9.0 or newer
+MIN_SQLITE_VERSION = (3, 9, 0)
+
+RELATED_PAIR_INDEX_SQL = (
+    # keep the first of relationships saved both ways round before older versions checked for them
+    'DELETE FROM content_relatedcontentrelationship WHERE id IN (SELECT b.id FROM content_relatedcontentrelationship a '
+    'JOIN content_relatedcontentrelationship b ON a.contentmetadata_1_id = b.contentmetadata_2_id '
+    'AND a.contentmetadata_2_id = b.contentmetadata_1_id AND a.id < b.id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS content_relatedcontentrelationship_pair ON content_relatedcontentrelationship '
+    '(min(contentmetadata_1_id, contentmetadata_2_id), max(contentmetadata_1_id, contentmetadata_2_id))',
+)
+
+
+def create_related_pair_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    database = schema_editor.connection.Database
+    if database.sqlite_version_info < MIN_SQLITE_VERSION:
+        logger.warning('Not adding the unique index on related content pairs, which needs sqlite %s or newer (found %s)',
+                       '.'.join(str(part) for part in MIN_SQLITE_VERSION), database.sqlite_version)
+        return
+    for sql in RELATED_PAIR_INDEX_SQL:
+        schema_editor.execute(sql)
+
+def drop_related_pair_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP INDEX IF EXISTS content_relatedcontentrelationship_pair')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0003_contentsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_related_pair_index, drop_related_pair_index),
+    ]
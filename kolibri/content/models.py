@@ -7,14 +7,17 @@ The ONLY public object is ContentMetadata
 from __future__ import print_function
 
 import hashlib
+import json
 import logging
 import os
 from uuid import uuid4
 
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
-from django.db import IntegrityError, OperationalError, connections, models
-from django.db.utils import ConnectionDoesNotExist
+from django.db import IntegrityError, models, router, transaction
+from kolibri.content.utils import aggregates, indexes
+from kolibri.content.utils.channels import channel_databases
+from kolibri.content.utils.graph import prerequisite_graph
 from mptt.models import MPTTModel, TreeForeignKey
 
 
@@ -51,20 +54,11 @@ class ContentManager(models.Manager):
 class ContentQuerySet(models.QuerySet):
     """
     Overrider QuerySet's using method to establish database conncetions at the first time that database is hitten.
+    The channel database is only validated once, see kolibri.content.utils.channels.ChannelDatabaseRegistry
     """
     def using(self, alias):
-        try:
-            connections[alias]
-        except ConnectionDoesNotExist:
-            connections.databases[alias] = {
-                'ENGINE': 'django.db.backends.sqlite3',
-                'NAME': os.path.join(settings.CONTENT_DB_DIR, alias+'.sqlite3'),
-            }
-        try:
-            if not connections[alias].introspection.table_names():
-                raise KeyError("ContentDB '%s' is empty!!" % str(alias))
-        except OperationalError:
-            raise KeyError("ContentDB '%s' doesn't exist!!" % str(alias))
+        if alias is not None:
+            alias = channel_databases.get_alias(alias)
         return super(ContentQuerySet, self).using(alias)
 
 class AbstractContent(models.Model):
@@ -85,10 +79,10 @@ class ContentMetadata(MPTTModel, AbstractContent):
     The top layer of the contentDB schema, defines the most common properties that are shared across all different contents.
     Things it can represent are, for example, video, exercise, audio or document...
     """
-    content_id = models.UUIDField(primary_key=False, default=uuid4, editable=False)
+    content_id = models.UUIDField(primary_key=False, default=uuid4, editable=False, db_index=True)
     title = models.CharField(max_length=200)
     description = models.CharField(max_length=400, blank=True, null=True)
-    kind = models.CharField(max_length=50)
+    kind = models.CharField(max_length=50, db_index=True)
     slug = models.CharField(max_length=100)
     total_file_size = models.IntegerField()
     available = models.BooleanField(default=False)
@@ -102,6 +96,8 @@ class ContentMetadata(MPTTModel, AbstractContent):
 
     class Meta:
         verbose_name = 'Content Metadata'
+        # serves the descendant range queries of MPTT
+        index_together = [['tree_id', 'lft']]
 
     class Admin:
         pass
@@ -158,6 +154,7 @@ class File(AbstractContent):
     def save(self, *args, **kwargs):
         """
         Overrider the default save method.
+        The ContentSummary of the content and its ancestors get updated when the file's availability changes.
         If the content_copy FileField gets passed a content copy:
             1. generate the MD5 from the content copy
             2. fill the other fields accordingly
@@ -198,7 +195,10 @@ class File(AbstractContent):
             self.available = False
             self.file_size = None
             self.extension = None
+        using = kwargs.get('using') or router.db_for_write(File, instance=self)
+        previous = File.objects.using(using).filter(pk=self.pk).values_list('available', 'file_size').first() if self.pk else None
         super(File, self).save(*args, **kwargs)
+        aggregates.update_summaries_for_file(using, self, previous)
 
 class License(AbstractContent):
     """
@@ -239,16 +239,26 @@ class PrerequisiteContentRelationship(ContentRelationship):
         # self reference exception
         if self.contentmetadata_1 == self.contentmetadata_2:
             raise IntegrityError('Cannot self reference as prerequisite.')
+        # the relationship lives in the channel database of its contents
+        self.clean_cycles(self._state.db or router.db_for_write(PrerequisiteContentRelationship, instance=self.contentmetadata_1))
+        super(PrerequisiteContentRelationship, self).clean(*args, **kwargs)
+
+    def clean_cycles(self, using):
+        """
+        Check the relationship against the prerequisite graph of the channel, which takes linear time
+        however far the loop it would close is.
+        """
+        graph = prerequisite_graph(using)
         # immediate cyclic exception
-        elif PrerequisiteContentRelationship.objects.using(self._state.db)\
-                .filter(contentmetadata_1=self.contentmetadata_2, contentmetadata_2=self.contentmetadata_1):
+        if graph.is_prerequisite(self.contentmetadata_2_id, self.contentmetadata_1_id):
             raise IntegrityError(
                 'Note: Prerequisite relationship is directional! %s and %s cannot be prerequisite of each other!'
                 % (self.contentmetadata_1, self.contentmetadata_2))
         # distant cyclic exception
-        # elif <this is a nice to have exception, may implement in the future when the priority raises.>
-        #     raise Exception('Note: Prerequisite relationship is acyclic! %s and %s forms a closed loop!' % (self.contentmetadata_1, self.contentmetadata_2))
-        super(PrerequisiteContentRelationship, self).clean(*args, **kwargs)
+        elif graph.creates_cycle(self.contentmetadata_1_id, self.contentmetadata_2_id):
+            raise IntegrityError(
+                'Note: Prerequisite relationship is acyclic! %s and %s forms a closed loop!'
+                % (self.contentmetadata_1, self.contentmetadata_2))
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -269,11 +279,41 @@ class RelatedContentRelationship(ContentRelationship):
         # self reference exception
         if self.contentmetadata_1 == self.contentmetadata_2:
             raise IntegrityError('Cannot self reference as related.')
-        # handle immediate cyclic
-        elif RelatedContentRelationship.objects.using(self._state.db)\
-                .filter(contentmetadata_1=self.contentmetadata_2, contentmetadata_2=self.contentmetadata_1):
+        using = kwargs.get('using') or router.db_for_write(RelatedContentRelationship, instance=self)
+        # without the pair index (sqlite older than 3.9, or a channel database that hasn't been upgraded),
+        # nothing stops the relationship saved the other way round, so look for it before saving
+        if not indexes.has_related_pair_index(using) and RelatedContentRelationship.objects.using(using)\
+                .filter(contentmetadata_1=self.contentmetadata_2, contentmetadata_2=self.contentmetadata_1).exists():
             return  # silently cancel the save
-        super(RelatedContentRelationship, self).save(*args, **kwargs)
+        try:
+            with transaction.atomic(using=using):
+                super(RelatedContentRelationship, self).save(*args, **kwargs)
+        except IntegrityError:
+            # the pair index rejects the relationship saved the other way round too, which is silently canceled,
+            # so only failed saves pay for looking for it
+            if not RelatedContentRelationship.objects.using(using)\
+                    .filter(contentmetadata_1=self.contentmetadata_2, contentmetadata_2=self.contentmetadata_1).exists():
+                raise
+
+class ContentSummary(AbstractContent):
+    """
+    Precomputed totals over a ContentMetadata and all its descendants, so topic pages don't need descendant queries.
+    Built by kolibri.content.utils.aggregates.build_summaries, and kept up to date when files become (un)available.
+    """
+    contentmetadata = models.OneToOneField(ContentMetadata, primary_key=True, related_name='summary')
+    # JSON object of kind to the number of descendants of that kind
+    kind_counts = models.TextField(default='{}')
+    file_count = models.IntegerField(default=0)
+    missing_file_count = models.IntegerField(default=0)
+    # sum of the format sizes, i.e. what it takes to have everything available
+    total_file_size = models.BigIntegerField(default=0)
+    available_file_size = models.BigIntegerField(default=0)
+
+    class Admin:
+        pass
+
+    def get_kind_counts(self):
+        return json.loads(self.kind_counts)
 
 class ChannelMetadata(models.Model):
     """
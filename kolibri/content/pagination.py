@@ -0,0 +1,148 @@
+"""
+Keyset pagination for the list endpoints of the content API.
+
+A page is selected by the ordering columns of the last row of the previous page rather than by an offset, so every
+page costs one range scan of the index on the ordering columns, however deep into a channel it is, and the cursors
+stay valid when rows are added or removed before them.
+
+The page size is set through these settings, and can be lowered per request with ``?page_size=``:
+
+``CONTENT_PAGE_SIZE``
+    Number of rows in a page, defaults to 100.
+``CONTENT_MAX_PAGE_SIZE``
+    Largest page size a request can ask for, defaults to 1000.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import base64
+import binascii
+import json
+import operator
+from collections import OrderedDict
+from functools import reduce
+
+import six
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 100
+
+DEFAULT_MAX_PAGE_SIZE = 1000
+
+# cursor values are bound as sqlite integers, which are signed 64-bit
+MIN_CURSOR_VALUE = -2 ** 63
+
+MAX_CURSOR_VALUE = 2 ** 63 - 1
+
+
+def encode_cursor(position):
+    """
+    Encode the ordering values of a row as an opaque cursor.
+
+    :param position: list of int
+    :return: str
+    """
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def _is_cursor_value(value):
+    return isinstance(value, six.integer_types) and not isinstance(value, bool) \
+        and MIN_CURSOR_VALUE <= value <= MAX_CURSOR_VALUE
+
+def decode_cursor(cursor, length):
+    """
+    Decode a cursor made by encode_cursor.
+
+    :param cursor: str
+    :param length: int, number of ordering values it must hold
+    :return: list of int
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, UnicodeError, binascii.Error):
+        raise ValueError('Malformed cursor %r' % cursor)
+    if not isinstance(position, list) or len(position) != length or not all(_is_cursor_value(value) for value in position):
+        raise ValueError('Malformed cursor %r' % cursor)
+    return position
+
+def after(ordering, position):
+    """
+    Build the condition selecting the rows that come after position in ordering, e.g. for (tree_id, lft)
+    ``tree_id >= t AND (tree_id > t OR (tree_id = t AND lft > l))``. The redundant bound on the first column lets
+    sqlite scan the index from position on.
+
+    :param ordering: tuple of field names, all ascending
+    :param position: list of values of those fields
+    :return: Q
+    """
+    clauses = []
+    for i, field in enumerate(ordering):
+        clause = dict(zip(ordering[:i], position[:i]))
+        clause[field + '__gt'] = position[i]
+        clauses.append(Q(**clause))
+    return Q(**{ordering[0] + '__gte': position[0]}) & reduce(operator.or_, clauses)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates a queryset by a unique ascending ordering, with ``?cursor=`` pointing right after the last row
+    of the previous page.
+    """
+    ordering = ('pk',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'CONTENT_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        requested = request.query_params.get(self.page_size_query_param, '')
+        if requested.isdigit() and int(requested) > 0:
+            page_size = min(int(requested), getattr(settings, 'CONTENT_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE))
+        return page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is not None:
+            try:
+                position = decode_cursor(cursor, len(self.ordering))
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(after(self.ordering, position))
+        # one more row than asked for tells whether there is a next page
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_position = [getattr(rows[-1], field) for field in self.ordering]
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class ContentMetadataPagination(KeysetPagination):
+    """
+    Pages through the content nodes of a channel in tree order.
+    """
+    ordering = ('tree_id', 'lft')
+
+
+class FilePagination(KeysetPagination):
+    """
+    Pages through the files of a channel by pk.
+    """
+    ordering = ('pk',)
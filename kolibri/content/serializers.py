@@ -1,5 +1,10 @@
+from django.core.urlresolvers import NoReverseMatch
+from django.db.models import Manager, QuerySet
+from django.db.models.query import prefetch_related_objects
+from django.utils.encoding import force_text
+from django.utils.http import RFC3986_SUBDELIMS, urlquote
 from kolibri.content.models import (
-    ChannelMetadata, ContentMetadata, File, Format
+    ChannelMetadata, ContentMetadata, ContentSummary, File, Format
 )
 from rest_framework import serializers
 
@@ -18,21 +23,103 @@ class ChannelMetadataSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class DualLookuplinkedIdentityField(serializers.HyperlinkedIdentityField):
+    """
+    Links to a route taking the channel id from the serializer context and a lookup field of the instance.
+
+    The route is only reversed once per serializer context with a placeholder for the lookup value, and the URL of
+    every instance is then formatted from that template, which spares a list the cost of resolving each of its
+    hyperlinks through the URL conf.
+    """
+    placeholder = '__lookup_value__'
+
     def __init__(self, view_name, lookup_field_1, lookup_field_2, **kwargs):
         super(DualLookuplinkedIdentityField, self).__init__(view_name, **kwargs)
 
+    def _reverse(self, value):
+        kwargs = {self._kwargs['lookup_field_1']: self.context['channel_id'], self._kwargs['lookup_field_2']: value}
+        return self.reverse(self.view_name, kwargs=kwargs, request=self.context.get('request', None), format=self.context.get('format', None))
+
+    def url_template(self):
+        """
+        Get the URL of the route with a placeholder for the lookup value, kept in the serializer context.
+
+        :return: str or None if the route can't be reversed with the placeholder
+        """
+        templates = self.context.setdefault('url_templates', {})
+        if self.view_name not in templates:
+            try:
+                template = self._reverse(self.placeholder)
+            except NoReverseMatch:
+                template = None
+            templates[self.view_name] = template if template and template.count(self.placeholder) == 1 else None
+        return templates[self.view_name]
+
     def to_representation(self, value):
-        view_name = self.view_name
-        lookup_field_1 = self._kwargs['lookup_field_1']
-        lookup_field_2 = self._kwargs['lookup_field_2']
-        kwargs = {lookup_field_1: self.context['channel_id'], lookup_field_2: getattr(value, lookup_field_2)}
+        lookup_value = getattr(value, self._kwargs['lookup_field_2'])
+        template = self.url_template()
+        if template is None:
+            return self._reverse(lookup_value)
+        return template.replace(self.placeholder, urlquote(force_text(lookup_value), safe=RFC3986_SUBDELIMS + str('/~:@')))
+
+
+class SparseFieldsMixin(object):
+    """
+    Serializer mixin leaving out the fields that aren't listed in the ?fields=<name>,<name>,... of the request, if given.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
         request = self.context.get('request', None)
-        format = self.context.get('format', None)
+        requested = getattr(request, 'query_params', {}).get('fields')
+        if requested:
+            keep = set(name.strip() for name in requested.split(','))
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+# lookups loading the nested fields of ContentMetadataSerializer along with the content nodes; at depth 1,
+# nested content nodes list the pks of their own prerequisites, related contents and tags
+NESTED_CONTENT_LOOKUPS = ('prerequisite', 'is_related', 'tags')
+
+CONTENT_SELECT_RELATED = {
+    'license': ('license',),
+    'parent': ('parent',),
+}
+
+CONTENT_PREFETCH_RELATED = dict(
+    (field, ([field] if field != 'parent' else []) + ['%s__%s' % (field, lookup) for lookup in NESTED_CONTENT_LOOKUPS])
+    for field in ('parent', 'prerequisite', 'is_related')
+)
+
+
+def load_related_contents(contents, field_names):
+    """
+    Load what the given fields of ContentMetadataSerializer need along with the content nodes, so serializing them
+    takes the same number of queries however many nodes there are: foreign keys are joined in when contents is a
+    queryset, and every other relationship takes a single query.
+
+    :param contents: QuerySet or iterable of ContentMetadata
+    :param field_names: iterable of str
+    :return: QuerySet or list of ContentMetadata
+    """
+    field_names = list(field_names)
+    select = [lookup for name in field_names for lookup in CONTENT_SELECT_RELATED.get(name, ())]
+    prefetch = [lookup for name in field_names for lookup in CONTENT_PREFETCH_RELATED.get(name, ())]
+    if isinstance(contents, QuerySet):
+        return contents.select_related(*select).prefetch_related(*prefetch)
+    contents = list(contents)
+    prefetch_related_objects(contents, select + prefetch)
+    return contents
+
 
-        return self.reverse(view_name, kwargs=kwargs, request=request, format=format)
+class ContentMetadataListSerializer(serializers.ListSerializer):
 
+    def to_representation(self, data):
+        data = data.all() if isinstance(data, Manager) else data
+        return super(ContentMetadataListSerializer, self).to_representation(load_related_contents(data, self.child.fields))
 
-class ContentMetadataSerializer(serializers.ModelSerializer):
+
+class ContentMetadataSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     url = DualLookuplinkedIdentityField(
         view_name='contentmetadata-detail',
         lookup_field_1='channelmetadata_channel_id',
@@ -87,6 +174,7 @@ class ContentMetadataSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ContentMetadata
+        list_serializer_class = ContentMetadataListSerializer
         depth = 1
         fields = (
             'url', 'content_id', 'title', 'description', 'kind', 'slug', 'total_file_size', 'available',
@@ -96,6 +184,26 @@ class ContentMetadataSerializer(serializers.ModelSerializer):
         )
 
 
+class AncestorTopicSerializer(serializers.ModelSerializer):
+    url = DualLookuplinkedIdentityField(
+        view_name='contentmetadata-detail',
+        lookup_field_1='channelmetadata_channel_id',
+        lookup_field_2='content_id'
+    )
+
+    class Meta:
+        model = ContentMetadata
+        fields = ('url', 'content_id', 'title', 'kind', 'level')
+
+
+class ContentSummarySerializer(serializers.ModelSerializer):
+    kind_counts = serializers.DictField(source='get_kind_counts', child=serializers.IntegerField())
+
+    class Meta:
+        model = ContentSummary
+        fields = ('kind_counts', 'file_count', 'missing_file_count', 'total_file_size', 'available_file_size')
+
+
 class FormatSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -104,7 +212,7 @@ class FormatSerializer(serializers.ModelSerializer):
         fields = ('available', 'format_size', 'quality', 'contentmetadata', 'mimetype')
 
 
-class FileSerializer(serializers.ModelSerializer):
+class FileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     url = DualLookuplinkedIdentityField(
         view_name='file-detail',
         lookup_field_1='channelmetadata_channel_id',
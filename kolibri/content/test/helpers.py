@@ -0,0 +1,48 @@
+"""
+Helper functions for use across the content tests that need channel databases on disk.
+"""
+import sqlite3
+
+from django.db import connections
+from kolibri.content.utils.channels import channel_databases
+
+
+def copy_channel_schema(alias, path):
+    """
+    Create a channel database at path with the tables, but not the indexes, of the database behind alias.
+
+    :param str alias: the database to copy the schema from, usually the test channel database
+    :param str path: path of the sqlite file to create
+    """
+    cursor = connections[alias].cursor()
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name LIKE 'content_%'")
+    db = sqlite3.connect(path)
+    for (sql,) in cursor.fetchall():
+        db.execute(sql)
+    db.commit()
+    db.close()
+
+def create_content_nodes(path, titles):
+    """
+    Insert one content node per title into the channel database at path, as children of a root topic.
+
+    :param str path: path of a sqlite file created by copy_channel_schema
+    :param list titles: titles of the nodes to create
+    """
+    db = sqlite3.connect(path)
+    rows = [(1, None, 'root', 'topic', 1, 2 * len(titles) + 2, 0)]
+    rows += [(i + 2, 1, title, 'video', 2 * i + 2, 2 * i + 3, 1) for i, title in enumerate(titles)]
+    db.executemany(
+        "INSERT INTO content_contentmetadata (id, parent_id, title, kind, lft, rght, level, content_id, slug, "
+        "total_file_size, available, license_id, tree_id) VALUES (?, ?, ?, ?, ?, ?, ?, lower(hex(randomblob(16))), "
+        "'slug', 0, 1, 1, 1)", rows)
+    db.commit()
+    db.close()
+
+def forget_channel_db(alias):
+    """
+    Close and unregister a channel database registered during a test.
+
+    :param str alias: the channel alias
+    """
+    channel_databases.unregister(alias)
@@ -0,0 +1,129 @@
+"""
+Tests for importing channel exports into channel databases
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+import six
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from kolibri.content import api
+from kolibri.content import models as content
+from kolibri.content.utils import channel_export, channel_import
+
+from .helpers import forget_channel_db
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'content_test.json')
+
+
+def content_node(pk, parent, title, kind='topic'):
+    return {'model': 'content.contentmetadata', 'pk': pk, 'fields': {
+        'content_id': str(uuid.uuid4()), 'title': title, 'kind': kind, 'slug': title, 'total_file_size': 0,
+        'available': False, 'license': 1, 'parent': parent, 'tags': [],
+    }}
+
+def wide_tree(depth, width):
+    """
+    Content nodes of a tree where every topic has width children, in tree order.
+    """
+    yield {'model': 'content.license', 'pk': 1, 'fields': {'license_name': 'CC BY'}}
+    pks = iter(range(1, width ** (depth + 1)))
+    stack = [(next(pks), None, 0)]
+    while stack:
+        pk, parent, level = stack.pop()
+        yield content_node(pk, parent, 'node %d' % pk)
+        if level < depth:
+            stack.extend(reversed([(next(pks), pk, level + 1) for _ in range(width)]))
+
+
+class ChannelImportTestCase(TestCase):
+    """
+    Testcase for importing channel exports into new channel databases on disk
+    """
+
+    def setUp(self):
+        self.content_db_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(CONTENT_DB_DIR=self.content_db_dir)
+        self.settings_override.enable()
+
+    def test_import_fixture(self):
+        counts = api.import_channel(channel_id='imported', path=FIXTURE)
+        self.assertEqual(counts['content.ContentMetadata'], 6)
+        self.assertEqual(counts['content.File'], 4)
+        with io.open(FIXTURE) as fixture:
+            expected = dict(
+                (obj['fields']['title'], (obj['fields']['lft'], obj['fields']['rght'], obj['fields']['level'], obj['fields']['tree_id']))
+                for obj in json.load(fixture) if obj['model'] == 'content.contentmetadata'
+            )
+        imported = content.ContentMetadata.objects.using('imported').values_list('title', 'lft', 'rght', 'level', 'tree_id')
+        self.assertEqual(dict((row[0], tuple(row[1:])) for row in imported), expected)
+        c1 = content.ContentMetadata.objects.using('imported').get(title='c1')
+        self.assertEqual([cm.title for cm in api.get_all_prerequisites(channel_id='imported', content=c1)], ['root'])
+        self.assertEqual(api.get_content_summary(channel_id='imported', content=c1).file_count, 2)
+        self.assertEqual([result['title'] for result in api.search(query='c2c1', channel_ids=['imported'])['results']], ['c2c1'])
+
+    def test_import_json_lines(self):
+        lines = '\n'.join(json.dumps(obj) for obj in wide_tree(depth=3, width=3))
+        counts = channel_import.import_channel('imported', channel_import.read_channel_export(io.StringIO(lines)), batch_size=7)
+        self.assertEqual(counts['content.ContentMetadata'], 1 + 3 + 9 + 27)
+        nodes = content.ContentMetadata.objects.using('imported')
+        root = nodes.get(parent=None)
+        self.assertEqual((root.lft, root.rght), (1, 80))
+        for node in nodes.exclude(parent=None).select_related('parent'):
+            self.assertTrue(node.parent.lft < node.lft < node.rght < node.parent.rght)
+            self.assertEqual(node.level, node.parent.level + 1)
+        self.assertEqual(api.leaves(channel_id='imported', content=root).count(), 27)
+
+    def test_read_fixture_in_small_reads(self):
+        with io.open(FIXTURE) as fixture:
+            expected = json.load(fixture)
+        with io.open(FIXTURE) as fixture:
+            self.assertEqual(list(channel_import.read_fixture(fixture, read_size=16)), expected)
+
+    def test_import_out_of_tree_order(self):
+        objects = list(wide_tree(depth=1, width=2))
+        # the second child comes before its parent
+        objects.insert(1, objects.pop())
+        with self.assertRaises(ValueError):
+            channel_import.import_channel('imported', objects)
+        # nothing was written, so the channel can still be imported
+        channel_import.import_channel('imported', wide_tree(depth=1, width=2))
+        self.assertEqual(content.ContentMetadata.objects.using('imported').count(), 3)
+
+    def test_importchannel_command(self):
+        call_command('importchannel', 'imported', FIXTURE, stdout=six.StringIO())
+        self.assertEqual(content.ContentMetadata.objects.using('imported').count(), 6)
+
+    def test_export_round_trip(self):
+        objects = list(wide_tree(depth=2, width=3))
+        objects.insert(1, {'model': 'content.contenttag', 'pk': 1, 'fields': {'tag_name': 'fractions'}})
+        objects.insert(2, {'model': 'content.contenttag', 'pk': 2, 'fields': {'tag_name': 'decimals'}})
+        tagged = dict((obj['pk'], [1, 2] if obj['pk'] % 2 else [2]) for obj in objects[3::3])
+        for obj in objects:
+            if obj['model'] == 'content.contentmetadata':
+                obj['fields']['tags'] = tagged.get(obj['pk'], [])
+        channel_import.import_channel('imported', objects)
+        with CaptureQueriesContext(connections['imported']) as queries:
+            export = ''.join(channel_export.stream_channel_export('imported', chunk_size=4))
+        # the 13 content nodes are read 4 at a time rather than with a single query
+        self.assertEqual(len([query for query in queries if 'FROM "content_contentmetadata" ' in query['sql']]), 4)
+        channel_import.import_channel('reimported', channel_import.read_channel_export(io.StringIO(export)))
+        nodes = content.ContentMetadata.objects.order_by('tree_id', 'lft')
+        self.assertEqual(
+            [(node.pk, node.lft, node.rght, sorted(tag.pk for tag in node.tags.all())) for node in nodes.using('reimported')],
+            [(node.pk, node.lft, node.rght, tagged.get(node.pk, [])) for node in nodes.using('imported')],
+        )
+
+    def tearDown(self):
+        forget_channel_db('reimported')
+        forget_channel_db('imported')
+        self.settings_override.disable()
+        shutil.rmtree(self.content_db_dir)
@@ -0,0 +1,250 @@
+"""
+Tests for the channel database registry in kolibri.content.utils.channels
+"""
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import six
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.test import TestCase
+from django.test.utils import override_settings
+from kolibri.content import models as content
+from kolibri.content.utils.channel_import import upgrade_channel
+from kolibri.content.utils.channels import ChannelDatabaseRegistry, channel_databases
+from kolibri.content.utils.indexes import missing_indexes
+from kolibri.content.utils.warmup import warm_up_channel_databases
+
+from .helpers import copy_channel_schema, forget_channel_db
+
+
+class ChannelDatabaseRegistryTestCase(TestCase):
+    """
+    Testcase for validating and caching channel database aliases
+    """
+    fixtures = ['channel_test.json', 'content_test.json']
+    multi_db = True
+    the_channel_id = 'content_test'
+    connections.databases[the_channel_id] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+
+    def setUp(self):
+        self.registry = ChannelDatabaseRegistry()
+        self.content_db_dir = tempfile.mkdtemp()
+        self.aliases = []
+
+    def _create_channel_db(self, alias):
+        self.aliases.append(alias)
+        db = sqlite3.connect(os.path.join(self.content_db_dir, alias + '.sqlite3'))
+        db.execute('CREATE TABLE content_contentmetadata (id integer PRIMARY KEY)')
+        db.commit()
+        db.close()
+
+    def test_alias_is_validated_once(self):
+        self.registry.get_alias(self.the_channel_id)
+        self.assertTrue(self.registry.is_validated(self.the_channel_id))
+        with self.assertNumQueries(0, using=self.the_channel_id):
+            self.registry.get_alias(self.the_channel_id)
+
+    def test_queryset_using_does_not_introspect(self):
+        content.ContentMetadata.objects.using(self.the_channel_id)
+        with self.assertNumQueries(1, using=self.the_channel_id):
+            list(content.ContentMetadata.objects.using(self.the_channel_id).filter(title="root"))
+
+    def test_missing_channel_db(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            self.aliases.append('missing_channel')
+            with self.assertRaises(KeyError):
+                self.registry.get_alias('missing_channel')
+            self.assertFalse(os.path.exists(os.path.join(self.content_db_dir, 'missing_channel.sqlite3')))
+
+    def test_revalidate_when_file_changes(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            self._create_channel_db('file_channel')
+            self.registry.get_alias('file_channel')
+            self.assertTrue(self.registry.is_validated('file_channel'))
+            # replace the channel database with an empty one
+            os.remove(os.path.join(self.content_db_dir, 'file_channel.sqlite3'))
+            sqlite3.connect(os.path.join(self.content_db_dir, 'file_channel.sqlite3')).close()
+            with self.assertRaises(KeyError):
+                self.registry.get_alias('file_channel')
+            self.assertFalse(self.registry.is_validated('file_channel'))
+
+    def _replace_channel_db(self, alias, title):
+        path = os.path.join(self.content_db_dir, alias + '.sqlite3')
+        os.remove(path)
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE content_contentmetadata (id integer PRIMARY KEY, title text)')
+        db.execute('INSERT INTO content_contentmetadata (title) VALUES (?)', (title,))
+        db.commit()
+        db.close()
+
+    def _title(self, alias):
+        cursor = connections[self.registry.get_alias(alias)].cursor()
+        cursor.execute('SELECT title FROM content_contentmetadata')
+        title = cursor.fetchone()[0]
+        cursor.close()
+        return title
+
+    def test_reopen_when_file_is_replaced(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            self._create_channel_db('replaced_channel')
+            self._replace_channel_db('replaced_channel', 'old')
+            self.assertEqual(self._title('replaced_channel'), 'old')
+            self._replace_channel_db('replaced_channel', 'new')
+            self.assertEqual(self._title('replaced_channel'), 'new')
+
+    def test_reopen_in_other_threads_when_file_is_replaced(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            self._create_channel_db('replaced_channel')
+            self._replace_channel_db('replaced_channel', 'old')
+            self.assertEqual(self._title('replaced_channel'), 'old')
+            self._replace_channel_db('replaced_channel', 'new')
+            # another thread revalidates the new file first
+            titles = []
+
+            def read_title():
+                titles.append(self._title('replaced_channel'))
+                self.registry.release_all()
+
+            thread = threading.Thread(target=read_title)
+            thread.start()
+            thread.join()
+            self.assertEqual(titles, ['new'])
+            self.assertEqual(self._title('replaced_channel'), 'new')
+
+    @unittest.skipIf(six.PY2, 'read-only channel databases need sqlite URI support, which Python 2 lacks')
+    def test_read_only_channel_db(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_DB_READ_ONLY=True):
+            self._create_channel_db('read_only_channel')
+            alias = self.registry.get_alias('read_only_channel')
+            with self.assertRaises(OperationalError):
+                connections[alias].cursor().execute('INSERT INTO content_contentmetadata (id) VALUES (1)')
+            # writes go through a separate writable connection, and are visible to the read-only one
+            writable = self.registry.writable_alias(alias)
+            self.aliases.append(writable)
+            self.assertNotEqual(alias, writable)
+            connections[writable].cursor().execute('INSERT INTO content_contentmetadata (id) VALUES (1)')
+            cursor = connections[alias].cursor()
+            cursor.execute('SELECT COUNT(*) FROM content_contentmetadata')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_writable_alias_of_read_write_channel_db(self):
+        self.assertEqual(self.registry.writable_alias(self.the_channel_id), self.the_channel_id)
+
+    def test_content_db_pragmas(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_DB_PRAGMAS={'cache_size': -1234}):
+            self._create_channel_db('tuned_channel')
+            self.registry.get_alias('tuned_channel')
+            cursor = connections['tuned_channel'].cursor()
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
+
+    def _query(self, alias):
+        cursor = connections[self.registry.get_alias(alias)].cursor()
+        cursor.execute('SELECT COUNT(*) FROM content_contentmetadata')
+        cursor.close()
+
+    def test_least_recently_used_handle_is_closed(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_DB_MAX_OPEN_HANDLES=2):
+            for alias in ('channel_a', 'channel_b', 'channel_c'):
+                self._create_channel_db(alias)
+            self._query('channel_a')
+            self._query('channel_b')
+            self._query('channel_a')
+            self._query('channel_c')
+            self.assertIsNone(connections['channel_b'].connection)
+            self.assertIsNotNone(connections['channel_a'].connection)
+            self.assertIsNotNone(connections['channel_c'].connection)
+            self.assertEqual(list(self.registry.handles()), ['channel_a', 'channel_c'])
+            self.assertEqual(list(self.registry.stats().values()), [2])
+
+    def test_idle_handle_is_closed(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_DB_IDLE_TIMEOUT=0):
+            self._create_channel_db('channel_a')
+            self._create_channel_db('channel_b')
+            self._query('channel_a')
+            self._query('channel_b')
+            self.assertIsNone(connections['channel_a'].connection)
+            self.assertEqual(list(self.registry.handles()), ['channel_b'])
+
+    def tearDown(self):
+        for alias in self.aliases:
+            forget_channel_db(alias)
+        shutil.rmtree(self.content_db_dir)
+
+
+class ChannelWarmUpTestCase(TestCase):
+    """
+    Testcase for warming up the channel databases found in CONTENT_DB_DIR
+    """
+    multi_db = True
+    the_channel_id = 'content_test'
+
+    def setUp(self):
+        self.content_db_dir = tempfile.mkdtemp()
+        copy_channel_schema(self.the_channel_id, os.path.join(self.content_db_dir, 'warm_channel.sqlite3'))
+        # and a channel database that is missing the content tables
+        db = sqlite3.connect(os.path.join(self.content_db_dir, 'broken_channel.sqlite3'))
+        db.execute('CREATE TABLE unrelated (id integer PRIMARY KEY)')
+        db.commit()
+        db.close()
+
+    def test_warm_up_channel_databases(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            timings = warm_up_channel_databases()
+        self.assertEqual(list(timings), ['warm_channel'])
+        self.assertTrue(channel_databases.is_validated('warm_channel'))
+        # connections opened for the warm up are closed again
+        self.assertIsNone(connections['warm_channel'].connection)
+
+    def tearDown(self):
+        forget_channel_db('warm_channel')
+        forget_channel_db('broken_channel')
+        shutil.rmtree(self.content_db_dir)
+
+
+class ChannelIndexesTestCase(TestCase):
+    """
+    Testcase for the index health check of channel databases
+    """
+    multi_db = True
+    the_channel_id = 'content_test'
+
+    def setUp(self):
+        self.content_db_dir = tempfile.mkdtemp()
+        copy_channel_schema(self.the_channel_id, os.path.join(self.content_db_dir, 'old_channel.sqlite3'))
+
+    def test_migrated_channel_db_has_indexes(self):
+        self.assertEqual(missing_indexes(self.the_channel_id), [])
+
+    def test_old_channel_db_gets_indexes_on_upgrade(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            # validating a channel database on a request doesn't write to it
+            channel_databases.get_alias('old_channel')
+            self.assertEqual(len(missing_indexes('old_channel')), 3)
+            self.assertTrue(upgrade_channel('old_channel'))
+            self.assertEqual(missing_indexes('old_channel'), [])
+
+    def test_upgradechannels_command(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            call_command('upgradechannels', stdout=six.StringIO())
+            self.assertEqual(missing_indexes('old_channel'), [])
+
+    def test_read_only_channel_db_is_not_upgraded(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_DB_READ_ONLY=True, CONTENT_DB_IMMUTABLE=True):
+            channel_databases.get_alias('old_channel')
+            self.assertFalse(upgrade_channel('old_channel'))
+            self.assertEqual(len(missing_indexes('old_channel')), 3)
+
+    def tearDown(self):
+        forget_channel_db('old_channel')
+        shutil.rmtree(self.content_db_dir)
@@ -2,9 +2,12 @@
 To run this test, type this in command line <kolibri manage test -- kolibri.content>
 """
 from __future__ import unicode_literals
+import json
+import mock
 import os
 import shutil
 import tempfile
+import uuid
 from django.core.urlresolvers import reverse
 
 from django.conf import settings
@@ -12,7 +15,9 @@ from django.db import connections, IntegrityError
 from django.test.utils import override_settings
 
 from kolibri.content import models as content
-from kolibri.content import api
+from kolibri.content import api, pagination, serializers
+from kolibri.content.utils import aggregates, channel_import, graph, identity_map, indexes, response_cache
+from kolibri.content.utils.channels import channel_databases
 
 from rest_framework.test import APITestCase as TestCase
 
@@ -37,6 +42,9 @@ class ContentMetadataTestCase(TestCase):
     }
 
     def setUp(self):
+        # relationship graphs of in-memory databases outlive the rollback of each test
+        graph.invalidate_prerequisite_graph()
+        graph.invalidate_related_graph()
         # Create a temporary directory
         self.test_dir = tempfile.mkdtemp()
         # Create files in the temporary directory
@@ -67,6 +75,23 @@ class ContentMetadataTestCase(TestCase):
         with self.assertRaises(TypeError):
             api.immediate_children(channel_id=self.the_channel_id, content=432)
 
+    def test_identity_map(self):
+        root_id = str(content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id)
+        identity_map.reset_identity_map_stats()
+        with identity_map.content_identity_map() as contents:
+            # the querysets returned are lazy, so only the lookup of the content id counts
+            with self.assertNumQueries(1, using=self.the_channel_id):
+                api.get_ancestor_topics(channel_id=self.the_channel_id, content=root_id)
+            with self.assertNumQueries(0, using=self.the_channel_id):
+                api.immediate_children(channel_id=self.the_channel_id, content=root_id)
+                api.leaves(channel_id=self.the_channel_id, content=root_id)
+        self.assertEqual((contents.hits, contents.misses), (2, 1))
+        self.assertEqual(identity_map.identity_map_stats(), {'hits': 2, 'misses': 1})
+        self.assertIsNone(identity_map.active_identity_map())
+        # every call gets its own identity map outside of a request
+        with self.assertNumQueries(1, using=self.the_channel_id):
+            api.get_ancestor_topics(channel_id=self.the_channel_id, content=root_id)
+
     def test_update_content_copy(self):
         """
         test adding same content copies, and deleting content copy
@@ -143,18 +168,123 @@ class ContentMetadataTestCase(TestCase):
         actual_output = api.get_ancestor_topics(channel_id=self.the_channel_id, content=p)
         self.assertEqual(set(expected_output), set(actual_output))
 
+    def test_get_contents_in_order(self):
+        nodes = dict((cm.title, cm) for cm in content.ContentMetadata.objects.using(self.the_channel_id))
+        titles = ["c2c3", "root", "c1", "root"]
+        content_ids = [str(nodes[title].content_id) for title in titles] + [str(uuid.uuid4())]
+        with self.assertNumQueries(1, using=self.the_channel_id):
+            contents = api.get_contents_in_order(channel_id=self.the_channel_id, contents=content_ids)
+        self.assertEqual([cm.title for cm in contents], ["c2c3", "root", "c1"])
+        with self.assertRaises(TypeError):
+            api.get_contents_in_order(channel_id=self.the_channel_id, contents=["not a content id"])
+
+    @mock.patch('kolibri.content.api.SQLITE_MAX_VARIABLES', 2)
+    def test_get_contents_in_order_chunks(self):
+        nodes = list(content.ContentMetadata.objects.using(self.the_channel_id).order_by('-lft'))
+        with self.assertNumQueries(3, using=self.the_channel_id):
+            contents = api.get_contents_in_order(channel_id=self.the_channel_id, contents=[cm.content_id for cm in nodes])
+        self.assertEqual(contents, nodes)
+
+    def test_get_ancestor_topics_bulk(self):
+        c2c3 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2c3")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        with self.assertNumQueries(1, using=self.the_channel_id):
+            chains = api.get_ancestor_topics_bulk(
+                channel_id=self.the_channel_id, contents=[str(c2c3.content_id), str(c1.content_id), str(root.content_id)])
+        self.assertEqual([cm.title for cm in chains[str(c2c3.content_id)]], ["root", "c2"])
+        self.assertEqual([cm.title for cm in chains[str(c1.content_id)]], ["root"])
+        self.assertEqual(chains[str(root.content_id)], [])
+        # the root topic is shared by both chains
+        self.assertIs(chains[str(c2c3.content_id)][0], chains[str(c1.content_id)][0])
+
+    @mock.patch('kolibri.content.api.SQLITE_MAX_VARIABLES', 3)
+    def test_get_ancestor_topics_bulk_chunks(self):
+        nodes = list(content.ContentMetadata.objects.using(self.the_channel_id).order_by('lft'))
+        with self.assertNumQueries(3, using=self.the_channel_id):
+            chains = api.get_ancestor_topics_bulk(channel_id=self.the_channel_id, contents=[str(cm.content_id) for cm in nodes])
+        self.assertEqual([len(chains[str(cm.content_id)]) for cm in nodes], [0, 1, 1, 2, 2, 2])
+
+    def test_get_content_summary(self):
+        aggregates.build_summaries(self.the_channel_id)
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        summary = api.get_content_summary(channel_id=self.the_channel_id, content=root)
+        self.assertEqual(summary.get_kind_counts(), {'exercise': 1, 'topic': 3, 'video': 1})
+        self.assertEqual((summary.file_count, summary.missing_file_count), (4, 4))
+        self.assertEqual((summary.total_file_size, summary.available_file_size), (199, 0))
+        c2c2 = api.get_content_summary(channel_id=self.the_channel_id, content=str(
+            content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2c2").content_id))
+        self.assertEqual((c2c2.get_kind_counts(), c2c2.file_count), ({}, 0))
+
+    def test_content_summary_of_read_only_channel(self):
+        content.ContentSummary.objects.using(self.the_channel_id).all().delete()
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        with override_settings(CONTENT_DB_READ_ONLY=True):
+            summary = api.get_content_summary(channel_id=self.the_channel_id, content=root)
+        self.assertEqual((summary.file_count, summary.total_file_size), (4, 199))
+        self.assertFalse(content.ContentSummary.objects.using(self.the_channel_id).exists())
+
+    def test_content_summary_without_summary_table(self):
+        # channel databases created by older versions don't have the table until they get upgraded
+        connections[self.the_channel_id].cursor().execute('DROP TABLE %s' % content.ContentSummary._meta.db_table)
+        channel_databases.forget_cached('summary_table', self.the_channel_id)
+        self.addCleanup(channel_databases.forget_cached, 'summary_table', self.the_channel_id)
+        c2 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
+        summary = api.get_content_summary(channel_id=self.the_channel_id, content=c2)
+        self.assertEqual((summary.get_kind_counts(), summary.file_count, summary.total_file_size), ({'exercise': 1, 'topic': 2}, 2, 46))
+        fm_1 = content.Format.objects.using(self.the_channel_id).get(format_size=102)
+        file_1 = content.File.objects.using(self.the_channel_id).get(format=fm_1)
+        api.update_content_copy(file_1, self.temp_f_1.name)
+        self.assertTrue(content.File.objects.using(self.the_channel_id).get(pk=file_1.pk).available)
+
+    def test_content_summary_follows_content_copies(self):
+        aggregates.build_summaries(self.the_channel_id)
+        fm_1 = content.Format.objects.using(self.the_channel_id).get(format_size=102)
+        file_1 = content.File.objects.using(self.the_channel_id).get(format=fm_1)
+        api.update_content_copy(file_1, self.temp_f_1.name)
+        for title, missing_file_count in (("root", 3), ("c1", 1), ("c2", 2)):
+            summary = content.ContentSummary.objects.using(self.the_channel_id).get(contentmetadata__title=title)
+            self.assertEqual(summary.missing_file_count, missing_file_count)
+        root = content.ContentSummary.objects.using(self.the_channel_id).get(contentmetadata__title="root")
+        self.assertEqual(root.available_file_size, file_1.file_size)
+        api.update_content_copy(file_1, None)
+        root = content.ContentSummary.objects.using(self.the_channel_id).get(contentmetadata__title="root")
+        self.assertEqual((root.missing_file_count, root.available_file_size), (4, 0))
+
     def test_immediate_children(self):
         p = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
         expected_output = content.ContentMetadata.objects.using(self.the_channel_id).filter(title__in=["c1", "c2"])
         actual_output = api.immediate_children(channel_id=self.the_channel_id, content=p)
         self.assertEqual(set(expected_output), set(actual_output))
 
+    def test_navigation_children(self):
+        p = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        children = api.navigation_children(channel_id=self.the_channel_id, content=p)
+        self.assertEqual([(child['title'], child['kind'], child['descendant_count']) for child in children], [('c1', 'video', 0), ('c2', 'topic', 3)])
+        self.assertEqual(set(children[0]), set(api.NAVIGATION_FIELDS + ('descendant_count',)))
+
     def test_leaves(self):
         p = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
         expected_output = content.ContentMetadata.objects.using(self.the_channel_id).filter(title__in=["c2c1", "c2c2", "c2c3"])
         actual_output = api.leaves(channel_id=self.the_channel_id, content=p)
         self.assertEqual(set(expected_output), set(actual_output))
 
+    def test_get_subtree(self):
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        subtree = api.get_subtree(channel_id=self.the_channel_id, content=root)
+        self.assertEqual([child['title'] for child in subtree['children']], ['c1', 'c2'])
+        # c2 has children below the requested depth, c1 has none
+        self.assertEqual([child['children'] for child in subtree['children']], [[], None])
+        subtree = api.get_subtree(channel_id=self.the_channel_id, content=root, depth=2, kind='topic', fields=('title',))
+        self.assertEqual(subtree, {'title': 'root', 'children': [
+            {'title': 'c2', 'children': [{'title': 'c2c2', 'children': []}, {'title': 'c2c3', 'children': []}]},
+        ]})
+        with self.assertRaises(ValueError):
+            api.get_subtree(channel_id=self.the_channel_id, content=root, depth=2, kind='exercise')
+        with override_settings(CONTENT_SUBTREE_MAX_DEPTH=1):
+            subtree = api.get_subtree(channel_id=self.the_channel_id, content=root, depth=5)
+        self.assertIsNone(subtree['children'][1]['children'])
+
     def test_get_all_formats(self):
         p = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
         expected_output = content.Format.objects.using(self.the_channel_id).filter(format_size=46)
@@ -180,6 +310,30 @@ class ContentMetadataTestCase(TestCase):
         actual_output = api.get_files_for_quality(channel_id=self.the_channel_id, content=p, format_quality="high")
         self.assertEqual(set(expected_output), set(actual_output))
 
+    def test_get_best_files(self):
+        content.File.objects.using(self.the_channel_id).update(available=True)
+        c1, c2c1, root = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title).content_id for title in ("c1", "c2c1", "root")]
+        best = api.get_best_files(channel_id=self.the_channel_id, contents=[c2c1, root, c1])
+        self.assertEqual(list(best), [str(c2c1), str(root), str(c1)])
+        self.assertEqual([f.pk if f else None for f in best.values()], [3, None, 1])
+        best = api.get_best_files(channel_id=self.the_channel_id, contents=[c1], qualities=("low", "high"))
+        self.assertEqual(best[str(c1)].pk, 2)
+        best = api.get_best_files(channel_id=self.the_channel_id, contents=[c1, c2c1], mimetypes=("Wall-E",))
+        self.assertEqual([f.pk if f else None for f in best.values()], [2, None])
+        # falls back to the next quality when the best one isn't available
+        content.File.objects.using(self.the_channel_id).filter(pk=1).update(available=False)
+        best = api.get_best_files_for_topic(channel_id=self.the_channel_id, content=str(root))
+        self.assertEqual([(content_id, f.pk) for content_id, f in best.items()], [(str(c1), 2), (str(c2c1), 3)])
+
+    @mock.patch('kolibri.content.api.SQLITE_MAX_VARIABLES', 6)
+    def test_get_best_files_chunks(self):
+        content.File.objects.using(self.the_channel_id).update(available=True)
+        content_ids = [cm.content_id for cm in content.ContentMetadata.objects.using(self.the_channel_id).filter(title__in=["c1", "c2c1", "root"])]
+        # the three qualities and available leave room for two content ids per query
+        with self.assertNumQueries(2, using=self.the_channel_id):
+            best = api.get_best_files(channel_id=self.the_channel_id, contents=content_ids)
+        self.assertEqual(len(best), 3)
+
     def test_get_missing_files(self):
         p = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
         expected_output = content.File.objects.using(self.the_channel_id).filter(id__in=[1, 2])
@@ -245,15 +399,102 @@ class ContentMetadataTestCase(TestCase):
         with self.assertRaises(IntegrityError):
             api.set_prerequisite(channel_id=self.the_channel_id, content1=root, content2=c2)
 
-    # <the exception hasn't been implemented yet, may add in the future>
-    # def test_set_prerequisite_distant_cyclic(self):
-    #     root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
-    #     c2 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
-    #     api.set_prerequisite(channel_id=self.the_channel_id, content1=c2, content2=root)
-    #     # test for distant cyclic exception
-    #     c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
-    #     with self.assertRaises(Exception):
-    #         api.set_prerequisite(channel_id=self.the_channel_id, content1=c1, content2=c2)
+    def test_prerequisite_full_clean_checks_cycles(self):
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c2 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
+        api.set_prerequisite(channel_id=self.the_channel_id, content1=c2, content2=root)
+        # forms, the admin and serializers validate with full_clean rather than by saving
+        with self.assertRaises(IntegrityError):
+            content.PrerequisiteContentRelationship(contentmetadata_1=root, contentmetadata_2=c2).full_clean()
+
+    def test_set_prerequisite_distant_cyclic(self):
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c2 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
+        api.set_prerequisite(channel_id=self.the_channel_id, content1=c2, content2=root)
+        # test for distant cyclic exception
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        with self.assertRaises(IntegrityError):
+            api.set_prerequisite(channel_id=self.the_channel_id, content1=c1, content2=c2)
+
+    def _set_prerequisite_chain(self, *titles):
+        nodes = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in titles]
+        for prerequisite, dependent in zip(nodes, nodes[1:]):
+            api.set_prerequisite(channel_id=self.the_channel_id, content1=prerequisite, content2=dependent)
+        return nodes
+
+    def test_get_transitive_prerequisites(self):
+        # root is already a prerequisite of c1
+        c2c2, c2c1, root = self._set_prerequisite_chain("c2c2", "c2c1", "root")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        actual_output = api.get_transitive_prerequisites(channel_id=self.the_channel_id, content=str(c1.content_id))
+        self.assertEqual(set(actual_output), set([c2c2, c2c1, root]))
+        actual_output = api.get_transitive_dependents(channel_id=self.the_channel_id, content=c2c2)
+        self.assertEqual(set(actual_output), set([c2c1, root, c1]))
+
+    @mock.patch('kolibri.content.api.SQLITE_MAX_VARIABLES', 2)
+    def test_get_transitive_prerequisites_chunks(self):
+        c2c2, c2c1, root = self._set_prerequisite_chain("c2c2", "c2c1", "root")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        graph.prerequisite_graph(self.the_channel_id)
+        # one query per chunk of two ids
+        with self.assertNumQueries(2, using=self.the_channel_id):
+            actual_output = api.get_transitive_prerequisites(channel_id=self.the_channel_id, content=c1)
+        self.assertEqual(actual_output, [root, c2c1, c2c2])
+
+    def test_get_learning_order(self):
+        c2c2, c2c1, root = self._set_prerequisite_chain("c2c2", "c2c1", "root")
+        c2c3 = self._set_prerequisite_chain("c2c3", "c2c1")[0]
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        order = api.get_learning_order(channel_id=self.the_channel_id, content=c1)
+        self.assertEqual(set(order), set([c2c2, c2c3, c2c1, root, c1]))
+        for prerequisite, dependent in ((c2c2, c2c1), (c2c3, c2c1), (c2c1, root), (root, c1)):
+            self.assertLess(order.index(prerequisite), order.index(dependent))
+
+    def test_get_prerequisite_cycle(self):
+        self.assertEqual(api.get_prerequisite_cycle(channel_id=self.the_channel_id), [])
+        root, c1, c2 = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in ("root", "c1", "c2")]
+        # loops can only come from databases written without validation, e.g. imported ones
+        content.PrerequisiteContentRelationship.objects.using(self.the_channel_id).bulk_create([
+            content.PrerequisiteContentRelationship(contentmetadata_1=c1, contentmetadata_2=c2),
+            content.PrerequisiteContentRelationship(contentmetadata_1=c2, contentmetadata_2=root),
+        ])
+        graph.invalidate_prerequisite_graph(self.the_channel_id)
+        cycle = api.get_prerequisite_cycle(channel_id=self.the_channel_id)
+        # the loop can start anywhere, but each content is a prerequisite of the next one
+        self.assertEqual(cycle[cycle.index(c1):] + cycle[:cycle.index(c1)], [c1, c2, root])
+        with self.assertRaises(IntegrityError):
+            api.get_learning_order(channel_id=self.the_channel_id, content=c1)
+
+    def test_set_prerequisites_bulk(self):
+        root, c1, c2c1, c2c2 = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in ("root", "c1", "c2c1", "c2c2")]
+        pairs = [
+            (str(c2c2.content_id), str(c2c1.content_id)),
+            (c2c1, root),
+            (c2c2, c2c1),
+            # already set by the fixture
+            (root, c1),
+        ]
+        self.assertEqual(api.set_prerequisites_bulk(channel_id=self.the_channel_id, pairs=pairs), 2)
+        actual_output = api.get_transitive_prerequisites(channel_id=self.the_channel_id, content=c1)
+        self.assertEqual(set(actual_output), set([root, c2c1, c2c2]))
+
+    def test_set_prerequisites_bulk_cyclic(self):
+        root, c1, c2 = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in ("root", "c1", "c2")]
+        with self.assertRaises(IntegrityError):
+            api.set_prerequisites_bulk(channel_id=self.the_channel_id, pairs=[(c2, root), (c1, c2)])
+        # none of the relationships got set
+        self.assertFalse(api.get_all_prerequisites(channel_id=self.the_channel_id, content=root))
+        with self.assertRaises(IntegrityError):
+            api.set_prerequisites_bulk(channel_id=self.the_channel_id, pairs=[(c2, root), (c1, c1)])
+        with self.assertRaises(content.ContentMetadata.DoesNotExist):
+            api.set_prerequisites_bulk(channel_id=self.the_channel_id, pairs=[(c2, str(uuid.uuid4()))])
+
+    def test_set_is_related_bulk(self):
+        root, c1, c2 = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in ("root", "c1", "c2")]
+        # c1 and c2 are already related by the fixture, and pairs are related either way round
+        pairs = [(c1, root), (root, c1), (c2, c1), (str(c2.content_id), str(root.content_id))]
+        self.assertEqual(api.set_is_related_bulk(channel_id=self.the_channel_id, pairs=pairs), 2)
+        self.assertEqual(set(api.get_all_related(channel_id=self.the_channel_id, content=root)), set([c1, c2]))
 
     def test_set_is_related(self):
         root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
@@ -286,6 +527,31 @@ class ContentMetadataTestCase(TestCase):
         except:
             self.assertTrue(False)
 
+    def test_set_is_related_stores_one_relationship_per_pair(self):
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        api.set_is_related(channel_id=self.the_channel_id, content1=c1, content2=root)
+        api.set_is_related(channel_id=self.the_channel_id, content1=root, content2=c1)
+        self.assertEqual(content.RelatedContentRelationship.objects.using(self.the_channel_id)
+                         .filter(contentmetadata_1__in=[root, c1], contentmetadata_2__in=[root, c1]).count(), 1)
+        self.assertEqual(list(api.get_all_related(channel_id=self.the_channel_id, content=root)), [c1])
+        # once the related graph of the channel is loaded, related contents take a single query
+        with self.assertNumQueries(1, using=self.the_channel_id):
+            self.assertIn(root, api.get_all_related(channel_id=self.the_channel_id, content=c1))
+
+    def test_set_is_related_without_pair_index(self):
+        # channel databases that haven't been upgraded have no pair index rejecting the reverse relationship
+        connections[self.the_channel_id].cursor().execute('DROP INDEX %s' % indexes.RELATED_PAIR_INDEX)
+        channel_databases.forget_cached('related_pair_index', self.the_channel_id)
+        # the index comes back when the test transaction is rolled back
+        self.addCleanup(channel_databases.forget_cached, 'related_pair_index', self.the_channel_id)
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        api.set_is_related(channel_id=self.the_channel_id, content1=c1, content2=root)
+        api.set_is_related(channel_id=self.the_channel_id, content1=root, content2=c1)
+        self.assertEqual(content.RelatedContentRelationship.objects.using(self.the_channel_id)
+                         .filter(contentmetadata_1__in=[root, c1], contentmetadata_2__in=[root, c1]).count(), 1)
+
     def test_children_of_kind(self):
         p = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
         expected_output = content.ContentMetadata.objects.using(self.the_channel_id).filter(title__in=["c2", "c2c2", "c2c3"])
@@ -320,6 +586,12 @@ class ContentMetadataAPITestCase(APITestCase):
     }
 
     def setUp(self):
+        # relationship graphs of in-memory databases outlive the rollback of each test
+        graph.invalidate_prerequisite_graph()
+        graph.invalidate_related_graph()
+        # so are the versions of in-memory databases the cached responses are keyed by
+        response_cache.response_cache().clear()
+        response_cache.reset_response_cache_stats()
         # Create a temporary directory
         self.test_dir = tempfile.mkdtemp()
         # Create file in the temporary directory
@@ -338,12 +610,40 @@ class ContentMetadataAPITestCase(APITestCase):
         response = self.client.get(self._reverse_channel_url("contentmetadata-ancestor-topics", {"content_id": c1_id}))
         self.assertEqual(response.data[0]['title'], 'root')
 
+    def test_lookup_endpoint(self):
+        c1_id = str(content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1").content_id)
+        c2c1_id = str(content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2c1").content_id)
+        missing_id = str(uuid.uuid4())
+        url = self._reverse_channel_url("contentmetadata-lookup", {})
+        response = self.client.get(url, {"content_id": [c2c1_id, missing_id, c1_id]})
+        self.assertEqual([data['title'] for data in response.data['results']], ['c2c1', 'c1'])
+        self.assertEqual(response.data['missing'], [missing_id])
+        response = self.client.post(url, {"content_ids": [c1_id, c2c1_id]}, format='json')
+        self.assertEqual([data['title'] for data in response.data['results']], ['c1', 'c2c1'])
+        self.assertEqual(self.client.post(url, {"content_ids": ["c1"]}, format='json').status_code, 400)
+
+    def test_ancestor_topics_bulk_endpoint(self):
+        c1_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1").content_id
+        c2c1_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2c1").content_id
+        response = self.client.get(self._reverse_channel_url("contentmetadata-ancestor-topics-bulk", {}), {"content_id": [c1_id, c2c1_id]})
+        self.assertEqual(set(ancestor['title'] for ancestor in response.data['ancestors']), set(['root', 'c2']))
+        self.assertEqual(len(response.data['chains'][str(c2c1_id)]), 2)
+        self.assertEqual(response.data['chains'][str(c1_id)], response.data['chains'][str(c2c1_id)][:1])
+        self.assertEqual(self.client.get(self._reverse_channel_url("contentmetadata-ancestor-topics-bulk", {}), {"content_id": "c1"}).status_code, 400)
+
     def test_immediate_children_endpoint(self):
         root_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id
         response = self.client.get(self._reverse_channel_url("contentmetadata-immediate-children", {"content_id": root_id}))
         self.assertEqual(response.data[0]['title'], 'c1')
         self.assertEqual(response.data[1]['title'], 'c2')
 
+    def test_navigation_children_endpoint(self):
+        root_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id
+        # the content lookup and the children with their counts, without joins
+        with self.assertNumQueries(2, using=self.the_channel_id):
+            response = self.client.get(self._reverse_channel_url("contentmetadata-navigation-children", {"content_id": root_id}))
+        self.assertEqual([(child['title'], child['descendant_count']) for child in response.data], [('c1', 0), ('c2', 3)])
+
     def test_leaves_endpoint(self):
         root_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id
         response = self.client.get(self._reverse_channel_url("contentmetadata-leaves", {"content_id": root_id}))
@@ -357,6 +657,26 @@ class ContentMetadataAPITestCase(APITestCase):
         response = self.client.get(self._reverse_channel_url("contentmetadata-all-prerequisites", {"content_id": c1_id}))
         self.assertEqual(response.data[0]['title'], 'root')
 
+    def test_learning_order_endpoint(self):
+        c2 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        api.set_prerequisite(channel_id=self.the_channel_id, content1=c2, content2=content.ContentMetadata.objects.using(self.the_channel_id).get(title="root"))
+        response = self.client.get(self._reverse_channel_url("contentmetadata-learning-order", {"content_id": c1.content_id}))
+        self.assertEqual([data['title'] for data in response.data], ["c2", "root", "c1"])
+        response = self.client.get(self._reverse_channel_url("contentmetadata-transitive-dependents", {"content_id": c2.content_id}))
+        self.assertEqual(set(data['title'] for data in response.data), set(["root", "c1"]))
+
+    def test_learning_order_endpoint_with_cycle(self):
+        root, c1, c2 = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in ("root", "c1", "c2")]
+        content.PrerequisiteContentRelationship.objects.using(self.the_channel_id).bulk_create([
+            content.PrerequisiteContentRelationship(contentmetadata_1=c1, contentmetadata_2=c2),
+            content.PrerequisiteContentRelationship(contentmetadata_1=c2, contentmetadata_2=root),
+        ])
+        graph.invalidate_prerequisite_graph(self.the_channel_id)
+        response = self.client.get(self._reverse_channel_url("contentmetadata-learning-order", {"content_id": c1.content_id}))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(set(response.data['cycle']), set([root.id, c1.id, c2.id]))
+
     def test_all_related_endpoint(self):
         c1_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1").content_id
         response = self.client.get(self._reverse_channel_url("contentmetadata-all-related", {"content_id": c1_id}))
@@ -378,6 +698,13 @@ class ContentMetadataAPITestCase(APITestCase):
         self.assertEqual(response.data[0]['format_size'], 102)
         self.assertEqual(response.data[1]['format_size'], 51)
 
+    def test_summary_endpoint(self):
+        c2_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2").content_id
+        response = self.client.get(self._reverse_channel_url("contentmetadata-summary", {"content_id": c2_id}))
+        self.assertEqual(response.data['kind_counts'], {'exercise': 1, 'topic': 2})
+        self.assertEqual(response.data['file_count'], 2)
+        self.assertEqual(response.data['total_file_size'], 46)
+
     def test_missing_files_endpoint(self):
         c1_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1").content_id
         response = self.client.get(self._reverse_channel_url("contentmetadata-missing-files", {"content_id": c1_id}))
@@ -385,6 +712,19 @@ class ContentMetadataAPITestCase(APITestCase):
         self.assertEqual(response.data[0]['format'], expected_output[0].format.id)
         self.assertEqual(response.data[1]['format'], expected_output[1].format.id)
 
+    def test_best_files_endpoints(self):
+        content.File.objects.using(self.the_channel_id).update(available=True)
+        root_id, c1_id = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title).content_id for title in ("root", "c1")]
+        params = {"content_id": [c1_id, root_id], "quality": ["low", "high"]}
+        with self.assertNumQueries(1, using=self.the_channel_id):
+            response = self.client.get(self._reverse_channel_url("contentmetadata-best-files", {}), params)
+        self.assertEqual([(item['quality'], item['mimetype']) for item in response.data], [('low', 'Wall-E'), (None, None)])
+        self.assertEqual(response.data[0]['file']['format'], 2)
+        with self.assertNumQueries(2, using=self.the_channel_id):
+            response = self.client.get(self._reverse_channel_url("contentmetadata-best-files-for-topic", {"content_id": root_id}))
+        self.assertEqual([item['file']['format'] for item in response.data], [1, 3])
+        self.assertEqual(self.client.get(self._reverse_channel_url("contentmetadata-best-files", {}), {"content_id": "c1"}).status_code, 400)
+
     def test_files_for_quality_endpoint(self):
         c1_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1").content_id
         response = self.client.get(self._reverse_channel_url("contentmetadata_files_for_quality", {"content_id": c1_id, "quality": "high"}))
@@ -398,6 +738,15 @@ class ContentMetadataAPITestCase(APITestCase):
         self.client.put(self._reverse_channel_url("contentmetadata_set_prerequisite", {"content_id": c2.content_id, "prerequisite": root.content_id}))
         self.assertTrue(api.get_all_prerequisites(channel_id=self.the_channel_id, content=root))
 
+    def test_set_prerequisites_bulk_endpoint(self):
+        root, c1, c2 = [content.ContentMetadata.objects.using(self.the_channel_id).get(title=title) for title in ("root", "c1", "c2")]
+        url = self._reverse_channel_url("contentmetadata-set-prerequisites-bulk", {})
+        response = self.client.post(url, {'pairs': [[str(c2.content_id), str(root.content_id)]]}, format='json')
+        self.assertEqual(response.data, {'created': 1})
+        self.assertTrue(api.get_all_prerequisites(channel_id=self.the_channel_id, content=root))
+        response = self.client.post(url, {'pairs': [[str(c1.content_id), str(c2.content_id)]]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_set_is_related_endpoint(self):
         root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
         c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
@@ -405,6 +754,20 @@ class ContentMetadataAPITestCase(APITestCase):
         self.client.put(self._reverse_channel_url("contentmetadata_set_is_related", {"content_id": c1.content_id, "related": root.content_id}))
         self.assertTrue(root in api.get_all_related(channel_id=self.the_channel_id, content=c1))
 
+    def test_subtree_endpoint(self):
+        root_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id
+        url = self._reverse_channel_url("contentmetadata-subtree", {"content_id": root_id})
+        # the content lookup and a single range query, whatever the depth
+        with self.assertNumQueries(2, using=self.the_channel_id):
+            response = self.client.get(url, {"depth": 5})
+        self.assertEqual(response.data['content_id'], root_id)
+        self.assertEqual([child['title'] for child in response.data['children'][1]['children']], ['c2c1', 'c2c2', 'c2c3'])
+        response = self.client.get(url, {"depth": 2, "kind": "topic", "fields": "title,slug"})
+        self.assertEqual(sorted(response.data['children'][0]), ['children', 'slug', 'title'])
+        self.assertEqual(self.client.get(url, {"depth": 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"kind": "exercise"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"fields": "title,license"}).status_code, 400)
+
     def test_children_of_kind_endpoint(self):
         root_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id
         response = self.client.get(self._reverse_channel_url("contentmetadata_children_of_kind", {"content_id": root_id, "kind": "topic"}))
@@ -424,6 +787,128 @@ class ContentMetadataAPITestCase(APITestCase):
         self.client.put(self._reverse_channel_url("file_update_content_copy", {"pk": file_3.pk, "content_copy": fpath_1}))
         self.assertEqual(1, len(os.listdir(os.path.join(settings.CONTENT_COPY_DIR, 'd', '4'))))
 
+    def test_conditional_get(self):
+        url = self._reverse_channel_url("contentmetadata-list", {})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(0, using=self.the_channel_id):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # other URLs of the same channel have their own ETags
+        self.assertNotEqual(self.client.get(self._reverse_channel_url("file-list", {}))['ETag'], etag)
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c2 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c2")
+        api.set_prerequisite(channel_id=self.the_channel_id, content1=c2, content2=root)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_endpoint_pages(self):
+        url = self._reverse_channel_url("contentmetadata-list", {})
+        titles, pages = [], 0
+        while url:
+            response = self.client.get(url, {'page_size': 4} if not pages else {})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            titles.extend(data['title'] for data in response.data['results'])
+            url, pages = response.data['next'], pages + 1
+        self.assertEqual(pages, 2)
+        self.assertEqual(titles, ['root', 'c1', 'c2', 'c2c1', 'c2c2', 'c2c3'])
+        for cursor in ('garbage', pagination.encode_cursor([2 ** 70, 1]), pagination.encode_cursor([True, 1])):
+            response = self.client.get(self._reverse_channel_url("contentmetadata-list", {}), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_file_list_endpoint_pages(self):
+        url = self._reverse_channel_url("file-list", {})
+        first = self.client.get(url, {'page_size': 3}).data
+        self.assertEqual(len(first['results']), 3)
+        second = self.client.get(first['next']).data
+        self.assertIsNone(second['next'])
+        urls = [data['url'] for data in first['results'] + second['results']]
+        self.assertEqual(len(set(urls)), content.File.objects.using(self.the_channel_id).count())
+
+    def test_sparse_fields(self):
+        response = self.client.get(self._reverse_channel_url("contentmetadata-list", {}), {'fields': 'title,content_id,leaves'})
+        self.assertEqual([sorted(data) for data in response.data['results']], [['content_id', 'leaves', 'title']] * 6)
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        response = self.client.get(self._reverse_channel_url("contentmetadata-detail", {"content_id": c1.content_id}), {'fields': 'kind'})
+        self.assertEqual(response.data, {'kind': 'video'})
+
+    def test_hyperlinks_from_url_templates(self):
+        response = self.client.get(self._reverse_channel_url("contentmetadata-list", {}))
+        for data in response.data['results']:
+            kwargs = {"content_id": data['content_id']}
+            self.assertEqual(data['url'], 'http://testserver' + self._reverse_channel_url("contentmetadata-detail", kwargs))
+            self.assertEqual(data['leaves'], 'http://testserver' + self._reverse_channel_url("contentmetadata-leaves", kwargs))
+        context = {'channel_id': self.the_channel_id}
+        serializers.ContentMetadataSerializer(content.ContentMetadata.objects.using(self.the_channel_id), context=context, many=True).data
+        self.assertEqual(len(context['url_templates']), 10)
+
+    def _assert_num_queries(self, num, pattern_name, extra_kwargs, params=None):
+        with self.assertNumQueries(num, using=self.the_channel_id):
+            response = self.client.get(self._reverse_channel_url(pattern_name, extra_kwargs), params)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_query_budget(self):
+        # a page, the licenses and parents of its nodes, the relationships of the parents, and the prerequisites and
+        # related contents with their own relationships, however many nodes are on the page
+        for page_size in range(2, 7):
+            self._assert_num_queries(14, "contentmetadata-list", {}, {'page_size': page_size})
+        # the root alone has no parent to load the relationships of
+        self._assert_num_queries(8, "contentmetadata-list", {}, {'page_size': 1})
+        self._assert_num_queries(5, "contentmetadata-list", {}, {'fields': 'title,parent'})
+        self._assert_num_queries(1, "file-list", {})
+
+    def test_endpoint_query_budgets(self):
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        budgets = [
+            ("contentmetadata-detail", root, 6),
+            ("contentmetadata-immediate-children", root, 10),
+            ("contentmetadata-leaves", root, 10),
+            ("contentmetadata-ancestor-topics", c1, 7),
+            ("contentmetadata-all-prerequisites", c1, 7),
+        ]
+        for pattern_name, node, budget in budgets:
+            self._assert_num_queries(budget, pattern_name, {"content_id": node.content_id})
+
+    def test_export_endpoint(self):
+        response = self.client.get(self._reverse_channel_url("contentmetadata-export", {}))
+        self.assertEqual(response.status_code, 200)
+        # the channel is read while the response is streamed, with one query per table
+        with self.assertNumQueries(len(channel_import.channel_models()) + 1, using=self.the_channel_id):
+            objects = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        nodes = [obj for obj in objects if obj['model'] == 'content.contentmetadata']
+        self.assertEqual([node['fields']['title'] for node in nodes], ['root', 'c1', 'c2', 'c2c1', 'c2c2', 'c2c3'])
+        self.assertEqual(len([obj for obj in objects if obj['model'] == 'content.file']), 4)
+
+    def test_response_cache(self):
+        root = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root")
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        url = self._reverse_channel_url("contentmetadata-all-related", {"content_id": c1.content_id})
+        response = self.client.get(url)
+        with self.assertNumQueries(0, using=self.the_channel_id):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+        self.assertEqual(response_cache.response_cache_stats(), {'hits': 1, 'misses': 1})
+        # writing through the API changes the channel version, so the cached response isn't used anymore
+        self.client.put(self._reverse_channel_url("contentmetadata_set_is_related", {"content_id": c1.content_id, "related": root.content_id}))
+        response = self.client.get(url)
+        self.assertIn('root', [data['title'] for data in response.data])
+        self.assertEqual(response_cache.response_cache_stats(), {'hits': 1, 'misses': 2})
+
+    def test_response_cache_per_host(self):
+        root_id = content.ContentMetadata.objects.using(self.the_channel_id).get(title="root").content_id
+        url = self._reverse_channel_url("contentmetadata-immediate-children", {"content_id": root_id})
+        self.client.get(url, HTTP_HOST='alpha.example')
+        # the hyperlinks in the response are absolute, so a client reaching the device by another host isn't served them
+        response = self.client.get(url, HTTP_HOST='beta.example')
+        self.assertIn(b'http://beta.example/', response.content)
+        self.assertNotIn(b'http://alpha.example/', response.content)
+        self.assertEqual(response_cache.response_cache_stats(), {'hits': 0, 'misses': 2})
+
     @classmethod
     def tearDownClass(self):
         """
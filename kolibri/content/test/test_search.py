@@ -0,0 +1,186 @@
+"""
+Tests for searching the content of several channels at once
+"""
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import mock
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import override_settings
+from kolibri.content import api
+from kolibri.content import models as content
+from kolibri.content.utils import search
+from rest_framework.test import APITestCase
+
+from .helpers import copy_channel_schema, create_content_nodes, forget_channel_db
+
+
+class ContentSearchTestCase(APITestCase):
+    """
+    Testcase for searching a single channel, which happens on the calling thread
+    """
+    fixtures = ['channel_test.json', 'content_test.json']
+    multi_db = True
+    the_channel_id = 'content_test'
+    connections.databases[the_channel_id] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+
+    def test_search(self):
+        results = api.search(query='c2', channel_ids=[self.the_channel_id])['results']
+        self.assertEqual([result['title'] for result in results], ['c2', 'c2c1', 'c2c2', 'c2c3'])
+        self.assertEqual(results[0]['channel_id'], self.the_channel_id)
+
+    def test_search_all_terms(self):
+        results = api.search(query='c2 balbla5', channel_ids=[self.the_channel_id])['results']
+        self.assertEqual([result['title'] for result in results], ['c2c2', 'c2c3'])
+
+    def test_search_kinds(self):
+        results = api.search(query='c2', channel_ids=[self.the_channel_id], kinds=['exercise'])['results']
+        self.assertEqual([result['title'] for result in results], ['c2c1'])
+
+    def test_search_empty_query(self):
+        self.assertEqual(api.search(query=' ', channel_ids=[self.the_channel_id])['results'], [])
+
+    @mock.patch('kolibri.content.utils.search.subscribed_channel_ids')
+    def test_search_endpoint(self, subscribed_channel_ids):
+        subscribed_channel_ids.return_value = [self.the_channel_id]
+        response = self.client.get(reverse('channelmetadata-search'), {'q': 'root', 'channel': self.the_channel_id})
+        self.assertEqual(response.data['results'][0]['title'], 'root')
+        self.assertEqual(response.data['incomplete'], [])
+
+    @mock.patch('kolibri.content.utils.search.subscribed_channel_ids')
+    def test_search_endpoint_only_opens_subscribed_channels(self, subscribed_channel_ids):
+        subscribed_channel_ids.return_value = [self.the_channel_id]
+        response = self.client.get(reverse('channelmetadata-search'), {'q': 'root', 'channel': [self.the_channel_id, '../../elsewhere']})
+        self.assertEqual(response.data['results'][0]['title'], 'root')
+        self.assertEqual(response.data['incomplete'], ['../../elsewhere'])
+        self.assertNotIn('../../elsewhere', connections.databases)
+
+
+def has_fts5():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE test_fts5 USING fts5(text)')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+@unittest.skipUnless(has_fts5(), 'sqlite was built without FTS5')
+class FullTextSearchTestCase(TestCase):
+    """
+    Testcase for searching a channel through its full-text index
+    """
+    fixtures = ['channel_test.json', 'content_test.json']
+    multi_db = True
+    the_channel_id = 'content_test'
+
+    def setUp(self):
+        self.assertTrue(search.build_search_index(self.the_channel_id))
+
+    def _search_titles(self, query):
+        return set(result['title'] for result in api.search(query=query, channel_ids=[self.the_channel_id])['results'])
+
+    def test_search_prefix(self):
+        self.assertEqual(self._search_titles('c2'), set(['c2', 'c2c1', 'c2c2', 'c2c3']))
+        self.assertEqual(self._search_titles('balbla5'), set(['c2c2', 'c2c3']))
+
+    def test_search_special_characters(self):
+        self.assertEqual(self._search_titles('"c2 AND'), set())
+
+    def test_index_follows_title_updates(self):
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        c1.title = 'Photosynthesis'
+        c1.save()
+        self.assertEqual(self._search_titles('photo'), set(['Photosynthesis']))
+        self.assertEqual(self._search_titles('c1'), set())
+
+    def test_index_follows_tags(self):
+        c1 = content.ContentMetadata.objects.using(self.the_channel_id).get(title="c1")
+        tag = content.ContentTag.objects.using(self.the_channel_id).create(tag_name='fractions')
+        c1.tags.add(tag)
+        self.assertEqual(self._search_titles('fractions'), set(['c1']))
+        c1.tags.remove(tag)
+        self.assertEqual(self._search_titles('fractions'), set())
+
+    def tearDown(self):
+        search.forget_search_index(self.the_channel_id)
+
+
+class FederatedSearchTestCase(TestCase):
+    """
+    Testcase for searching channel databases on disk in parallel
+    """
+    multi_db = True
+    the_channel_id = 'content_test'
+
+    def setUp(self):
+        self.content_db_dir = tempfile.mkdtemp()
+        for alias, titles in (('maths', ['Fractions', 'Decimals', 'Decimals and fractions']), ('science', ['Fractions of cells', 'Atoms'])):
+            path = os.path.join(self.content_db_dir, alias + '.sqlite3')
+            copy_channel_schema(self.the_channel_id, path)
+            create_content_nodes(path, titles)
+
+    def test_search_across_channels(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_SEARCH_THREADS=2):
+            found = api.search(query='fractions', channel_ids=['maths', 'science', 'missing'])
+        self.assertEqual(
+            [(result['channel_id'], result['title']) for result in found['results']],
+            [('maths', 'Fractions'), ('science', 'Fractions of cells'), ('maths', 'Decimals and fractions')],
+        )
+        self.assertEqual(found['incomplete'], ['missing'])
+
+    @unittest.skipUnless(has_fts5(), 'sqlite was built without FTS5')
+    def test_search_ranks_full_text_and_substring_matches_together(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_SEARCH_THREADS=1):
+            # only maths gets a full-text index, science falls back to substring matching
+            self.assertTrue(search.build_search_index(search.channel_databases.get_alias('maths')))
+            found = api.search(query='fractions', channel_ids=['maths', 'science'])
+        self.assertEqual(
+            [(result['channel_id'], result['title']) for result in found['results']],
+            [('maths', 'Fractions'), ('science', 'Fractions of cells'), ('maths', 'Decimals and fractions')],
+        )
+        self.assertEqual(found['results'][0]['score'], found['results'][1]['score'])
+
+    @unittest.skipUnless(has_fts5(), 'sqlite was built without FTS5')
+    def test_search_ranks_weak_matches_last_in_every_channel(self):
+        db = sqlite3.connect(os.path.join(self.content_db_dir, 'science.sqlite3'))
+        db.execute("UPDATE content_contentmetadata SET description = 'Smaller than decimals' WHERE title = 'Atoms'")
+        db.commit()
+        db.close()
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_SEARCH_THREADS=1):
+            self.assertTrue(search.build_search_index(search.channel_databases.get_alias('maths')))
+            found = api.search(query='decimals', channel_ids=['maths', 'science'])
+        # science only matches in a description, which doesn't compete with the title matches of maths
+        self.assertEqual(
+            [(result['channel_id'], result['title']) for result in found['results']],
+            [('maths', 'Decimals'), ('maths', 'Decimals and fractions'), ('science', 'Atoms')],
+        )
+
+    def test_substring_search_keeps_the_best_matches(self):
+        db = sqlite3.connect(os.path.join(self.content_db_dir, 'maths.sqlite3'))
+        db.execute("UPDATE content_contentmetadata SET description = 'All about decimals' WHERE title = 'root'")
+        db.commit()
+        db.close()
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            results = search.search_channel('maths', 'decimals', limit=2)
+        self.assertEqual([result['title'] for result in results], ['Decimals', 'Decimals and fractions'])
+
+    def test_search_limit_is_capped(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir, CONTENT_SEARCH_MAX_LIMIT=1):
+            found = api.search(query='fractions', channel_ids=['maths', 'science'], limit=100)
+        self.assertEqual(len(found['results']), 1)
+
+    def tearDown(self):
+        search.forget_search_index('maths')
+        for alias in ('maths', 'science', 'missing'):
+            forget_channel_db(alias)
+        shutil.rmtree(self.content_db_dir)
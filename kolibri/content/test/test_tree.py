@@ -0,0 +1,98 @@
+"""
+Tests for the in-memory topic trees of channels
+"""
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from kolibri.content import api
+from kolibri.content import models as content
+from kolibri.content.utils import tree
+
+from .helpers import copy_channel_schema, create_content_nodes, forget_channel_db
+
+
+@override_settings(CONTENT_TREE_CACHE=True)
+class ChannelTreeTestCase(TestCase):
+    """
+    Testcase for answering the navigation API from the in-memory tree
+    """
+    fixtures = ['channel_test.json', 'content_test.json']
+    multi_db = True
+    the_channel_id = 'content_test'
+
+    def setUp(self):
+        tree.forget_channel_tree()
+        self.nodes = dict((cm.title, cm) for cm in content.ContentMetadata.objects.using(self.the_channel_id))
+
+    def _titles(self, ids):
+        titles = dict((cm.id, cm.title) for cm in self.nodes.values())
+        return [titles[pk] for pk in ids]
+
+    def test_channel_tree(self):
+        channel_tree = tree.channel_tree(self.the_channel_id)
+        self.assertEqual(len(channel_tree), 6)
+        root, c2, c2c2 = self.nodes['root'].id, self.nodes['c2'].id, self.nodes['c2c2'].id
+        self.assertEqual(self._titles(channel_tree.children(root)), ['c1', 'c2'])
+        self.assertEqual(self._titles(channel_tree.descendants(root, kind='topic')), ['c2', 'c2c2', 'c2c3'])
+        self.assertEqual(self._titles(channel_tree.leaves(c2)), ['c2c1', 'c2c2', 'c2c3'])
+        self.assertEqual(self._titles(channel_tree.ancestors(c2c2)), ['root', 'c2'])
+        self.assertEqual(channel_tree.descendants(root, kind='audio'), [])
+
+    def test_navigation_matches_the_database(self):
+        for title in self.nodes:
+            node = self.nodes[title]
+            with override_settings(CONTENT_TREE_CACHE=False):
+                expected = [
+                    list(api.immediate_children(channel_id=self.the_channel_id, content=node)),
+                    list(api.leaves(channel_id=self.the_channel_id, content=node)),
+                    list(api.children_of_kind(channel_id=self.the_channel_id, content=node, kind='topic')),
+                    list(api.get_ancestor_topics(channel_id=self.the_channel_id, content=node)),
+                ]
+            self.assertEqual([
+                list(api.immediate_children(channel_id=self.the_channel_id, content=node)),
+                list(api.leaves(channel_id=self.the_channel_id, content=node)),
+                list(api.children_of_kind(channel_id=self.the_channel_id, content=node, kind='topic')),
+                list(api.get_ancestor_topics(channel_id=self.the_channel_id, content=node)),
+            ], expected)
+
+    def test_empty_answers_take_no_query(self):
+        tree.channel_tree(self.the_channel_id)
+        with self.assertNumQueries(0, using=self.the_channel_id):
+            self.assertEqual(list(api.immediate_children(channel_id=self.the_channel_id, content=self.nodes['c1'])), [])
+            self.assertEqual(list(api.get_ancestor_topics(channel_id=self.the_channel_id, content=self.nodes['root'])), [])
+
+
+class ChannelTreeReloadTestCase(TestCase):
+    """
+    Testcase for reloading the tree of a channel database that changed on disk
+    """
+    multi_db = True
+
+    def setUp(self):
+        self.content_db_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.content_db_dir, 'maths.sqlite3')
+        copy_channel_schema('content_test', self.path)
+        create_content_nodes(self.path, ['Fractions'])
+
+    def test_reload(self):
+        with override_settings(CONTENT_DB_DIR=self.content_db_dir):
+            self.assertEqual(len(tree.channel_tree('maths')), 2)
+            db = sqlite3.connect(self.path)
+            db.execute("UPDATE content_contentmetadata SET rght = 6 WHERE id = 1")
+            db.execute(
+                "INSERT INTO content_contentmetadata (id, parent_id, title, kind, lft, rght, level, content_id, slug, "
+                "total_file_size, available, license_id, tree_id) VALUES (3, 1, 'Decimals', 'video', 4, 5, 1, "
+                "lower(hex(randomblob(16))), 'slug', 0, 1, 1, 1)")
+            db.commit()
+            db.close()
+            self.assertEqual(tree.channel_tree('maths').children(1), [2, 3])
+
+    def tearDown(self):
+        forget_channel_db('maths')
+        shutil.rmtree(self.content_db_dir)
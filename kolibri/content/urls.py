@@ -3,10 +3,17 @@
 Most of the api endpoints here use django_rest_framework to expose the content app APIs,
 except some set methods that do not return anything.
 """
+import uuid
+
 from django.conf.urls import include, url
-from kolibri.content import api, models, serializers
-from rest_framework import viewsets
-from rest_framework.decorators import detail_route
+from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+from kolibri.content import api, models, pagination, serializers
+from kolibri.content.utils.conditional import ChannelConditionalMixin
+from kolibri.content.utils.graph import PrerequisiteCycleError
+from kolibri.content.utils.response_cache import ChannelResponseCacheMixin
+from rest_framework import status, viewsets
+from rest_framework.decorators import detail_route, list_route
 from rest_framework.response import Response
 from rest_framework_nested import routers
 
@@ -22,22 +29,48 @@ class ChannelMetadataViewSet(viewsets.ViewSet):
         channel = serializers.ChannelMetadataSerializer(models.ChannelMetadata.objects.get(channel_id=channel_id), context={'request': request}).data
         return Response(channel)
 
+    @list_route()
+    def search(self, request, *args, **kwargs):
+        """
+        endpoint for content api method
+        search(query=None, channel_ids=None, kinds=None, limit=50)
+        search within given channels with ?channel=<channel_id>&channel=..., and for given kinds with ?kind=<kind>&kind=...
+        Channels the device isn't subscribed to are reported under 'incomplete' without being opened.
+        """
+        limit = request.query_params.get('limit')
+        channel_ids = request.query_params.getlist('channel') or None
+        unknown = []
+        if channel_ids is not None:
+            # unlike channel ids in URL segments, query parameters can hold anything, e.g. paths to other sqlite files
+            subscribed = set(api.content_search.subscribed_channel_ids())
+            unknown = [channel_id for channel_id in channel_ids if channel_id not in subscribed]
+            channel_ids = [channel_id for channel_id in channel_ids if channel_id in subscribed]
+        found = api.search(
+            query=request.query_params.get('q', ''),
+            channel_ids=channel_ids,
+            kinds=request.query_params.getlist('kind') or None,
+            limit=int(limit) if limit and limit.isdigit() else api.content_search.DEFAULT_SEARCH_LIMIT,
+        )
+        found['incomplete'].extend(unknown)
+        return Response(found)
+
 
-class ContentMetadataViewset(viewsets.ViewSet):
+class ContentMetadataViewset(ChannelConditionalMixin, ChannelResponseCacheMixin, viewsets.ViewSet):
     lookup_field = 'content_id'
 
     def list(self, request, channelmetadata_channel_id=None):
         context = {'request': request, 'channel_id': channelmetadata_channel_id}
-        contents = serializers.ContentMetadataSerializer(
-            models.ContentMetadata.objects.using(channelmetadata_channel_id).all(), context=context, many=True
-        ).data
-        return Response(contents)
+        paginator = pagination.ContentMetadataPagination()
+        page = paginator.paginate_queryset(models.ContentMetadata.objects.using(channelmetadata_channel_id).all(), request, view=self)
+        contents = serializers.ContentMetadataSerializer(page, context=context, many=True).data
+        return paginator.get_paginated_response(contents)
 
     def retrieve(self, request, content_id=None, channelmetadata_channel_id=None):
         context = {'request': request, 'channel_id': channelmetadata_channel_id}
-        content = serializers.ContentMetadataSerializer(
-            models.ContentMetadata.objects.using(channelmetadata_channel_id).get(content_id=content_id), context=context
-        ).data
+        contents = serializers.load_related_contents(
+            models.ContentMetadata.objects.using(channelmetadata_channel_id).all(), serializers.ContentMetadataSerializer(context=context).fields
+        )
+        content = serializers.ContentMetadataSerializer(contents.get(content_id=content_id), context=context).data
         return Response(content)
 
     @detail_route()
@@ -52,6 +85,132 @@ class ContentMetadataViewset(viewsets.ViewSet):
         ).data
         return Response(data)
 
+    @list_route()
+    def ancestor_topics_bulk(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_ancestor_topics_bulk(channel_id=None, contents=None)
+        takes the content ids as ?content_id=<content_id>&content_id=...
+        every ancestor topic is listed once under "ancestors", "chains" maps each content id to its ancestor ids
+        """
+        context = {'request': request, 'channel_id': channelmetadata_channel_id}
+        try:
+            chains = api.get_ancestor_topics_bulk(channel_id=channelmetadata_channel_id, contents=request.query_params.getlist('content_id'))
+        except TypeError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        ancestors = {}
+        for chain in chains.values():
+            for ancestor in chain:
+                ancestors[ancestor.pk] = ancestor
+        data = {
+            'ancestors': serializers.AncestorTopicSerializer(list(ancestors.values()), context=context, many=True).data,
+            'chains': dict((content_id, [str(ancestor.content_id) for ancestor in chain]) for content_id, chain in chains.items()),
+        }
+        return Response(data)
+
+    @list_route(methods=['get', 'post'])
+    def lookup(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_contents_in_order(channel_id=None, contents=None)
+        takes the content ids as ?content_id=<content_id>&content_id=... or {"content_ids": [...]}, and returns the contents
+        in that order under "results", and the content ids that don't exist under "missing"
+        """
+        if request.method == 'POST':
+            content_ids = request.data.get('content_ids')
+            if not isinstance(content_ids, list):
+                return Response({'detail': 'expected a list of content ids under "content_ids"'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            content_ids = request.query_params.getlist('content_id')
+        try:
+            contents = api.get_contents_in_order(channel_id=channelmetadata_channel_id, contents=content_ids)
+        except TypeError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        context = {'request': request, 'channel_id': channelmetadata_channel_id}
+        found = set(str(content.content_id) for content in contents)
+        return Response({
+            'results': serializers.ContentMetadataSerializer(contents, context=context, many=True).data,
+            'missing': [content_id for content_id in content_ids if str(uuid.UUID(str(content_id))) not in found],
+        })
+
+    def _set_relationships_bulk(self, request, channel_id, set_bulk):
+        pairs = request.data.get('pairs')
+        if not isinstance(pairs, list):
+            return Response({'detail': 'expected a list of [content_id, content_id] pairs under "pairs"'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            created = set_bulk(channel_id=channel_id, pairs=pairs)
+        except (TypeError, IntegrityError, models.ContentMetadata.DoesNotExist) as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': created})
+
+    def _best_files_response(self, request, channel_id, get_best_files, **kwargs):
+        context = {'request': request, 'channel_id': channel_id}
+        best = get_best_files(
+            channel_id=channel_id,
+            qualities=request.query_params.getlist('quality') or api.QUALITY_PREFERENCE,
+            mimetypes=request.query_params.getlist('mimetype') or None,
+            **kwargs
+        )
+        return Response([{
+            'content_id': content_id,
+            'quality': the_file.format.quality if the_file else None,
+            'mimetype': the_file.format.mimetype.machine_name if the_file else None,
+            'file': serializers.FileSerializer(the_file, context=context).data if the_file else None,
+        } for content_id, the_file in best.items()])
+
+    @list_route()
+    def best_files(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_best_files(channel_id=None, contents=None, qualities=QUALITY_PREFERENCE, mimetypes=None)
+        takes the content ids as ?content_id=<content_id>&content_id=..., and the preferred qualities and mimetypes,
+        best first, as ?quality=high&quality=low and ?mimetype=<machine name>&mimetype=...
+        """
+        try:
+            return self._best_files_response(
+                request, channelmetadata_channel_id, api.get_best_files, contents=request.query_params.getlist('content_id'))
+        except TypeError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @detail_route()
+    def best_files_for_topic(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_best_files_for_topic(channel_id=None, content=None, qualities=QUALITY_PREFERENCE, mimetypes=None, **kwargs)
+        takes the preferred qualities and mimetypes like best_files
+        """
+        return self._best_files_response(
+            request, channelmetadata_channel_id, api.get_best_files_for_topic, content=self.kwargs['content_id'])
+
+    @list_route()
+    def export(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        export_channel(channel_id=None)
+        streams the whole channel as a fixture that the importchannel command can read
+        """
+        response = StreamingHttpResponse(api.export_channel(channel_id=channelmetadata_channel_id), content_type='application/json')
+        response['Content-Disposition'] = 'attachment; filename="%s.json"' % channelmetadata_channel_id
+        return response
+
+    @list_route(methods=['post'])
+    def set_prerequisites_bulk(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        set_prerequisites_bulk(channel_id=None, pairs=None)
+        takes {"pairs": [[content_id, prerequisite_of_content_id], ...]}, and returns the number of relationships created
+        """
+        return self._set_relationships_bulk(request, channelmetadata_channel_id, api.set_prerequisites_bulk)
+
+    @list_route(methods=['post'])
+    def set_is_related_bulk(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        set_is_related_bulk(channel_id=None, pairs=None)
+        takes {"pairs": [[content_id, related_content_id], ...]}, and returns the number of relationships created
+        """
+        return self._set_relationships_bulk(request, channelmetadata_channel_id, api.set_is_related_bulk)
+
     @detail_route()
     def immediate_children(self, request, channelmetadata_channel_id, *args, **kwargs):
         """
@@ -64,6 +223,15 @@ class ContentMetadataViewset(viewsets.ViewSet):
         ).data
         return Response(data)
 
+    @detail_route()
+    def navigation_children(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        navigation_children(channel_id=None, content=None, **kwargs)
+        a slim version of immediate_children, with no hyperlinks and the number of descendants of each child
+        """
+        return Response(api.navigation_children(channel_id=channelmetadata_channel_id, content=self.kwargs['content_id']))
+
     @detail_route()
     def leaves(self, request, channelmetadata_channel_id, *args, **kwargs):
         """
@@ -76,6 +244,46 @@ class ContentMetadataViewset(viewsets.ViewSet):
         ).data
         return Response(data)
 
+    @detail_route()
+    def summary(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_content_summary(channel_id=None, content=None, **kwargs)
+        """
+        context = {'request': request, 'channel_id': channelmetadata_channel_id}
+        data = serializers.ContentSummarySerializer(
+            api.get_content_summary(channel_id=channelmetadata_channel_id, content=self.kwargs['content_id']), context=context
+        ).data
+        return Response(data)
+
+    @detail_route()
+    def subtree(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_subtree(channel_id=None, content=None, depth=1, kind=None, fields=SUBTREE_FIELDS, **kwargs)
+        takes ?depth=<levels below the content>, ?kind=topic and ?fields=<comma separated fields>
+        """
+        depth = request.query_params.get('depth', '1')
+        if not depth.isdigit() or int(depth) < 1:
+            return Response({'detail': 'depth must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+        fields = api.SUBTREE_FIELDS
+        if request.query_params.get('fields'):
+            fields = tuple(request.query_params['fields'].split(','))
+            unknown = set(fields) - set(api.SUBTREE_FIELD_CHOICES)
+            if unknown:
+                return Response({'detail': 'unknown fields: %s' % ', '.join(sorted(unknown))}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            data = api.get_subtree(
+                channel_id=channelmetadata_channel_id,
+                content=self.kwargs['content_id'],
+                depth=int(depth),
+                kind=request.query_params.get('kind'),
+                fields=fields,
+            )
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
     @detail_route()
     def all_prerequisites(self, request, channelmetadata_channel_id, *args, **kwargs):
         """
@@ -88,6 +296,45 @@ class ContentMetadataViewset(viewsets.ViewSet):
         ).data
         return Response(data)
 
+    @detail_route()
+    def transitive_prerequisites(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_transitive_prerequisites(channel_id=None, content=None, **kwargs)
+        """
+        context = {'request': request, 'channel_id': channelmetadata_channel_id}
+        data = serializers.ContentMetadataSerializer(
+            api.get_transitive_prerequisites(channel_id=channelmetadata_channel_id, content=self.kwargs['content_id']), context=context, many=True
+        ).data
+        return Response(data)
+
+    @detail_route()
+    def transitive_dependents(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_transitive_dependents(channel_id=None, content=None, **kwargs)
+        """
+        context = {'request': request, 'channel_id': channelmetadata_channel_id}
+        data = serializers.ContentMetadataSerializer(
+            api.get_transitive_dependents(channel_id=channelmetadata_channel_id, content=self.kwargs['content_id']), context=context, many=True
+        ).data
+        return Response(data)
+
+    @detail_route()
+    def learning_order(self, request, channelmetadata_channel_id, *args, **kwargs):
+        """
+        endpoint for content api method
+        get_learning_order(channel_id=None, content=None, **kwargs)
+        """
+        context = {'request': request, 'channel_id': channelmetadata_channel_id}
+        try:
+            learning_order = api.get_learning_order(channel_id=channelmetadata_channel_id, content=self.kwargs['content_id'])
+        except PrerequisiteCycleError as e:
+            # imported channel databases can hold prerequisites that form a closed loop
+            return Response({'detail': str(e), 'cycle': e.cycle}, status=status.HTTP_409_CONFLICT)
+        data = serializers.ContentMetadataSerializer(learning_order, context=context, many=True).data
+        return Response(data)
+
     @detail_route()
     def all_related(self, request, channelmetadata_channel_id, *args, **kwargs):
         """
@@ -188,11 +435,13 @@ class ContentMetadataViewset(viewsets.ViewSet):
         return Response(data)
 
 
-class FileViewset(viewsets.ViewSet):
+class FileViewset(ChannelConditionalMixin, ChannelResponseCacheMixin, viewsets.ViewSet):
     def list(self, request, channelmetadata_channel_id=None):
         context = {'request': request, 'channel_id': channelmetadata_channel_id}
-        files = serializers.FileSerializer(models.File.objects.using(channelmetadata_channel_id).all(), context=context, many=True).data
-        return Response(files)
+        paginator = pagination.FilePagination()
+        page = paginator.paginate_queryset(models.File.objects.using(channelmetadata_channel_id).all(), request, view=self)
+        files = serializers.FileSerializer(page, context=context, many=True).data
+        return paginator.get_paginated_response(files)
 
     def retrieve(self, request, pk=None, channelmetadata_channel_id=None):
         context = {'request': request, 'channel_id': channelmetadata_channel_id}
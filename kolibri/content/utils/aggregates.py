@@ -0,0 +1,197 @@
+"""
+Precomputed per-node totals of a channel, stored in the ContentSummary table of each channel database.
+
+``build_summaries`` computes the totals of every node of a channel in a single bottom-up pass over the tree,
+and ``update_summaries_for_file`` keeps the file counts and sizes of a node and its ancestors up to date when one
+of its files becomes available or missing, with a single UPDATE. Channel databases created by older versions don't
+have the ContentSummary table until they get upgraded, and have the summaries of their nodes computed when asked for.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import logging
+from collections import defaultdict
+
+from django.db import DatabaseError, connections, transaction
+from kolibri.content.utils.channels import channel_databases
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+class Totals(object):
+    """
+    Running totals over a node and the descendants visited so far.
+    """
+    __slots__ = ('kind_counts', 'file_count', 'missing_file_count', 'total_file_size', 'available_file_size')
+
+    def __init__(self):
+        self.kind_counts = defaultdict(int)
+        self.file_count = 0
+        self.missing_file_count = 0
+        self.total_file_size = 0
+        self.available_file_size = 0
+
+    def add(self, other, kind):
+        """
+        Add the totals of a child of the given kind.
+        """
+        self.kind_counts[kind] += 1
+        for child_kind, count in other.kind_counts.items():
+            self.kind_counts[child_kind] += count
+        self.file_count += other.file_count
+        self.missing_file_count += other.missing_file_count
+        self.total_file_size += other.total_file_size
+        self.available_file_size += other.available_file_size
+
+
+def _has_summary_table(alias):
+    from kolibri.content.models import ContentSummary
+    return ContentSummary._meta.db_table in connections[alias].introspection.table_names()
+
+def has_summary_table(alias):
+    """
+    Check if a channel database has the ContentSummary table, which channel databases created by older versions miss,
+    remembering the answer until the database changes on disk.
+
+    :param alias: str, the channel alias or its writable alias
+    :return: bool
+    """
+    return channel_databases.cached('summary_table', alias, _has_summary_table)
+
+def _in_subtree(prefix, subtree):
+    if subtree is None:
+        return {}
+    tree_id, lft, rght = subtree
+    return {prefix + 'tree_id': tree_id, prefix + 'lft__gte': lft, prefix + 'rght__lte': rght}
+
+def compute_totals(alias, subtree=None):
+    """
+    Compute the totals of every node of a channel, or of a subtree of it, children before parents,
+    from three grouped queries.
+
+    :param alias: str
+    :param subtree: tuple of (tree_id, lft, rght) of the root of the subtree, or None for the whole channel
+    :return: dict of ContentMetadata id to Totals
+    """
+    from django.db.models import Count, Sum
+    from kolibri.content.models import ContentMetadata, File, Format
+    totals = defaultdict(Totals)
+    formats = Format.objects.db_manager(alias).filter(**_in_subtree('contentmetadata__', subtree))
+    for node_id, size in formats.values_list('contentmetadata').annotate(size=Sum('format_size')):
+        totals[node_id].total_file_size = size or 0
+    files = File.objects.db_manager(alias).filter(**_in_subtree('format__contentmetadata__', subtree))\
+        .values_list('format__contentmetadata', 'available').annotate(count=Count('id'), size=Sum('file_size'))
+    for node_id, available, count, size in files:
+        totals[node_id].file_count += count
+        if available:
+            totals[node_id].available_file_size += size or 0
+        else:
+            totals[node_id].missing_file_count += count
+    nodes = ContentMetadata.objects.db_manager(alias).filter(**_in_subtree('', subtree))\
+        .order_by('tree_id', 'lft').values_list('id', 'parent_id', 'kind')
+    # in reverse tree order, every node comes after all of its descendants
+    for node_id, parent_id, kind in reversed(list(nodes)):
+        node_totals = totals[node_id]
+        if parent_id is not None:
+            totals[parent_id].add(node_totals, kind)
+    return totals
+
+def _summary(node_id, node_totals):
+    from kolibri.content.models import ContentSummary
+    return ContentSummary(
+        contentmetadata_id=node_id,
+        kind_counts=json.dumps(node_totals.kind_counts, sort_keys=True),
+        file_count=node_totals.file_count,
+        missing_file_count=node_totals.missing_file_count,
+        total_file_size=node_totals.total_file_size,
+        available_file_size=node_totals.available_file_size,
+    )
+
+def compute_summary(alias, node_id):
+    """
+    Compute the ContentSummary of a node from its subtree without saving it, for channel databases that don't
+    have the summaries or can't be written to.
+
+    :param alias: str
+    :param node_id: int, the ContentMetadata id
+    :return: ContentSummary
+    """
+    from kolibri.content.models import ContentMetadata
+    subtree = ContentMetadata.objects.db_manager(alias).values_list('tree_id', 'lft', 'rght').get(id=node_id)
+    return _summary(node_id, compute_totals(alias, subtree)[node_id])
+
+def build_summaries(alias):
+    """
+    (Re)build the ContentSummary of every node of a channel, through its writable connection.
+    Creates the ContentSummary table if the channel database predates it.
+
+    :param alias: str
+    :return: int, the number of summaries written
+    """
+    from kolibri.content.models import ContentMetadata, ContentSummary
+    totals = compute_totals(alias)
+    node_ids = set(ContentMetadata.objects.db_manager(alias).values_list('id', flat=True))
+    writable = channel_databases.writable_alias(alias)
+    with transaction.atomic(using=writable):
+        if not _has_summary_table(writable):
+            with connections[writable].schema_editor() as schema_editor:
+                schema_editor.create_model(ContentSummary)
+            channel_databases.forget_cached('summary_table', alias)
+        ContentSummary.objects.db_manager(writable).all().delete()
+        summaries = [_summary(node_id, node_totals) for node_id, node_totals in totals.items() if node_id in node_ids]
+        ContentSummary.objects.db_manager(writable).bulk_create(summaries, batch_size=BATCH_SIZE)
+    logger.info("Built %d content summaries for ContentDB '%s'", len(summaries), alias)
+    return len(summaries)
+
+def build_missing_summaries(alias):
+    """
+    Build the content summaries of a channel database that doesn't have them yet, logging rather than raising
+    if it can't be done.
+
+    :param alias: str
+    """
+    from kolibri.content.models import ContentMetadata, ContentSummary
+    try:
+        if _has_summary_table(alias) and ContentSummary.objects.db_manager(alias).exists():
+            return
+        if ContentMetadata.objects.db_manager(alias).exists():
+            build_summaries(alias)
+    except DatabaseError as e:
+        logger.warning("Could not build the content summaries of ContentDB '%s': %s", alias, e)
+
+def update_summaries_for_file(alias, file_object, previous):
+    """
+    Update the summaries of the content a file belongs to and of all its ancestors, after the file got saved.
+
+    :param alias: str, the database the file was saved to
+    :param file_object: File
+    :param previous: tuple of (available, file_size) before the save, or None for a new file
+    """
+    from kolibri.content.models import ContentMetadata, ContentSummary, Format
+    was_available, previous_size = previous or (False, None)
+    file_count = 0 if previous else 1
+    missing_file_count = int(not file_object.available) - (int(not was_available) if previous else 0)
+    available_file_size = ((file_object.file_size or 0) if file_object.available else 0) - ((previous_size or 0) if was_available else 0)
+    if not (file_count or missing_file_count or available_file_size) or file_object.format_id is None:
+        return
+    if not has_summary_table(alias):
+        # channel databases created by older versions get their summaries built later, from the files as they are then
+        return
+    cursor = connections[alias].cursor()
+    try:
+        cursor.execute(
+            'UPDATE {summary} SET file_count = file_count + %s, missing_file_count = missing_file_count + %s, '
+            'available_file_size = available_file_size + %s WHERE contentmetadata_id IN ('
+            'SELECT ancestor.id FROM {content} ancestor JOIN {content} node ON ancestor.tree_id = node.tree_id '
+            'AND ancestor.lft <= node.lft AND ancestor.rght >= node.rght '
+            'WHERE node.id = (SELECT contentmetadata_id FROM {format} WHERE id = %s))'.format(
+                summary=ContentSummary._meta.db_table,
+                content=ContentMetadata._meta.db_table,
+                format=Format._meta.db_table,
+            ),
+            [file_count, missing_file_count, available_file_size, file_object.format_id],
+        )
+    finally:
+        cursor.close()
@@ -0,0 +1,110 @@
+"""
+Streaming export of a channel database.
+
+The export is a Django fixture of the channel's content, the format ``channel_import.read_channel_export`` reads,
+with the content nodes in tree order so it can be imported again as is. Django can't stream the results of a query
+from sqlite, where ``.iterator()`` still fetches every row up front, so rows are read a page at a time with keyset
+queries picking up right after the last row of the previous page (see ``kolibri.content.pagination``), and memory
+use doesn't grow with the size of the channel. The tags of the content nodes are paged through in the same tree
+order, and merged in rather than queried node by node.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import itertools
+import json
+import operator
+
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from kolibri.content.pagination import after
+from kolibri.content.utils.channel_import import channel_models
+
+CHUNK_SIZE = 500
+
+TREE_ORDER = ('tree_id', 'lft')
+
+TAG_ORDER = ('contentmetadata__tree_id', 'contentmetadata__lft', 'contenttag_id')
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+def _pages(queryset, ordering, page_size, position):
+    """
+    Read the rows of queryset in ordering, one keyset query per page of rows.
+
+    :param ordering: tuple of field names, all ascending and unique together
+    :param position: function getting the values of the ordering fields of a row
+    :return: generator of lists of rows
+    """
+    queryset = queryset.order_by(*ordering)
+    page = list(queryset[:page_size])
+    while page:
+        yield page
+        if len(page) < page_size:
+            return
+        page = list(queryset.filter(after(ordering, position(page[-1])))[:page_size])
+
+def _content_tags(alias, page_size=CHUNK_SIZE):
+    from kolibri.content.models import ContentMetadata
+    through = ContentMetadata.tags.through
+    rows = through.objects.db_manager(alias).values_list(*('contentmetadata_id',) + TAG_ORDER)
+    pages = _pages(rows, TAG_ORDER, page_size, operator.itemgetter(1, 2, 3))
+    pairs = ((row[0], row[3]) for page in pages for row in page)
+    return itertools.groupby(pairs, key=operator.itemgetter(0))
+
+def _with_tags(objects, tag_groups):
+    # objects and tag_groups are both in tree order, so each group belongs to the next node that has tags
+    group = next(tag_groups, None)
+    for obj in objects:
+        tags = []
+        if group is not None and group[0] == obj['pk']:
+            tags = [tag_id for _, tag_id in group[1]]
+            group = next(tag_groups, None)
+        obj['fields']['tags'] = tags
+        yield obj
+
+def _serialize(queryset, ordering, fields=None, chunk_size=CHUNK_SIZE):
+    serializer = serializers.get_serializer('python')()
+    for page in _pages(queryset, ordering, chunk_size, lambda obj: [getattr(obj, field) for field in ordering]):
+        for obj in serializer.serialize(page, fields=fields):
+            yield obj
+
+def iter_channel_objects(alias, chunk_size=CHUNK_SIZE):
+    """
+    Read the content of a channel database as fixture objects, content nodes in tree order and other rows by pk.
+
+    :param alias: str
+    :param chunk_size: int, number of rows read per query and serialized at once
+    :return: generator of dict
+    """
+    from kolibri.content.models import ContentMetadata
+    for model in channel_models():
+        queryset = model._default_manager.db_manager(alias).all()
+        if model is ContentMetadata:
+            fields = [field.name for field in model._meta.local_fields if not field.primary_key]
+            objects = _serialize(queryset, TREE_ORDER, fields=fields, chunk_size=chunk_size)
+            for obj in _with_tags(objects, _content_tags(alias, chunk_size)):
+                yield obj
+        else:
+            for obj in _serialize(queryset, ('pk',), chunk_size=chunk_size):
+                yield obj
+
+def stream_channel_export(alias, chunk_size=CHUNK_SIZE):
+    """
+    Write the content of a channel database as a fixture, a chunk of objects at a time.
+
+    :param alias: str
+    :param chunk_size: int, number of objects per piece of text
+    :return: generator of str
+    """
+    yield '['
+    separator = '\n'
+    for chunk in _chunks(iter_channel_objects(alias, chunk_size), chunk_size):
+        yield separator + ',\n'.join(json.dumps(obj, cls=DjangoJSONEncoder) for obj in chunk)
+        separator = ',\n'
+    yield '\n]\n'
@@ -0,0 +1,313 @@
+"""
+Streaming import of a channel export into a channel database.
+
+A channel export is either a Django fixture (a JSON array of ``{"model": ..., "pk": ..., "fields": {...}}`` objects)
+or the same objects as JSON lines, one per line. It is read one object at a time, and the rows are written with
+``bulk_create`` in batches of ``BATCH_SIZE`` inside a single transaction, so memory use doesn't grow with the size
+of the channel.
+
+The MPTT columns of the content nodes are not taken from the export but numbered in the same pass: content nodes
+must come in tree order (every node right after its parent or its previous sibling's subtree), and only the path
+from the root to the current node is kept in memory. A node gets its ``rght`` once its subtree is complete, which is
+when it gets written.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import logging
+import time
+
+from django.apps import apps
+from django.core import serializers
+from django.db import connections, transaction
+from kolibri.content.utils import aggregates, graph, indexes, search, tree
+from kolibri.content.utils.channels import channel_databases
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+READ_SIZE = 64 * 1024
+
+
+def read_json_lines(lines):
+    """
+    Read the objects of a JSON lines channel export.
+
+    :param lines: iterable of str
+    :return: generator of dict
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def read_fixture(fileobj, read_size=READ_SIZE):
+    """
+    Read the objects of a fixture channel export one at a time, without loading the whole array.
+
+    :param fileobj: file opened in text mode
+    :param read_size: int, number of characters read at once
+    :return: generator of dict
+    """
+    decoder = json.JSONDecoder()
+    buffer = fileobj.read(read_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('A fixture channel export must be a JSON array')
+    buffer = buffer[1:]
+    exhausted = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except ValueError:
+            # the next object doesn't fit in the buffer yet
+            if exhausted:
+                raise ValueError('The fixture channel export ends in the middle of an object')
+            more = fileobj.read(read_size)
+            exhausted = not more
+            buffer += more
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+def read_channel_export(fileobj):
+    """
+    Read the objects of a channel export, in either format.
+
+    :param fileobj: file opened in text mode
+    :return: generator of dict
+    """
+    start = fileobj.read(1)
+    while start.isspace():
+        start = fileobj.read(1)
+    if start == '[':
+        return read_fixture(_Prepend(start, fileobj))
+    return read_json_lines(_Prepend(start, fileobj))
+
+
+class _Prepend(object):
+    """
+    A file with the characters already read from it put back in front.
+    """
+
+    def __init__(self, head, fileobj):
+        self.head = head
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        head, self.head = self.head, ''
+        return head + self.fileobj.read(size if size < 0 else max(size - len(head), 0))
+
+    def __iter__(self):
+        head, self.head = self.head, ''
+        for line in self.fileobj:
+            yield head + line
+            head = ''
+        if head:
+            yield head
+
+
+class TreeNumbering(object):
+    """
+    Numbers content nodes coming in tree order with MPTT's lft, rght, tree_id and level,
+    keeping only the ancestors of the current node.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.counter = 0
+        self.tree_id = 0
+
+    def _close(self):
+        node = self.stack.pop()
+        self.counter += 1
+        node.rght = self.counter
+        return node
+
+    def add(self, node):
+        """
+        Number the left side of a node, and close the subtrees it comes after.
+
+        :param node: ContentMetadata
+        :return: list of ContentMetadata whose subtrees are complete
+        :raises ValueError: if the node doesn't come in tree order
+        """
+        closed = []
+        if node.parent_id is None:
+            while self.stack:
+                closed.append(self._close())
+            self.tree_id += 1
+            self.counter = 0
+        else:
+            while self.stack and self.stack[-1].pk != node.parent_id:
+                closed.append(self._close())
+            if not self.stack:
+                raise ValueError('ContentMetadata %s does not come right after its parent %s or its subtree' % (node.pk, node.parent_id))
+        self.counter += 1
+        node.lft = self.counter
+        node.tree_id = self.tree_id
+        node.level = len(self.stack)
+        self.stack.append(node)
+        return closed
+
+    def finish(self):
+        """
+        Close the subtrees still open at the end of the export.
+
+        :return: list of ContentMetadata
+        """
+        closed = []
+        while self.stack:
+            closed.append(self._close())
+        return closed
+
+
+class BatchWriter(object):
+    """
+    Collects model instances and writes them with bulk_create, a batch at a time per model.
+    """
+
+    def __init__(self, alias, batch_size=BATCH_SIZE):
+        self.alias = alias
+        self.batch_size = batch_size
+        self.batches = {}
+        self.counts = {}
+
+    def add(self, instance):
+        model = type(instance)
+        batch = self.batches.setdefault(model, [])
+        batch.append(instance)
+        if len(batch) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        for model in ([model] if model else list(self.batches)):
+            batch = self.batches.pop(model, [])
+            if batch:
+                model._default_manager.db_manager(self.alias).bulk_create(batch)
+                self.counts[model._meta.label] = self.counts.get(model._meta.label, 0) + len(batch)
+
+
+def channel_models():
+    """
+    Get the models stored in channel databases that a channel export provides.
+
+    :return: list of model classes
+    """
+    from kolibri.content import models as KolibriContent
+    return [
+        model for model in apps.get_app_config('content').get_models()
+        if issubclass(model, KolibriContent.AbstractContent) and model is not KolibriContent.ContentSummary
+    ]
+
+def create_channel_tables(alias):
+    """
+    Create the tables of the channel models that the database behind alias doesn't have yet.
+
+    :param alias: str
+    """
+    connection = connections[alias]
+    table_names = set(connection.introspection.table_names())
+    with connection.schema_editor() as schema_editor:
+        for model in channel_models():
+            if model._meta.db_table not in table_names:
+                schema_editor.create_model(model)
+
+def _write_objects(objects, alias, batch_size):
+    from kolibri.content.models import ContentMetadata
+    importable = set(channel_models())
+    tags_through = ContentMetadata.tags.through
+    numbering = TreeNumbering()
+    writer = BatchWriter(alias, batch_size)
+    skipped = 0
+    for deserialized in serializers.deserialize('python', objects, using=alias, ignorenonexistent=True):
+        instance = deserialized.object
+        if type(instance) not in importable:
+            skipped += 1
+            continue
+        if isinstance(instance, ContentMetadata):
+            for node in numbering.add(instance):
+                writer.add(node)
+            for tag_id in deserialized.m2m_data.get('tags', ()):
+                writer.add(tags_through(contentmetadata_id=instance.pk, contenttag_id=tag_id))
+        else:
+            writer.add(instance)
+    for node in numbering.finish():
+        writer.add(node)
+    writer.flush()
+    if skipped:
+        logger.info("Skipped %d objects that don't belong in a channel database", skipped)
+    return writer.counts
+
+def _filter_channel_objects(objects, labels):
+    # skip the models of other apps (e.g. permissions in fixtures) before deserializing them
+    for obj in objects:
+        if obj.get('model', '').lower() in labels:
+            yield obj
+
+def finish_import(alias):
+    """
+    Bring the indexes, full-text index and summaries of a channel database up to date after an import,
+    and drop what was cached about it.
+
+    :param alias: str
+    """
+    channel_databases.invalidate(alias)
+    channel_databases.mark_changed(alias)
+    graph.invalidate_prerequisite_graph(alias)
+    graph.invalidate_related_graph(alias)
+    search.forget_search_index(alias)
+    tree.forget_channel_tree(alias)
+    indexes.ensure_channel_indexes(alias)
+    indexes.ensure_related_pair_index(alias)
+    search.build_search_index(alias)
+    aggregates.build_summaries(alias)
+    cycle = graph.prerequisite_graph(alias).find_cycle()
+    if cycle:
+        logger.warning("The prerequisites of ContentDB '%s' form a closed loop: %s", alias, cycle)
+
+def upgrade_channel(alias):
+    """
+    Add what a channel database created by an older version misses: the indexes, the full-text index and the
+    content summaries. This writes to the sqlite file in place, so it is left to the import, the warm-up and the
+    upgradechannels command rather than done while serving requests, and skipped for read-only or immutable
+    channel databases.
+
+    :param alias: str
+    :return: bool, whether the channel database was checked
+    """
+    if not channel_databases.upgrades_in_place:
+        logger.info("Not upgrading ContentDB '%s' in place, as channel databases are read-only", alias)
+        return False
+    indexes.upgrade_channel_indexes(alias)
+    search.build_missing_search_index(alias)
+    aggregates.build_missing_summaries(alias)
+    return True
+
+def import_channel(alias, objects, batch_size=BATCH_SIZE):
+    """
+    Import a channel export into an empty channel database, creating its tables if needed.
+
+    :param alias: str
+    :param objects: iterable of dict, e.g. from read_channel_export
+    :param batch_size: int, number of rows written at once
+    :return: dict of model label to the number of rows imported
+    :raises ValueError: if the channel database already has content, or content nodes don't come in tree order
+    """
+    from kolibri.content.models import ContentMetadata
+    start = time.time()
+    writable = channel_databases.writable_alias(alias)
+    labels = set(model._meta.label_lower for model in channel_models())
+    with transaction.atomic(using=writable):
+        create_channel_tables(writable)
+        if ContentMetadata.objects.db_manager(writable).exists():
+            raise ValueError("ContentDB '%s' already has content" % alias)
+        counts = _write_objects(_filter_channel_objects(objects, labels), writable, batch_size)
+    finish_import(alias)
+    logger.info("Imported %s into ContentDB '%s' in %.3fs", counts, alias, time.time() - start)
+    return counts
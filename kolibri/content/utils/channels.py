@@ -0,0 +1,514 @@
+"""
+Registry of the per-channel content databases.
+
+Every channel lives in its own sqlite file under ``settings.CONTENT_DB_DIR``, named after the channel id.
+The registry adds the Django connection settings for a channel the first time it is used, validates the
+database once, and then hands out the alias without touching the database again until the sqlite file
+is replaced or modified on disk.
+
+Deployments can tune how channel databases are opened through these settings:
+
+``CONTENT_DB_READ_ONLY``
+    Open channel databases read-only through a sqlite URI (``mode=ro``), so concurrent readers never take
+    write locks. Writes are sent through a separate writable alias, see ``writable_alias``. Defaults to False.
+``CONTENT_DB_IMMUTABLE``
+    Additionally open read-only channel databases with ``immutable=1``, which skips all locking and change
+    detection. Only safe when channel databases are replaced rather than written to in place. Defaults to False.
+``CONTENT_DB_PRAGMAS``
+    PRAGMAs run on every new channel database connection, defaults to ``DEFAULT_CONTENT_DB_PRAGMAS``.
+``CONTENT_DB_MAX_OPEN_HANDLES``
+    Maximum number of channel database connections a single thread keeps open, the least recently used
+    ones get closed first. Defaults to 16.
+``CONTENT_DB_IDLE_TIMEOUT``
+    Seconds after which a channel database connection that hasn't been used gets closed. Defaults to 300.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import six
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import Signal
+from six.moves.urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+CONTENT_DB_EXTENSION = '.sqlite3'
+
+WRITABLE_ALIAS_SUFFIX = '__writable'
+
+DEFAULT_CONTENT_DB_PRAGMAS = (
+    ('mmap_size', 64 * 1024 * 1024),
+    ('cache_size', -8 * 1024),  # negative values are in KiB rather than pages
+    ('temp_store', 'MEMORY'),
+)
+
+DEFAULT_MAX_OPEN_HANDLES = 16
+
+DEFAULT_IDLE_TIMEOUT = 300
+
+#: Sent after a channel database registered by the registry has been (re)validated,
+#: which happens the first time it is used and whenever the sqlite file changed on disk.
+channel_db_validated = Signal(providing_args=['alias'])
+
+# marker for aliases that have never been validated, as None is a valid identity for in-memory databases
+_NOT_VALIDATED = object()
+
+
+def channel_db_path(alias):
+    """
+    Get the path of the sqlite file backing the given channel alias.
+
+    :param alias: str
+    :return: str
+    """
+    return os.path.join(settings.CONTENT_DB_DIR, alias + CONTENT_DB_EXTENSION)
+
+def is_in_memory_db(name):
+    """
+    Check if a sqlite database NAME points to an in-memory database (as used by the test runner).
+
+    :param name: str
+    :return: bool
+    """
+    return name == ':memory:' or 'mode=memory' in name
+
+def read_only_db_uri(path):
+    """
+    Build a sqlite URI opening the database at path read-only.
+
+    :param path: str
+    :return: str
+    """
+    uri = 'file:%s?mode=ro' % quote(os.path.abspath(path))
+    if getattr(settings, 'CONTENT_DB_IMMUTABLE', False):
+        uri += '&immutable=1'
+    return uri
+
+def content_db_pragmas():
+    """
+    Get the (pragma, value) pairs to run on new channel database connections.
+
+    :return: iterable of tuples
+    """
+    pragmas = getattr(settings, 'CONTENT_DB_PRAGMAS', DEFAULT_CONTENT_DB_PRAGMAS)
+    return pragmas.items() if isinstance(pragmas, dict) else pragmas
+
+def file_identity(path):
+    """
+    Get a cheap fingerprint of a database file, which changes whenever the file is replaced or written to.
+
+    :param path: str
+    :return: tuple of (inode, mtime, size) or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+
+class ThreadHandles(OrderedDict):
+    """
+    The channel aliases a thread has connections to, mapped to the time they were last used,
+    ordered from least to most recently used.
+
+    ``identities`` maps each of these aliases to the identity of the sqlite file when the thread last used it,
+    so a connection still reading a file that got replaced since can be told apart and closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadHandles, self).__init__(*args, **kwargs)
+        self.identities = {}
+
+
+class ChannelDatabaseRegistry(object):
+    """
+    Keeps track of the channel databases that have been registered with Django and validated.
+
+    Validation (checking the database exists and is not empty) costs a query against ``sqlite_master``,
+    so it is only done the first time an alias is used, and again whenever the identity of the sqlite file
+    changes (e.g. a channel gets re-imported).
+
+    Connections to the channel databases it registers are persistent, and kept in a per-thread LRU pool
+    bounded by ``CONTENT_DB_MAX_OPEN_HANDLES`` and ``CONTENT_DB_IDLE_TIMEOUT``, so a device with many channels
+    doesn't run out of file descriptors.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._validated = {}
+        # paths of the databases registered by the registry, keyed by alias
+        self._paths = {}
+        self._local = threading.local()
+        # ThreadHandles of every live thread, keyed by thread ident
+        self._thread_handles = weakref.WeakValueDictionary()
+        # (identity, value) of what has been loaded from the channel databases, keyed by (name, alias)
+        self._cache = {}
+        # number of writes made through Django to each channel database and the time of the last one, keyed by alias
+        self._generations = {}
+        self._modified = {}
+        self._warned_read_only = False
+        connection_created.connect(self.apply_pragmas)
+
+    def register(self, alias):
+        """
+        Add the connection settings for a channel alias if Django doesn't know about it yet.
+
+        :param alias: str
+        :return: dict of the connection settings
+        """
+        if alias not in connections.databases:
+            with self._lock:
+                if alias not in connections.databases:
+                    self._warn_read_only_unsupported()
+                    path = channel_db_path(alias)
+                    connections.databases[alias] = self._connection_settings(path, read_only=self.read_only)
+                    self._paths[alias] = path
+        return connections.databases[alias]
+
+    @property
+    def read_only(self):
+        return bool(getattr(settings, 'CONTENT_DB_READ_ONLY', False)) and not six.PY2
+
+    @property
+    def upgrades_in_place(self):
+        """
+        Whether channel databases may be brought up to date (indexes, full-text index, summaries) by writing to their
+        sqlite files in place, which isn't safe for readers of read-only or immutable channel databases.
+        """
+        return not (getattr(settings, 'CONTENT_DB_READ_ONLY', False) or getattr(settings, 'CONTENT_DB_IMMUTABLE', False))
+
+    def _warn_read_only_unsupported(self):
+        if getattr(settings, 'CONTENT_DB_READ_ONLY', False) and six.PY2 and not self._warned_read_only:
+            logger.warning('CONTENT_DB_READ_ONLY needs sqlite URI support, which is not available on Python 2')
+            self._warned_read_only = True
+
+    def _connection_settings(self, path, read_only=False):
+        if read_only:
+            return {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': read_only_db_uri(path),
+                'OPTIONS': {'uri': True},
+                'CONN_MAX_AGE': None,
+            }
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': path,
+            'CONN_MAX_AGE': None,
+        }
+
+    def is_channel_alias(self, alias):
+        """
+        Check if an alias was registered by the registry, as opposed to being configured in settings.DATABASES.
+
+        :param alias: str
+        :return: bool
+        """
+        return alias in self._paths
+
+    def writable_alias(self, alias):
+        """
+        Get an alias that can be written to for the channel behind alias.
+        Unless the channel database was opened read-only, that is the alias itself.
+
+        :param alias: str
+        :return: str
+        """
+        settings_dict = self.register(alias)
+        if alias not in self._paths or not settings_dict.get('OPTIONS', {}).get('uri'):
+            return alias
+        writable = alias + WRITABLE_ALIAS_SUFFIX
+        if writable not in connections.databases:
+            with self._lock:
+                if writable not in connections.databases:
+                    connections.databases[writable] = self._connection_settings(self._paths[alias])
+                    self._paths[writable] = self._paths[alias]
+        return writable
+
+    def channel_alias(self, alias):
+        """
+        Get the channel alias behind an alias returned by writable_alias, which is the alias itself for
+        any other alias.
+
+        :param alias: str
+        :return: str
+        """
+        if alias in self._paths and alias.endswith(WRITABLE_ALIAS_SUFFIX):
+            return alias[:-len(WRITABLE_ALIAS_SUFFIX)]
+        return alias
+
+    def identity(self, alias):
+        """
+        Get the current identity of the database behind an alias.
+        In-memory and non-sqlite databases can't change underneath us, so their identity is always None.
+
+        :param alias: str
+        :return: tuple or None
+        """
+        settings_dict = self.register(alias)
+        if alias in self._paths:
+            return file_identity(self._paths[alias]) or ()
+        name = settings_dict.get('NAME') or ''
+        if not settings_dict.get('ENGINE', '').endswith('sqlite3') or is_in_memory_db(name):
+            return None
+        return file_identity(name) or ()
+
+    def get_alias(self, alias):
+        """
+        Get a validated database alias for a channel, validating it only if it hasn't been before
+        or if the database file changed since.
+
+        :param alias: str
+        :return: str
+        """
+        identity = self.identity(alias)
+        if alias in self._paths:
+            self._forget_stale_connection(alias)
+        validated = self._validated.get(alias, _NOT_VALIDATED)
+        if validated != identity:
+            if validated is not _NOT_VALIDATED:
+                # the file was replaced, and a persistent connection would keep reading the old (unlinked) one
+                if self.release(alias) and alias in self._paths:
+                    self.handles().identities[alias] = identity
+            self.validate(alias, identity)
+        if alias in self._paths:
+            self.touch(alias, identity)
+        return alias
+
+    def _forget_stale_connection(self, alias):
+        """
+        Drop the current thread's connection to alias if it was set up before the alias got unregistered and
+        registered again, as Django keeps a connection per thread and unregister only reaches the calling thread's.
+
+        :param alias: str
+        """
+        connection = connections[alias]
+        if connection.settings_dict is not connections.databases[alias]:
+            connection.close()
+            del connections[alias]
+            handles = self.handles()
+            handles.pop(alias, None)
+            handles.identities.pop(alias, None)
+
+    def validate(self, alias, identity):
+        """
+        Check that the database behind an alias exists and has tables, and remember its identity.
+
+        :param alias: str
+        :param identity: tuple or None
+        """
+        self._validated.pop(alias, None)
+        if identity == ():
+            # don't let sqlite create an empty database file for a channel that doesn't exist
+            raise KeyError("ContentDB '%s' doesn't exist!!" % str(alias))
+        try:
+            if not connections[alias].introspection.table_names():
+                raise KeyError("ContentDB '%s' is empty!!" % str(alias))
+        except OperationalError:
+            raise KeyError("ContentDB '%s' doesn't exist!!" % str(alias))
+        logger.debug("Validated ContentDB '%s'", alias)
+        self._validated[alias] = identity
+        if alias in self._paths and not alias.endswith(WRITABLE_ALIAS_SUFFIX):
+            channel_db_validated.send(sender=self.__class__, alias=alias)
+
+    def invalidate(self, alias=None):
+        """
+        Forget the validated state of one alias, or of all of them if no alias is given.
+
+        :param alias: str
+        """
+        if alias is None:
+            self._validated.clear()
+        else:
+            self._validated.pop(alias, None)
+
+    def unregister(self, alias):
+        """
+        Close the current thread's connection to a channel database registered by the registry and forget about it,
+        e.g. once the channel got deleted.
+
+        :param alias: str
+        """
+        self.invalidate(alias)
+        handles = self.handles()
+        handles.pop(alias, None)
+        handles.identities.pop(alias, None)
+        for key in list(self._cache):
+            if key[1] == alias:
+                self._cache.pop(key, None)
+        with self._lock:
+            self._paths.pop(alias, None)
+            if alias in connections.databases:
+                connections[alias].close()
+                del connections[alias]
+                del connections.databases[alias]
+
+    def cached(self, name, alias, load):
+        """
+        Get something loaded from a channel database with load(alias), and keep it until the database changes
+        on disk or forget_cached gets called.
+
+        :param name: str, what gets loaded
+        :param alias: str, the channel alias or its writable alias
+        :param load: function taking the channel alias
+        """
+        alias = self.channel_alias(alias)
+        identity = self.identity(alias)
+        cached = self._cache.get((name, alias))
+        if cached is None or cached[0] != identity:
+            # loading it twice from concurrent threads is harmless, so there's no lock around it
+            cached = self._cache[(name, alias)] = (identity, load(alias))
+        return cached[1]
+
+    def forget_cached(self, name, alias=None):
+        """
+        Drop what was loaded under name from a channel database, or from every channel database if no alias is given.
+
+        :param name: str
+        :param alias: str
+        """
+        if alias is not None:
+            alias = self.channel_alias(alias)
+        for key in list(self._cache):
+            if key[0] == name and alias in (None, key[1]):
+                self._cache.pop(key, None)
+
+    def mark_changed(self, alias):
+        """
+        Note that a channel database was written to, which in-memory databases can't tell through their identity.
+
+        :param alias: str, the channel alias or its writable alias
+        """
+        alias = self.channel_alias(alias)
+        with self._lock:
+            self._generations[alias] = self._generations.get(alias, 0) + 1
+            self._modified[alias] = time.time()
+
+    def version(self, alias):
+        """
+        Get a token that changes whenever the content of a channel database may have changed, either on disk
+        or through a write noted by mark_changed. It only stats the sqlite file and never queries the database.
+
+        :param alias: str
+        :return: str
+        """
+        alias = self.channel_alias(alias)
+        identity = self.identity(alias)
+        return '%r.%d' % (identity, self._generations.get(alias, 0))
+
+    def last_modified(self, alias):
+        """
+        Get the time a channel database was last changed, from the mtime of its sqlite file and the writes noted
+        by mark_changed. In-memory databases that haven't been written to count as changed when first asked about.
+
+        :param alias: str
+        :return: float, seconds since the epoch
+        """
+        alias = self.channel_alias(alias)
+        identity = self.identity(alias)
+        if identity:
+            return max(identity[1], self._modified.get(alias, 0))
+        with self._lock:
+            return self._modified.setdefault(alias, time.time())
+
+    def handles(self):
+        """
+        Get the ThreadHandles of the current thread.
+
+        :return: ThreadHandles
+        """
+        handles = getattr(self._local, 'handles', None)
+        if handles is None:
+            handles = self._local.handles = ThreadHandles()
+            self._thread_handles[threading.current_thread().ident] = handles
+        return handles
+
+    def touch(self, alias, identity=None):
+        """
+        Mark alias as the most recently used by the current thread,
+        and close the connections of this thread that are idle, over the cap,
+        or were opened against a file that has been replaced since.
+
+        :param alias: str
+        :param identity: tuple or None, the current identity of the database behind alias
+        """
+        handles = self.handles()
+        now = time.time()
+        if alias in handles.identities and handles.identities[alias] != identity:
+            self.release(alias)
+        handles.identities[alias] = identity
+        handles.pop(alias, None)
+        handles[alias] = now
+        idle_timeout = getattr(settings, 'CONTENT_DB_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT)
+        max_open = getattr(settings, 'CONTENT_DB_MAX_OPEN_HANDLES', DEFAULT_MAX_OPEN_HANDLES)
+        excess = len(handles) - max_open
+        for lru_alias, last_used in list(handles.items()):
+            if lru_alias == alias or (excess <= 0 and now - last_used < idle_timeout):
+                break
+            if self.release(lru_alias):
+                del handles[lru_alias]
+                handles.identities.pop(lru_alias, None)
+                excess -= 1
+
+    def release(self, alias):
+        """
+        Close the current thread's connection to alias, unless it is in the middle of a transaction.
+
+        :param alias: str
+        :return: bool, whether the connection was closed
+        """
+        connection = connections[alias]
+        if connection.in_atomic_block:
+            return False
+        connection.close()
+        return True
+
+    def release_all(self):
+        """
+        Close all the channel database connections of the current thread.
+        """
+        handles = self.handles()
+        for alias in list(handles):
+            if self.release(alias):
+                del handles[alias]
+                handles.identities.pop(alias, None)
+
+    def stats(self):
+        """
+        Get the number of channel database connections each thread holds.
+
+        :return: dict of thread ident to number of handles
+        """
+        return dict((ident, len(handles)) for ident, handles in list(self._thread_handles.items()))
+
+    def apply_pragmas(self, sender, connection, **kwargs):
+        """
+        connection_created receiver tuning every new connection to a channel database registered by the registry.
+        """
+        if not self.is_channel_alias(connection.alias):
+            return
+        cursor = connection.cursor()
+        for pragma, value in content_db_pragmas():
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+        cursor.close()
+
+    def is_validated(self, alias):
+        return alias in self._validated
+
+
+channel_databases = ChannelDatabaseRegistry()
+
+
+def channel_changed(sender, using, **kwargs):
+    """
+    post_save/post_delete/m2m_changed receiver noting writes to the channel models, see ChannelDatabaseRegistry.mark_changed.
+    """
+    channel_databases.mark_changed(using)
@@ -0,0 +1,66 @@
+"""
+Conditional GET for the content endpoints.
+
+The responses of the content endpoints only change when their channel database does, so they get a strong ``ETag``
+derived from the channel's version token (see ``ChannelDatabaseRegistry.version``) and a ``Last-Modified`` from the
+time the channel database last changed. A request whose ``If-None-Match`` or ``If-Modified-Since`` still matches gets
+a 304 straight away, without the channel database being queried at all.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from kolibri.content.utils.channels import channel_databases
+
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+
+
+def channel_etag(request, channel_id):
+    """
+    Get the ETag of the response to a request on a channel, which changes with the channel version,
+    the requested URL and the representation asked for.
+
+    :param request: HttpRequest
+    :param channel_id: str
+    :return: str, unquoted
+    """
+    key = '\n'.join([
+        channel_databases.version(channel_id),
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def channel_last_modified(channel_id):
+    """
+    Get the Last-Modified time of the responses on a channel, to the second.
+
+    :param channel_id: str
+    :return: int, seconds since the epoch
+    """
+    return int(channel_databases.last_modified(channel_id))
+
+
+class ChannelConditionalMixin(object):
+    """
+    Viewset mixin answering conditional GET and HEAD requests on the channel in the URL,
+    and adding ETag and Last-Modified to the successful responses.
+    """
+    channel_kwarg = 'channelmetadata_channel_id'
+
+    def dispatch(self, request, *args, **kwargs):
+        channel_id = kwargs.get(self.channel_kwarg)
+        if channel_id is None or request.method not in CONDITIONAL_METHODS:
+            return super(ChannelConditionalMixin, self).dispatch(request, *args, **kwargs)
+        etag = channel_etag(request, channel_id)
+        last_modified = channel_last_modified(channel_id)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super(ChannelConditionalMixin, self).dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,219 @@
+"""
+In-memory relationship graphs of a channel.
+
+The prerequisite relationships of a channel are loaded with a single query the first time they are needed, and
+kept as adjacency lists in both directions, so transitive prerequisites and dependents, learning orders and cycle
+checks are graph walks in O(V+E) rather than one query per level. The related relationships are kept as a
+symmetric adjacency map, so the related contents of a content are known without querying both directions.
+
+The graphs of a channel are rebuilt when one of their relationships gets saved or deleted, and when the channel
+database changes on disk.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import IntegrityError
+from kolibri.content.utils.channels import channel_databases
+
+_VISITING = 1
+_DONE = 2
+
+# names the graphs are cached under by the channel database registry
+PREREQUISITE = 'prerequisite_graph'
+RELATED = 'related_graph'
+
+
+class PrerequisiteCycleError(IntegrityError):
+    """
+    Raised when prerequisite relationships form a closed loop.
+    The ids of the ContentMetadata in the loop are in ``cycle``.
+    """
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super(PrerequisiteCycleError, self).__init__('Prerequisite relationships form a closed loop: %s' % cycle)
+
+
+class PrerequisiteGraph(object):
+    """
+    Prerequisite relationships between ContentMetadata ids.
+    """
+
+    def __init__(self, edges):
+        """
+        :param edges: iterable of (prerequisite id, dependent id)
+        """
+        # ids of the direct prerequisites of every id, and the other way around
+        self.prerequisites = {}
+        self.dependents = {}
+        for prerequisite, dependent in edges:
+            self.prerequisites.setdefault(dependent, []).append(prerequisite)
+            self.dependents.setdefault(prerequisite, []).append(dependent)
+
+    def _reachable(self, start, adjacency):
+        seen = set([start])
+        found = []
+        stack = [start]
+        while stack:
+            for node in adjacency.get(stack.pop(), ()):
+                if node not in seen:
+                    seen.add(node)
+                    found.append(node)
+                    stack.append(node)
+        return found
+
+    def all_prerequisites(self, node):
+        """
+        Get the ids of the direct and indirect prerequisites of node.
+
+        :param node: int
+        :return: list of int
+        """
+        return self._reachable(node, self.prerequisites)
+
+    def all_dependents(self, node):
+        """
+        Get the ids of the contents that have node as a direct or indirect prerequisite.
+
+        :param node: int
+        :return: list of int
+        """
+        return self._reachable(node, self.dependents)
+
+    def edges(self):
+        """
+        Get every prerequisite relationship of the graph.
+
+        :return: generator of (prerequisite id, dependent id)
+        """
+        for dependent, prerequisites in self.prerequisites.items():
+            for prerequisite in prerequisites:
+                yield prerequisite, dependent
+
+    def is_prerequisite(self, prerequisite, dependent):
+        """
+        Check if prerequisite is a direct prerequisite of dependent.
+
+        :param prerequisite: int
+        :param dependent: int
+        :return: bool
+        """
+        return prerequisite in self.prerequisites.get(dependent, ())
+
+    def creates_cycle(self, prerequisite, dependent):
+        """
+        Check if making prerequisite a prerequisite of dependent would close a loop,
+        which is the case when prerequisite already depends on dependent.
+
+        :param prerequisite: int
+        :param dependent: int
+        :return: bool
+        """
+        return prerequisite == dependent or prerequisite in self.all_dependents(dependent)
+
+    def learning_order(self, nodes=None):
+        """
+        Order the given ids and all their prerequisites so that every content comes after its prerequisites.
+
+        :param nodes: list of int, defaults to every content that has or is a prerequisite
+        :return: list of int
+        :raises PrerequisiteCycleError: if the prerequisites to order form a closed loop
+        """
+        if nodes is None:
+            nodes = list(self.prerequisites) + list(self.dependents)
+        order = []
+        state = {}
+        for start in nodes:
+            if start in state:
+                continue
+            state[start] = _VISITING
+            # iterative depth-first search, a node is added to the order once all of its prerequisites are
+            stack = [(start, iter(self.prerequisites.get(start, ())))]
+            while stack:
+                node, prerequisites = stack[-1]
+                for prerequisite in prerequisites:
+                    if prerequisite not in state:
+                        state[prerequisite] = _VISITING
+                        stack.append((prerequisite, iter(self.prerequisites.get(prerequisite, ()))))
+                        break
+                    if state[prerequisite] == _VISITING:
+                        path = [visiting for visiting, _ in stack]
+                        raise PrerequisiteCycleError(path[path.index(prerequisite):])
+                else:
+                    stack.pop()
+                    state[node] = _DONE
+                    order.append(node)
+        return order
+
+    def find_cycle(self):
+        """
+        Find a closed loop of prerequisites.
+
+        :return: list of int, the ids in the loop, empty if there is none
+        """
+        try:
+            self.learning_order()
+        except PrerequisiteCycleError as e:
+            return e.cycle
+        return []
+
+
+def _load_prerequisite_graph(alias):
+    from kolibri.content.models import PrerequisiteContentRelationship
+    edges = PrerequisiteContentRelationship.objects.db_manager(alias).order_by('id')\
+        .values_list('contentmetadata_1_id', 'contentmetadata_2_id')
+    return PrerequisiteGraph(edges)
+
+def _load_related_graph(alias):
+    from kolibri.content.models import RelatedContentRelationship
+    related = {}
+    for content1, content2 in RelatedContentRelationship.objects.db_manager(alias).order_by('id')\
+            .values_list('contentmetadata_1_id', 'contentmetadata_2_id'):
+        related.setdefault(content1, []).append(content2)
+        related.setdefault(content2, []).append(content1)
+    return related
+
+def prerequisite_graph(alias):
+    """
+    Get the prerequisite graph of a channel, loading it if it hasn't been yet or if the channel database changed.
+
+    :param alias: str, the channel alias or its writable alias
+    :return: PrerequisiteGraph
+    """
+    return channel_databases.cached(PREREQUISITE, alias, _load_prerequisite_graph)
+
+def related_graph(alias):
+    """
+    Get the related contents of every content of a channel, in both directions of the relationships,
+    loading them if they haven't been yet or if the channel database changed.
+
+    :param alias: str, the channel alias or its writable alias
+    :return: dict of ContentMetadata id to list of ContentMetadata ids
+    """
+    return channel_databases.cached(RELATED, alias, _load_related_graph)
+
+def invalidate_prerequisite_graph(alias=None):
+    """
+    Drop the prerequisite graph of a channel, or of every channel if no alias is given.
+
+    :param alias: str
+    """
+    channel_databases.forget_cached(PREREQUISITE, alias)
+
+def invalidate_related_graph(alias=None):
+    """
+    Drop the related graph of a channel, or of every channel if no alias is given.
+
+    :param alias: str
+    """
+    channel_databases.forget_cached(RELATED, alias)
+
+def prerequisites_changed(sender, using, **kwargs):
+    """
+    post_save and post_delete receiver dropping the prerequisite graph of the channel that was written to.
+    """
+    invalidate_prerequisite_graph(using)
+
+def related_changed(sender, using, **kwargs):
+    """
+    post_save and post_delete receiver dropping the related graph of the channel that was written to.
+    """
+    invalidate_related_graph(using)
@@ -0,0 +1,103 @@
+"""
+Request-scoped identity map of the content nodes resolved from content ids.
+
+Rendering a single page commonly calls several content API functions with the same content id, and each of them
+used to load the ContentMetadata again. While an identity map is active, the content nodes that
+``can_get_content_with_id`` resolves are kept in it by (channel id, content id), so each one is loaded at most once.
+An identity map is active for the duration of a request (see ``kolibri.content.middleware``), and for the duration
+of every call to a decorated content API function otherwise, so the functions it calls share it.
+
+Everyone within the scope gets the same instance of a content node, which must therefore not be modified.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+class ContentIdentityMap(object):
+    """
+    The content nodes loaded within a scope, keyed by (channel id, content id).
+    """
+
+    def __init__(self):
+        self.contents = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, channel_id, content_id, load):
+        """
+        Get the content node with a content id, loading it with load() unless it has been within the scope already.
+
+        :param channel_id: str
+        :param content_id: str
+        :param load: function returning the ContentMetadata
+        :return: ContentMetadata
+        """
+        key = (channel_id, str(content_id))
+        hit = key in self.contents
+        if not hit:
+            self.contents[key] = load()
+        with _stats_lock:
+            if hit:
+                self.hits += 1
+                _stats['hits'] += 1
+            else:
+                self.misses += 1
+                _stats['misses'] += 1
+        return self.contents[key]
+
+
+def active_identity_map():
+    """
+    Get the identity map active in the current thread.
+
+    :return: ContentIdentityMap or None
+    """
+    return getattr(_local, 'identity_map', None)
+
+def activate_identity_map():
+    """
+    Activate a new identity map in the current thread, in place of any active one.
+
+    :return: ContentIdentityMap
+    """
+    _local.identity_map = ContentIdentityMap()
+    return _local.identity_map
+
+def deactivate_identity_map():
+    _local.identity_map = None
+
+@contextmanager
+def content_identity_map():
+    """
+    Activate a new identity map in the current thread until the block exits, or reuse the one already active.
+
+    :return: ContentIdentityMap
+    """
+    active = active_identity_map()
+    if active is not None:
+        yield active
+        return
+    try:
+        yield activate_identity_map()
+    finally:
+        deactivate_identity_map()
+
+def identity_map_stats():
+    """
+    Get the number of content id lookups the identity maps saved (hits), and of those that went to the database (misses).
+
+    :return: dict with hits and misses
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_identity_map_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
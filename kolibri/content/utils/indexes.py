@@ -0,0 +1,163 @@
+"""
+Index health check for channel databases.
+
+Channel databases created before the indexes of the content models were added to the schema miss them,
+which turns every ``content_id`` lookup into a full table scan. ``ensure_channel_indexes`` checks which of the
+indexes the content API relies on are missing from a channel database and creates them in place, when a channel
+gets imported or upgraded (see ``channel_import.upgrade_channel``).
+
+``RELATED_PAIR_INDEX`` makes every unordered pair of contents related at most once, whichever way round the
+relationship was saved. As an index on expressions it is managed by name rather than by its columns, and needs
+sqlite 3.9.0 or newer; older versions of sqlite go without it.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+
+from django.db import DatabaseError, connections, transaction
+from kolibri.content.utils.channels import channel_databases
+
+logger = logging.getLogger(__name__)
+
+RELATED_TABLE = 'content_relatedcontentrelationship'
+
+RELATED_PAIR_INDEX = 'content_relatedcontentrelationship_pair'
+
+RELATED_PAIR_INDEX_MIN_SQLITE_VERSION = (3, 9, 0)
+
+RELATED_PAIR_INDEX_SQL = (
+    # keep the first of relationships saved both ways round before older versions checked for them
+    'DELETE FROM {table} WHERE id IN (SELECT b.id FROM {table} a JOIN {table} b '
+    'ON a.contentmetadata_1_id = b.contentmetadata_2_id AND a.contentmetadata_2_id = b.contentmetadata_1_id AND a.id < b.id)'
+    .format(table=RELATED_TABLE),
+    'CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} '
+    '(min(contentmetadata_1_id, contentmetadata_2_id), max(contentmetadata_1_id, contentmetadata_2_id))'
+    .format(index=RELATED_PAIR_INDEX, table=RELATED_TABLE),
+)
+
+
+def required_indexes():
+    """
+    Get the indexes the content API relies on.
+
+    :return: list of (table, tuple of columns)
+    """
+    from kolibri.content import models as KolibriContent
+    meta = KolibriContent.ContentMetadata._meta
+    return [
+        (meta.db_table, (meta.get_field('content_id').column,)),
+        (meta.db_table, (meta.get_field('kind').column,)),
+        (meta.db_table, (meta.get_field('tree_id').column, meta.get_field('lft').column)),
+    ]
+
+def existing_indexes(cursor, table):
+    """
+    Get the columns of every index of a table, in index order.
+
+    :return: list of tuples of columns
+    """
+    quote_name = cursor.db.ops.quote_name
+    cursor.execute('PRAGMA index_list(%s)' % quote_name(table))
+    # the name is the second column of index_list, whatever the sqlite version
+    index_names = [row[1] for row in cursor.fetchall()]
+    indexes = []
+    for index_name in index_names:
+        cursor.execute('PRAGMA index_info(%s)' % quote_name(index_name))
+        indexes.append(tuple(row[2] for row in sorted(cursor.fetchall())))
+    return indexes
+
+def missing_indexes(alias):
+    """
+    Check which of the required indexes a channel database misses.
+    An index counts as present if any existing index starts with the same columns.
+
+    :param alias: str
+    :return: list of (table, tuple of columns)
+    """
+    cursor = connections[alias].cursor()
+    try:
+        indexes = {}
+        missing = []
+        for table, columns in required_indexes():
+            if table not in indexes:
+                indexes[table] = existing_indexes(cursor, table)
+            if not any(index[:len(columns)] == columns for index in indexes[table]):
+                missing.append((table, columns))
+        return missing
+    finally:
+        cursor.close()
+
+def ensure_channel_indexes(alias):
+    """
+    Create the required indexes a channel database misses, through its writable connection.
+
+    :param alias: str
+    :return: list of (table, tuple of columns) of the indexes that were created
+    """
+    missing = missing_indexes(alias)
+    if not missing:
+        return []
+    cursor = connections[channel_databases.writable_alias(alias)].cursor()
+    try:
+        for table, columns in missing:
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                '%s_%s_idx' % (table, '_'.join(columns)), table, ', '.join(columns)))
+            logger.info("Added index on %s (%s) to ContentDB '%s'", table, ', '.join(columns), alias)
+    finally:
+        cursor.close()
+    return missing
+
+def _load_related_pair_index(alias):
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        return False
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = %s", [RELATED_PAIR_INDEX])
+        return bool(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+
+def has_related_pair_index(alias):
+    """
+    Check if a channel database has the RELATED_PAIR_INDEX, remembering the answer until the database changes on disk.
+
+    :param alias: str, the channel alias or its writable alias
+    :return: bool
+    """
+    return channel_databases.cached('related_pair_index', alias, _load_related_pair_index)
+
+def ensure_related_pair_index(alias):
+    """
+    Create the RELATED_PAIR_INDEX if a channel database misses it, through its writable connection.
+
+    :param alias: str
+    :return: bool, whether the index was created
+    """
+    database = connections[alias].Database
+    if database.sqlite_version_info < RELATED_PAIR_INDEX_MIN_SQLITE_VERSION:
+        logger.warning("Not adding index %s to ContentDB '%s', which needs sqlite 3.9.0 or newer (found %s)",
+                       RELATED_PAIR_INDEX, alias, database.sqlite_version)
+        return False
+    if _load_related_pair_index(alias):
+        return False
+    writable = channel_databases.writable_alias(alias)
+    with transaction.atomic(using=writable):
+        cursor = connections[writable].cursor()
+        for sql in RELATED_PAIR_INDEX_SQL:
+            cursor.execute(sql)
+    channel_databases.forget_cached('related_pair_index', alias)
+    logger.info("Added index %s to ContentDB '%s'", RELATED_PAIR_INDEX, alias)
+    return True
+
+def upgrade_channel_indexes(alias):
+    """
+    Add the indexes a channel database misses, logging rather than raising if it can't be done.
+
+    :param alias: str
+    """
+    try:
+        ensure_channel_indexes(alias)
+        ensure_related_pair_index(alias)
+    except DatabaseError as e:
+        logger.warning("Could not check the indexes of ContentDB '%s': %s", alias, e)
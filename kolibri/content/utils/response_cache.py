@@ -0,0 +1,110 @@
+"""
+Server-side cache of the JSON responses of the content endpoints.
+
+Many learners ask for the same children, ancestors or related contents of the same channel, so the rendered JSON
+of successful GET requests is kept in the Django cache framework. The cache key includes the channel's version token
+(see ``ChannelDatabaseRegistry.version``), so a re-imported channel or a write through the API makes every cached
+response of that channel unreachable without having to find and delete them.
+
+It is set up through these settings:
+
+``CONTENT_RESPONSE_CACHE``
+    Alias of the cache in ``settings.CACHES`` to use, or None to turn the response cache off. Defaults to 'default'.
+``CONTENT_RESPONSE_CACHE_TIMEOUT``
+    Seconds a response stays cached. Defaults to 3600.
+``CONTENT_RESPONSE_CACHE_MAX_SIZE``
+    Responses bigger than this many bytes don't get cached. Defaults to 1 MiB.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from kolibri.content.utils.channels import channel_databases
+
+DEFAULT_TIMEOUT = 3600
+
+DEFAULT_MAX_SIZE = 1024 * 1024
+
+KEY_PREFIX = 'content-response:'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def response_cache():
+    """
+    Get the cache responses are kept in, as set by ``CONTENT_RESPONSE_CACHE``.
+
+    :return: BaseCache or None if the response cache is turned off
+    """
+    alias = getattr(settings, 'CONTENT_RESPONSE_CACHE', 'default')
+    return caches[alias] if alias else None
+
+def response_cache_key(request, channel_id, kwargs):
+    """
+    Get the cache key of the response to a request on a channel: channel id and version, route name,
+    content id and the other URL arguments, query string, the representation asked for, and the scheme and host
+    the absolute hyperlinks in the response are built from.
+
+    :param request: HttpRequest
+    :param channel_id: str
+    :param kwargs: dict of the URL arguments
+    :return: str
+    """
+    match = request.resolver_match
+    parts = [channel_id, channel_databases.version(channel_id), match.url_name if match else request.path]
+    parts.extend('%s=%s' % (key, kwargs[key]) for key in sorted(kwargs))
+    parts.append(request.META.get('QUERY_STRING', ''))
+    parts.append(request.META.get('HTTP_ACCEPT', ''))
+    parts.append(request.build_absolute_uri('/'))
+    return KEY_PREFIX + hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+def response_cache_stats():
+    """
+    Get the number of GET requests on the content endpoints served from the response cache, and of those that weren't.
+
+    :return: dict with hits and misses
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_response_cache_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+class ChannelResponseCacheMixin(object):
+    """
+    Viewset mixin serving GET requests on the channel in the URL from the response cache,
+    and caching the successful JSON responses it renders.
+    """
+    channel_kwarg = 'channelmetadata_channel_id'
+
+    def dispatch(self, request, *args, **kwargs):
+        cache = response_cache()
+        channel_id = kwargs.get(self.channel_kwarg)
+        if cache is None or channel_id is None or request.method != 'GET':
+            return super(ChannelResponseCacheMixin, self).dispatch(request, *args, **kwargs)
+        key = response_cache_key(request, channel_id, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            _count('hits')
+            content_type, content = cached
+            return HttpResponse(content, content_type=content_type)
+        _count('misses')
+        response = super(ChannelResponseCacheMixin, self).dispatch(request, *args, **kwargs)
+        renderer = getattr(response, 'accepted_renderer', None)
+        if response.status_code == 200 and renderer is not None and renderer.format == 'json':
+            response.render()
+            if len(response.content) <= getattr(settings, 'CONTENT_RESPONSE_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE):
+                timeout = getattr(settings, 'CONTENT_RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+                cache.set(key, (response['Content-Type'], response.content), timeout)
+        return response
@@ -0,0 +1,374 @@
+"""
+Search across the content databases of several channels.
+
+Every channel database is searched on its own thread from a shared pool, and the results get merged and ranked
+together. The whole search has a time budget (``CONTENT_SEARCH_TIME_BUDGET`` seconds): channels that haven't
+answered by then are left out of the results, and their queries get interrupted so they don't keep the pool busy.
+The size of the pool is set by ``CONTENT_SEARCH_THREADS``, with a value of 1 searching channels one after the other.
+Searches return at most ``CONTENT_SEARCH_MAX_LIMIT`` results, whatever limit they ask for.
+
+Channel databases get an FTS5 full-text index over the titles, descriptions and tags of their content, built when
+the channel gets imported or upgraded (see ``channel_import.upgrade_channel``) and kept in sync by triggers. Channels without it (e.g. when the sqlite
+library lacks FTS5) fall back to substring matching. The full-text index only decides which results of a channel
+come first; results found either way are then scored by the same measure of how well they cover the query (see
+``score``), so the results of several channels can be ranked together.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import threading
+import time
+import uuid
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from kolibri.content.utils.channels import channel_databases
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_THREADS = 4
+
+DEFAULT_SEARCH_TIME_BUDGET = 2.0
+
+DEFAULT_SEARCH_LIMIT = 50
+
+DEFAULT_SEARCH_MAX_LIMIT = 500
+
+# number of sqlite virtual machine instructions between two checks of the time budget
+PROGRESS_HANDLER_INTERVAL = 1000
+
+RESULT_FIELDS = ('content_id', 'title', 'description', 'kind')
+
+FTS_TABLE = 'content_contentmetadata_fts'
+
+# bm25 weights of the title, description and tags columns of the full-text index
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+# the space separated tag names of the content node with the given id
+FTS_TAGS_SQL = (
+    "(SELECT group_concat(t.tag_name, ' ') FROM {content_tags} ct JOIN {tag} t ON t.id = ct.{tag_column} "
+    "WHERE ct.{content_column} = {id})"
+)
+
+FTS_CREATE_SQL = (
+    "CREATE VIRTUAL TABLE {fts} USING fts5(title, description, tags, tokenize='unicode61 remove_diacritics 1')",
+    "INSERT INTO {fts} (rowid, title, description, tags) SELECT c.id, c.title, c.description, {tags_of_c} FROM {content} c",
+    "CREATE TRIGGER {fts}_content_insert AFTER INSERT ON {content} BEGIN "
+    "INSERT INTO {fts} (rowid, title, description, tags) VALUES (new.id, new.title, new.description, NULL); END",
+    "CREATE TRIGGER {fts}_content_update AFTER UPDATE OF title, description ON {content} BEGIN "
+    "UPDATE {fts} SET title = new.title, description = new.description WHERE rowid = new.id; END",
+    "CREATE TRIGGER {fts}_content_delete AFTER DELETE ON {content} BEGIN "
+    "DELETE FROM {fts} WHERE rowid = old.id; END",
+    "CREATE TRIGGER {fts}_tags_insert AFTER INSERT ON {content_tags} BEGIN "
+    "UPDATE {fts} SET tags = {tags_of_new} WHERE rowid = new.{content_column}; END",
+    "CREATE TRIGGER {fts}_tags_delete AFTER DELETE ON {content_tags} BEGIN "
+    "UPDATE {fts} SET tags = {tags_of_old} WHERE rowid = old.{content_column}; END",
+    "CREATE TRIGGER {fts}_tag_update AFTER UPDATE OF tag_name ON {tag} BEGIN "
+    "UPDATE {fts} SET tags = {tags_of_fts} WHERE rowid IN (SELECT {content_column} FROM {content_tags} WHERE {tag_column} = new.id); END",
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# whether each alias has a full-text index, reset whenever a channel database gets (re)validated
+_indexed_aliases = {}
+
+
+def search_pool():
+    """
+    Get the thread pool shared by all searches, creating it on first use.
+
+    :return: ThreadPool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPool(processes=getattr(settings, 'CONTENT_SEARCH_THREADS', DEFAULT_SEARCH_THREADS))
+    return _pool
+
+def score(result, terms):
+    """
+    Rank a result by how many of the search terms appear in its title and in its description or tags, title matches
+    counting double, with a bonus for titles starting with the query. The rank is scaled by the best one the query
+    could get, so it doesn't depend on the channel or on how the result was found.
+
+    :param result: dict, with the tags under 'tags' if they were matched too
+    :param terms: list of str
+    :return: float between 0 and 1
+    """
+    title = (result['title'] or '').lower()
+    description = (result['description'] or '').lower()
+    tags = (result.get('tags') or '').lower()
+    rank = sum(2 * (term in title) + (term in description or term in tags) for term in terms)
+    if title.startswith(' '.join(terms)):
+        rank += 1
+    # every result matches all the terms somewhere, even where only the tokenizer of the full-text index tells
+    # (e.g. without diacritics)
+    rank = max(rank, len(terms))
+    return float(rank) / (3 * len(terms) + 1)
+
+def _when(then, **lookup):
+    return Case(When(then=Value(then), **lookup), default=Value(0), output_field=IntegerField())
+
+def substring_relevance(terms):
+    """
+    Build the expression ranking content found by substring matching like ``score`` does, for the database to order
+    the matches by.
+
+    :param terms: list of str
+    :return: Expression
+    """
+    relevance = _when(1, title__istartswith=' '.join(terms))
+    for term in terms:
+        relevance = relevance + _when(2, title__icontains=term) + _when(1, description__icontains=term)
+    return relevance
+
+def _fts_schema():
+    """
+    Get the names of the tables and columns the full-text index is built from, to format the FTS_*_SQL with.
+    """
+    from kolibri.content.models import ContentMetadata, ContentTag
+    tags = ContentMetadata._meta.get_field('tags')
+    schema = {
+        'fts': FTS_TABLE,
+        'content': ContentMetadata._meta.db_table,
+        'tag': ContentTag._meta.db_table,
+        'content_tags': tags.m2m_db_table(),
+        'content_column': tags.m2m_column_name(),
+        'tag_column': tags.m2m_reverse_name(),
+    }
+    for name, content_id in (('c', 'c.id'), ('new', 'new.{content_column}'), ('old', 'old.{content_column}'), ('fts', '{fts}.rowid')):
+        schema['tags_of_' + name] = FTS_TAGS_SQL.format(id=content_id.format(**schema), **schema)
+    return schema
+
+def has_search_index(alias):
+    """
+    Check if the database behind alias has a full-text index.
+
+    :param alias: str
+    :return: bool
+    """
+    if alias not in _indexed_aliases:
+        cursor = connections[alias].cursor()
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        _indexed_aliases[alias] = bool(cursor.fetchone()[0])
+        cursor.close()
+    return _indexed_aliases[alias]
+
+def forget_search_index(alias=None):
+    """
+    Forget whether alias, or any alias if None is given, has a full-text index, so that it gets checked again.
+
+    :param alias: str
+    """
+    if alias is None:
+        _indexed_aliases.clear()
+    else:
+        _indexed_aliases.pop(alias, None)
+
+def search_index_outdated(sender, alias, **kwargs):
+    """
+    channel_db_validated receiver forgetting whether a channel database has a full-text index, as it may have
+    been replaced.
+    """
+    forget_search_index(alias)
+
+def build_search_index(alias):
+    """
+    Build the full-text index of a channel database, with the triggers keeping it in sync, through its writable
+    connection. Does nothing if the channel database already has one.
+
+    :param alias: str
+    :return: bool, whether the channel database has a full-text index now
+    """
+    forget_search_index(alias)
+    if has_search_index(alias):
+        return True
+    writable = channel_databases.writable_alias(alias)
+    schema = _fts_schema()
+    try:
+        with transaction.atomic(using=writable):
+            cursor = connections[writable].cursor()
+            for sql in FTS_CREATE_SQL:
+                cursor.execute(sql.format(**schema))
+    except DatabaseError as e:
+        logger.warning("Could not build the full-text index of ContentDB '%s': %s", alias, e)
+        return False
+    logger.info("Built the full-text index of ContentDB '%s'", alias)
+    _indexed_aliases[alias] = True
+    return True
+
+def build_missing_search_index(alias):
+    """
+    Build the full-text index of a channel database that doesn't have one yet.
+
+    :param alias: str
+    """
+    build_search_index(alias)
+
+def fts_match_expression(terms):
+    """
+    Build an FTS5 query matching content with all the terms, or words starting with them.
+    Terms are quoted, so characters with a meaning in FTS5 queries are searched for as they are.
+
+    :param terms: list of str
+    :return: str
+    """
+    return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+def search_channel_index(channel_id, terms, kinds=None, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Search the content of a single channel through its full-text index. The best matches by bm25 are returned,
+    scored by ``score`` like the results of substring matching.
+
+    :param channel_id: str
+    :param terms: list of str
+    :param kinds: list of str
+    :param limit: int
+    :return: list of dict
+    """
+    schema = _fts_schema()
+    params = [fts_match_expression(terms)]
+    kind_filter = ''
+    if kinds:
+        kind_filter = ' AND c.kind IN (%s)' % ', '.join(['%s'] * len(kinds))
+        params.extend(kinds)
+    params.append(limit)
+    cursor = connections[channel_id].cursor()
+    try:
+        cursor.execute(
+            'SELECT c.content_id, c.title, c.description, c.kind, {fts}.tags, bm25({fts}, {weights}) AS rank '
+            'FROM {fts} JOIN {content} c ON c.id = {fts}.rowid '
+            'WHERE {fts} MATCH %s{kind_filter} ORDER BY rank LIMIT %s'.format(
+                weights=', '.join(str(weight) for weight in FTS_WEIGHTS), kind_filter=kind_filter, **schema),
+            params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    results = []
+    # bm25 is lower for better matches, and rows come best first
+    for content_id, title, description, kind, tags, rank in rows:
+        result = {
+            'content_id': str(uuid.UUID(content_id)),
+            'title': title,
+            'description': description,
+            'kind': kind,
+            'channel_id': channel_id,
+        }
+        result['score'] = score(dict(result, tags=tags), terms)
+        results.append(result)
+    return results
+
+def search_channel(channel_id, query, kinds=None, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Search the content of a single channel, matching every term of the query against the title or description.
+    Uses the full-text index of the channel if it has one, which also matches tags.
+
+    :param channel_id: str
+    :param query: str
+    :param kinds: list of str
+    :param limit: int
+    :return: list of dict
+    """
+    from kolibri.content.models import ContentMetadata
+    terms = query.lower().split()
+    channel_id = channel_databases.get_alias(channel_id)
+    if has_search_index(channel_id):
+        return search_channel_index(channel_id, terms, kinds=kinds, limit=limit)
+    queryset = ContentMetadata.objects.using(channel_id).all()
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    # rank the matches in the query like score does, so the limit doesn't cut off better matches than it keeps
+    queryset = queryset.annotate(relevance=substring_relevance(terms)).order_by('-relevance', 'title')
+    results = []
+    for result in queryset.values(*RESULT_FIELDS)[:limit]:
+        result['content_id'] = str(result['content_id'])
+        result['channel_id'] = channel_id
+        result['score'] = score(result, terms)
+        results.append(result)
+    return results
+
+def _search_channel_within(channel_id, query, kinds, limit, deadline):
+    """
+    Search a channel, interrupting the query once the deadline has passed.
+    Errors are logged rather than raised, so a broken channel doesn't fail the whole search.
+    """
+    try:
+        connection = connections[channel_databases.get_alias(channel_id)]
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(lambda: time.time() > deadline, PROGRESS_HANDLER_INTERVAL)
+        try:
+            return search_channel(channel_id, query, kinds=kinds, limit=limit)
+        finally:
+            connection.connection.set_progress_handler(None, PROGRESS_HANDLER_INTERVAL)
+    except (KeyError, DatabaseError) as e:
+        logger.warning("Could not search ContentDB '%s': %s", channel_id, e)
+        return None
+
+def _search_channels_in_pool(channel_ids, query, kinds, limit, deadline):
+    """
+    Search the channels on the search pool, waiting for their results until the deadline.
+
+    :return: generator of (channel_id, list of results or None if the channel could not be searched in time)
+    """
+    pool = search_pool()
+    pending = [
+        (channel_id, pool.apply_async(_search_channel_within, (channel_id, query, kinds, limit, deadline)))
+        for channel_id in channel_ids
+    ]
+    for channel_id, pending_result in pending:
+        try:
+            yield channel_id, pending_result.get(timeout=max(0, deadline - time.time()))
+        except TimeoutError:
+            yield channel_id, None
+
+def subscribed_channel_ids():
+    """
+    Get the ids of the channels the device is subscribed to.
+
+    :return: list of str
+    """
+    from kolibri.content.models import ChannelMetadata
+    return [str(channel_id) for channel_id in ChannelMetadata.objects.filter(subscribed=True).values_list('channel_id', flat=True)]
+
+def search(query, channel_ids=None, kinds=None, limit=DEFAULT_SEARCH_LIMIT, time_budget=None):
+    """
+    Search the content of several channels in parallel, and rank the results together.
+
+    :param query: str
+    :param channel_ids: list of str, defaults to all the subscribed channels
+    :param kinds: list of str, only return content of these kinds
+    :param limit: int, maximum number of results, capped by ``CONTENT_SEARCH_MAX_LIMIT``
+    :param time_budget: float, seconds, defaults to ``CONTENT_SEARCH_TIME_BUDGET``
+    :return: dict with the ranked 'results', and the ids of the channels that could not be searched in time
+             under 'incomplete'
+    """
+    if channel_ids is None:
+        channel_ids = subscribed_channel_ids()
+    if time_budget is None:
+        time_budget = getattr(settings, 'CONTENT_SEARCH_TIME_BUDGET', DEFAULT_SEARCH_TIME_BUDGET)
+    deadline = time.time() + time_budget
+    limit = min(limit, getattr(settings, 'CONTENT_SEARCH_MAX_LIMIT', DEFAULT_SEARCH_MAX_LIMIT))
+    results = []
+    incomplete = []
+    if not query.split():
+        return {'results': results, 'incomplete': incomplete}
+
+    if len(channel_ids) <= 1 or getattr(settings, 'CONTENT_SEARCH_THREADS', DEFAULT_SEARCH_THREADS) <= 1:
+        channel_results = ((channel_id, _search_channel_within(channel_id, query, kinds, limit, deadline)) for channel_id in channel_ids)
+    else:
+        channel_results = _search_channels_in_pool(channel_ids, query, kinds, limit, deadline)
+    for channel_id, found in channel_results:
+        if found is None:
+            incomplete.append(channel_id)
+        else:
+            results.extend(found)
+
+    results.sort(key=lambda result: (-result['score'], result['title']))
+    return {'results': results[:limit], 'incomplete': incomplete}
@@ -0,0 +1,156 @@
+"""
+Compact in-memory copy of the topic tree of a channel.
+
+A channel's tree only changes when the channel gets imported again, so the navigation API can answer structural
+questions (children, leaves, descendants of a kind, ancestors) from memory instead of from range queries, when
+``CONTENT_TREE_CACHE`` is set to True. The tree is loaded with a single query, kept as parallel ``array`` columns
+in tree order without any object per node, and loaded again whenever the channel database changes on disk.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+from array import array
+
+from django.conf import settings
+from kolibri.content.utils.channels import channel_databases
+
+TREE = 'tree'
+
+# sort_order of the nodes that don't have one
+NO_SORT_ORDER = float('inf')
+
+
+class ChannelTree(object):
+    """
+    The nodes of a channel's tree, in tree order (tree_id, lft), so the descendants of the node at an index
+    are the nodes right after it.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: iterable of (id, parent_id, lft, rght, kind, sort_order), in tree order
+        """
+        self.ids = array('l')
+        # index of the parent of every node, -1 for roots
+        self.parents = array('l')
+        self.lfts = array('l')
+        self.rghts = array('l')
+        # index of the kind of every node in kind_names
+        self.kinds = array('B')
+        self.sort_orders = array('d')
+        self.kind_names = []
+        self.index = {}
+        kind_codes = {}
+        for pk, parent_id, lft, rght, kind, sort_order in rows:
+            self.index[pk] = len(self.ids)
+            self.ids.append(pk)
+            self.parents.append(self.index[parent_id] if parent_id is not None else -1)
+            self.lfts.append(lft)
+            self.rghts.append(rght)
+            if kind not in kind_codes:
+                kind_codes[kind] = len(self.kind_names)
+                self.kind_names.append(kind)
+            self.kinds.append(kind_codes[kind])
+            self.sort_orders.append(NO_SORT_ORDER if sort_order is None else sort_order)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, pk):
+        return pk in self.index
+
+    def _end(self, i):
+        # index right after the last descendant of the node at index i
+        return i + 1 + (self.rghts[i] - self.lfts[i] - 1) // 2
+
+    def children(self, pk, by_sort_order=False):
+        """
+        Get the ids of the children of a node, in tree order or by sort_order.
+
+        :param pk: int
+        :param by_sort_order: bool
+        :return: list of int
+        """
+        i = self.index[pk]
+        children = []
+        child, end = i + 1, self._end(i)
+        while child < end:
+            children.append(child)
+            child = self._end(child)
+        if by_sort_order:
+            children.sort(key=lambda index: self.sort_orders[index])
+        return [self.ids[index] for index in children]
+
+    def descendants(self, pk, kind=None):
+        """
+        Get the ids of the descendants of a node, optionally only those of a kind, in tree order.
+
+        :param pk: int
+        :param kind: str
+        :return: list of int
+        """
+        i = self.index[pk]
+        if kind is None:
+            return self.ids[i + 1:self._end(i)].tolist()
+        if kind not in self.kind_names:
+            return []
+        code = self.kind_names.index(kind)
+        return [self.ids[j] for j in range(i + 1, self._end(i)) if self.kinds[j] == code]
+
+    def leaves(self, pk):
+        """
+        Get the ids of the descendants of a node that have no children, in tree order.
+
+        :param pk: int
+        :return: list of int
+        """
+        i = self.index[pk]
+        return [self.ids[j] for j in range(i + 1, self._end(i)) if self.rghts[j] == self.lfts[j] + 1]
+
+    def ancestors(self, pk, kind=None):
+        """
+        Get the ids of the ancestors of a node, optionally only those of a kind, from the root down.
+
+        :param pk: int
+        :param kind: str
+        :return: list of int
+        """
+        code = self.kind_names.index(kind) if kind in self.kind_names else -1
+        ancestors = []
+        i = self.parents[self.index[pk]]
+        while i != -1:
+            if kind is None or self.kinds[i] == code:
+                ancestors.append(self.ids[i])
+            i = self.parents[i]
+        return ancestors[::-1]
+
+
+def _load_tree(alias):
+    from kolibri.content.models import ContentMetadata
+    rows = ContentMetadata.objects.db_manager(alias).order_by('tree_id', 'lft')\
+        .values_list('id', 'parent_id', 'lft', 'rght', 'kind', 'sort_order').iterator()
+    return ChannelTree(rows)
+
+def is_enabled():
+    """
+    Check if the navigation API should use the in-memory trees, as set by ``CONTENT_TREE_CACHE``.
+
+    :return: bool
+    """
+    return getattr(settings, 'CONTENT_TREE_CACHE', False)
+
+def channel_tree(alias):
+    """
+    Get the in-memory tree of a channel, loading it if it hasn't been yet or if the channel database changed.
+
+    :param alias: str
+    :return: ChannelTree
+    """
+    return channel_databases.cached(TREE, alias, _load_tree)
+
+def forget_channel_tree(alias=None):
+    """
+    Drop the in-memory tree of a channel, or of every channel if no alias is given.
+
+    :param alias: str
+    """
+    channel_databases.forget_cached(TREE, alias)
@@ -0,0 +1,118 @@
+"""
+Opt-in warm-up of the channel databases at process start.
+
+Set ``CONTENT_DB_WARMUP`` to ``'sync'`` to warm up every channel database found in ``settings.CONTENT_DB_DIR``
+before the app finishes loading, or to ``'background'`` to do it in a daemon thread. Warming up registers and
+validates the channel alias, upgrades channel databases created by older versions (see
+``channel_import.upgrade_channel``), checks the schema, and reads the hot tables once so that their pages are in
+the OS page cache by the time the first learner opens the channel.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from kolibri.content.utils import channel_import
+from kolibri.content.utils.channels import (
+    CONTENT_DB_EXTENSION, channel_databases
+)
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SYNC = 'sync'
+WARMUP_BACKGROUND = 'background'
+
+
+def _hot_tables():
+    # imported here, as this module gets imported by the app config before the models are ready
+    from kolibri.content import models as KolibriContent
+    return (
+        # the tree columns used by every navigation query
+        (KolibriContent.ContentMetadata._meta.db_table, ('id', 'parent_id', 'tree_id', 'lft', 'rght', 'level', 'kind')),
+        (KolibriContent.Format._meta.db_table, ('id', 'contentmetadata_id', 'mimetype_id', 'quality', 'available')),
+        (KolibriContent.File._meta.db_table, ('id', 'format_id', 'available', 'file_size')),
+    )
+
+def discover_channel_aliases():
+    """
+    Get the aliases of all the channel databases in ``settings.CONTENT_DB_DIR``.
+
+    :return: list of str
+    """
+    try:
+        filenames = os.listdir(settings.CONTENT_DB_DIR)
+    except OSError:
+        return []
+    return sorted(name[:-len(CONTENT_DB_EXTENSION)] for name in filenames if name.endswith(CONTENT_DB_EXTENSION))
+
+def warm_up_channel(alias):
+    """
+    Register, validate and upgrade a channel database, check that it has the hot tables and read them once.
+
+    :param alias: str
+    :raises KeyError: if the channel database doesn't exist, is empty or misses one of the hot tables
+    """
+    alias = channel_databases.get_alias(alias)
+    if channel_import.upgrade_channel(alias):
+        # the upgrade may have written to the sqlite file, so validate it again now rather than on the first request
+        channel_databases.get_alias(alias)
+    connection = connections[alias]
+    table_names = set(connection.introspection.table_names())
+    cursor = connection.cursor()
+    try:
+        for table, columns in _hot_tables():
+            if table not in table_names:
+                raise KeyError("ContentDB '%s' has no table '%s'" % (alias, table))
+            # aggregate over every column, which makes sqlite read all the pages without sending rows to python
+            cursor.execute('SELECT COUNT(*), %s FROM %s' % (', '.join('MAX(%s)' % column for column in columns), table))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+def warm_up_channel_databases(aliases=None):
+    """
+    Warm up the given channel databases, or all the ones found in ``settings.CONTENT_DB_DIR``.
+    The connections opened on the way are closed afterwards, the page cache and validated state stay warm.
+
+    :param aliases: list of str
+    :return: dict of alias to the seconds it took to warm it up, for the channels that were warmed up
+    """
+    if aliases is None:
+        aliases = discover_channel_aliases()
+    timings = {}
+    start = time.time()
+    try:
+        for alias in aliases:
+            channel_start = time.time()
+            try:
+                warm_up_channel(alias)
+            except (KeyError, DatabaseError) as e:
+                logger.warning("Skipped warming up ContentDB '%s': %s", alias, e)
+                continue
+            timings[alias] = time.time() - channel_start
+            logger.info("Warmed up ContentDB '%s' in %.3fs", alias, timings[alias])
+    finally:
+        channel_databases.release_all()
+    logger.info('Warmed up %d of %d ContentDBs in %.3fs', len(timings), len(aliases), time.time() - start)
+    return timings
+
+def start_warm_up():
+    """
+    Start warming up the channel databases according to ``settings.CONTENT_DB_WARMUP``.
+
+    :return: the warm-up thread when warming up in the background, None otherwise
+    """
+    mode = getattr(settings, 'CONTENT_DB_WARMUP', None)
+    if mode == WARMUP_SYNC:
+        warm_up_channel_databases()
+    elif mode == WARMUP_BACKGROUND:
+        thread = threading.Thread(target=warm_up_channel_databases, name='content-db-warmup')
+        thread.daemon = True
+        thread.start()
+        return thread
+    elif mode:
+        logger.warning("Unknown CONTENT_DB_WARMUP mode '%s', expected '%s' or '%s'", mode, WARMUP_SYNC, WARMUP_BACKGROUND)
@@ -44,7 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'kolibri.auth.apps.KolibriAuthConfig',
-    'kolibri.content',
+    'kolibri.content.apps.KolibriContentConfig',
     'kolibri.core.webpack',
     'rest_framework',
     'django_js_reverse',
@@ -59,6 +59,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'kolibri.content.middleware.ContentIdentityMapMiddleware',
 )
 
 ROOT_URLCONF = 'kolibri.deployment.default.urls'